@@ -174,7 +174,7 @@ def gen_isempty(gen):
 
 
 def retrieve_new_files(logger):
-	from summit_core import connect_to_db, list_files_recur, split_into_sets_of_n
+	from summit_core import connect_to_db, list_files_recur, split_into_sets_of_n, AttrIndex
 
 	logger.info('Running retrieve_new_files()')
 
@@ -228,10 +228,11 @@ def retrieve_new_files(logger):
 		files_to_retrieve = []
 		remote_files = session.query(RemoteFile).order_by(RemoteFile.relpath).all()
 		local_files = session.query(LocalFile).order_by(LocalFile.relpath).all()
+		local_by_relpath = AttrIndex(local_files, 'relpath')
 
 		for remote_file in remote_files:
 			if remote_file.local is None:
-				local_match = search_for_attr_value(local_files, 'relpath', remote_file.relpath)
+				local_match = local_by_relpath.get(remote_file.relpath)
 				if local_match:
 					remote_file.local = local_match
 					if remote_file.st_mtime > local_match.st_mtime:
@@ -279,4 +280,3 @@ def retrieve_new_files(logger):
 		session.commit()
 
 		session.close()
-		engine.dispose()
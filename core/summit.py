@@ -10,10 +10,12 @@ the original directory name, the will find the correct directories and add them
 
 Log and data files are sync to several folders in the FTP directory, and move_log_files() moves these to Summit/data/...
 
-move_log_files() runs asynchronously, every five minutes, and is scheduled prior to main(), so it works independently.
-It checks for and transfers any new files before sleeping for another five minutes.
+move_log_files() runs asynchronously, and is scheduled prior to main(), so it works independently. It watches the sync
+folders and moves new or updated files within seconds if watchdog is installed, and scans them every ten minutes if not.
 
-All other processors run sequentially (as defined in main()), every 10 minutes.
+All other processors are scheduled as a dependency graph (see processor_graph below and summit_scheduler.py), every 20
+minutes. Processors that don't depend on each other run at the same time in a pool of worker processes, and processors
+like the dual methane plot or plot uploading wait on the processors they depend on.
 
 Sleeps are blocked into 30s periods to permit keyboard interrupts and easy restarts of the whole processing sequence.
 """
@@ -25,49 +27,67 @@ from summit_core import processor_dirs
 for d in processor_dirs:
     sys.path.append(str(d))
 
-from voc_main_loop import main as voc_processor
-from methane_main_loop import main as methane_processor
-from methane_main_loop import dual_plot_methane
-from picarro_main_loop import main as picarro_processor
 from error_main_loop import check_for_new_data, check_existing_errors
-from summit_daily import check_load_dailies as daily_processor
-from summit_daily import plot_dailies
-from summit_core import check_send_plots, move_log_files
+from summit_core import move_log_files, warm_engines, dispose_engines
 from summit_errors import send_processor_email
+from summit_scheduler import ProcessorNode, ProcessorScheduler, always_run
 import asyncio
 
+"""
+Set stream_picarro to follow the file the Picarro is writing to in the sync directory and commit its data within seconds,
+instead of waiting for the file to be moved and loaded by the processing cycle (see picarro_main_loop.stream_new_data()).
+Whole files are still loaded by the cycle either way.
+"""
+stream_picarro = False
 
-async def main(logger):
-    errors = []  # initiate with no errors
+"""
+Processors that are given a logger_name will log to /methane/processor_logs/{logger_name}.log (or to the processor_logs
+folder of their log_dir, if one is given), others will log to their individual directories/files.
+"""
+processor_graph = [
+    ProcessorNode('dailies', 'summit_daily', 'check_load_dailies', logger_name='summit_dailies'),
+    ProcessorNode('daily_plots', 'summit_daily', 'plot_dailies', depends_on=['dailies'],
+                  logger_name='summit_dailies'),
+    ProcessorNode('voc', 'voc_main_loop', 'main'),
+    # 3/14/2020 - Commented out GC Methane Processor because of requested change - Jashan
+    # ProcessorNode('methane', 'methane_main_loop', 'main'),
+    ProcessorNode('picarro', 'picarro_main_loop', 'main'),
+    ProcessorNode('dual_plot', 'methane_main_loop', 'dual_plot_methane', depends_on=['picarro'],
+                  logger_name='summit_plots'),  # add 'methane' to depends_on if the GC processor is re-enabled
+    ProcessorNode('send_plots', 'summit_core', 'check_send_plots',
+                  depends_on=['daily_plots', 'voc', 'picarro', 'dual_plot'],
+                  logger_name='summit_plots'),
+    ProcessorNode('optimize_databases', 'summit_core', 'optimize_databases', depends_on=['send_plots'],
+                  run_if=always_run, logger_name='summit_maintenance')  # after all writers have finished
+]
 
-    while True:
-        """
-        Processors that are passed a logger will log to /core, others will log to their individual directories/files.
-        """
 
-        dailies = await asyncio.create_task(daily_processor(logger))
-        if dailies:
-            daily_plots = await asyncio.create_task(plot_dailies(logger))
+async def main(logger):
+    errors = []  # initiate with no errors
 
-        vocs = await asyncio.create_task(voc_processor())
-        # 3/14/2020 - Commented out GC Methane Processor because of requested change - Jashan
-        # methane = await asyncio.create_task(methane_processor())
-        picarro = await asyncio.create_task(picarro_processor())
+    scheduler = ProcessorScheduler(processor_graph)
 
-        if methane or picarro:
-            await asyncio.create_task(dual_plot_methane(logger))
+    try:
+        warm_engines()
+    except Exception as e:
+        logger.warning(f'Exception {e.args} occurred while creating database engines; they will be created on use.')
 
-        if vocs or methane or picarro:
-            await asyncio.create_task(check_send_plots(logger))
+    try:
+        while True:
+            results = await scheduler.run_cycle(logger)
+            logger.info(f'Processing cycle finished with results: {results}')
 
-        errors = await asyncio.create_task(check_for_new_data(logger, active_errors=errors))
+            errors = await asyncio.create_task(check_for_new_data(logger, active_errors=errors))
 
-        if errors:
-            errors = await asyncio.create_task(check_existing_errors(logger, active_errors=errors))
+            if errors:
+                errors = await asyncio.create_task(check_existing_errors(logger, active_errors=errors))
 
-        print('Sleeping...')
-        for i in range(40):
-            await asyncio.sleep(30)
+            print('Sleeping...')
+            for i in range(40):
+                await asyncio.sleep(30)
+    finally:
+        scheduler.shutdown()
+        dispose_engines()
 
 
 if __name__ == '__main__':
@@ -85,6 +105,12 @@ if __name__ == '__main__':
 
     loop = asyncio.get_event_loop()
     loop.create_task(move_log_files(logger))
+
+    if stream_picarro:
+        from summit_core import picarro_dir
+        from picarro_main_loop import stream_new_data
+        loop.create_task(stream_new_data(configure_logger(picarro_dir, 'picarro_stream')))
+
     loop.create_task(main(logger))
 
     loop.run_forever()
@@ -1,9 +1,18 @@
 import os
+import sys
 import json
+import bisect
 import asyncio
+import functools
+import threading
 from pathlib import Path
 import datetime as dt
 from datetime import datetime
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import matplotlib
+matplotlib.use('Agg')  # plots are only saved to file, and are created in worker threads where GUI backends fail
 
 from sqlalchemy.types import TypeDecorator, VARCHAR
 from sqlalchemy.ext.mutable import MutableDict, MutableList
@@ -15,9 +24,22 @@ Base = declarative_base()
 PROC = 'Core'
 
 
+def extend_sys_path(paths):
+    """
+    Add paths to the system path if they're not already on it. Used as the initializer for worker processes, so they
+    can import modules from each processor's directory.
+    :param paths: list, of str paths to add to sys.path
+    :return: None
+    """
+    for path in paths:
+        if path not in sys.path:
+            sys.path.append(path)
+
+
 def find_project_dir(runpath):
     """
-    Scans up directories until it finds the project folder.
+    Scans up directories until it finds the project folder. If it's called from outside one (ie, from a checkout that
+    isn't named Summit), the project that contains this file is used instead.
     :param runpath: pathlib.Path, where summit_core is called from.
     :return: pathlib.Path, the base project directory
     """
@@ -25,6 +47,8 @@ def find_project_dir(runpath):
 
     if runpath.name == "Summit" or runpath.name == 'summit_master':
         return runpath
+    elif runpath.parent == runpath:
+        return Path(__file__).resolve().parents[1]  # reached the filesystem root without finding one
     else:
         runpath = runpath / '..'
         return find_project_dir(runpath)
@@ -41,6 +65,12 @@ taylor_basepath = '/data/web/htdocs/instaar/groups/arl/res_parameters/summit_plo
 
 processor_dirs = [voc_dir, picarro_dir, methane_dir, error_dir, core_dir]
 
+project_databases = [('sqlite:///summit_core.sqlite', core_dir),
+                     ('sqlite:///summit_daily.sqlite', core_dir),
+                     ('sqlite:///summit_picarro.sqlite', picarro_dir),
+                     ('sqlite:///summit_voc.sqlite', voc_dir),
+                     ('sqlite:///summit_methane.sqlite', methane_dir)]
+
 data_file_paths = json.loads((core_dir / 'file_locations.json').read_text())
 
 for k, v in data_file_paths.items():
@@ -78,6 +108,8 @@ class Config(Base):
     pa_startline = Column(Integer)
     last_data_date = Column(DateTime)
     days_to_plot = Column(Integer)
+    read_offset = Column(Integer)  # byte offset a log is read up to, for processors that read it with read_file_tail()
+    signature = Column(String)  # signature of the log returned with read_offset
 
     def __init__(self, processor=None, filesize=0, pa_startline=0, last_data_date=datetime(1900, 1, 1), days_to_plot=7):
         self.processor = processor
@@ -87,20 +119,33 @@ class Config(Base):
         self.days_to_plot = days_to_plot
 
 
+_dir_lock = threading.RLock()  # the working directory is process-wide, so only one thread can be in a TempDir at once
+
+
 class TempDir:
     """
-    Context manager for working in a directory.
+    Context manager for working in a directory. The working directory is shared by every thread in the process, so
+    entering a TempDir holds a process-wide lock until it exits; TempDirs can still be nested in the same thread.
     """
 
     def __init__(self, path):
-        self.old_dir = os.getcwd()
+        self.old_dir = None
         self.new_dir = path
 
     def __enter__(self):
-        os.chdir(self.new_dir)
+        _dir_lock.acquire()
+        try:
+            self.old_dir = os.getcwd()
+            os.chdir(self.new_dir)
+        except Exception:
+            _dir_lock.release()
+            raise
 
     def __exit__(self, *args):
-        os.chdir(self.old_dir)
+        try:
+            os.chdir(self.old_dir)
+        finally:
+            _dir_lock.release()
 
 
 class JDict(TypeDecorator):
@@ -170,6 +215,27 @@ class Plot(Base):
         return self._name
 
 
+class UploadedFile(Base):
+    """
+    UploadedFiles are the ledger of what's been sent to the website. Each records the hash of the last bytes uploaded
+    to a remote file, so check_send_plots() can skip re-uploading a staged plot that hasn't changed since.
+    """
+    __tablename__ = 'uploads'
+
+    id = Column(Integer, primary_key=True)
+
+    remote = Column(String, unique=True)  # full remote path of the uploaded file
+    hash = Column(String)  # sha1 of the file when it was uploaded
+    size = Column(Integer)
+    date = Column(DateTime)  # when it was last uploaded
+
+    def __init__(self, remote, hash, size, date):
+        self.remote = remote
+        self.hash = hash
+        self.size = size
+        self.date = date
+
+
 MutableList.associate_with(JList)
 MutableDict.associate_with(JDict)
 
@@ -186,7 +252,12 @@ def configure_logger(rundir, name):
     import logging
 
     logfile = Path(rundir) / f'processor_logs/{name}.log'
+    logfile.parent.mkdir(exist_ok=True)  # processor_logs isn't tracked, so a fresh checkout doesn't have it
+
     logger = logging.getLogger(name)
+    if logger.handlers:
+        return logger  # already configured; creating another FileHandler would open the log again and leak it
+
     logger.setLevel(logging.DEBUG)
     fh = logging.FileHandler(logfile)
     fh.setLevel(logging.DEBUG)
@@ -197,35 +268,488 @@ def configure_logger(rundir, name):
     formatter = logging.Formatter('%(asctime)s -%(levelname)s- %(message)s')
 
     [H.setFormatter(formatter) for H in [ch, fh]]
-    if not len(logger.handlers):
-        _ = [logger.addHandler(H) for H in [ch, fh]]
+    _ = [logger.addHandler(H) for H in [ch, fh]]
 
     return logger
 
 
+blocking_workers = 4  # max number of blocking processor bodies running in threads at once, per process
+_blocking_executor = None
+
+
+def get_blocking_executor():
+    """
+    Returns the process-wide, bounded thread pool that blocking work is offloaded to, creating it on first use.
+    :return: concurrent.futures.ThreadPoolExecutor
+    """
+    global _blocking_executor
+
+    if _blocking_executor is None:
+        _blocking_executor = ThreadPoolExecutor(max_workers=blocking_workers, thread_name_prefix='summit-blocking')
+
+    return _blocking_executor
+
+
+async def run_blocking(func, *args, timeout=None, **kwargs):
+    """
+    Run a blocking function in the bounded thread pool without blocking the event loop.
+
+    A timeout (or cancellation of the awaiting task) stops waiting on the result, but a thread that's already running
+    can't be killed; it will finish in the background and its result is discarded.
+
+    :param func: callable, blocking function to run
+    :param args: positional arguments for func
+    :param timeout: float, seconds to wait before raising asyncio.TimeoutError, or None to wait indefinitely
+    :param kwargs: keyword arguments for func
+    :return: the return value of func
+    """
+    loop = asyncio.get_event_loop()
+    future = loop.run_in_executor(get_blocking_executor(), functools.partial(func, *args, **kwargs))
+    return await asyncio.wait_for(future, timeout)
+
+
+def offload(timeout=None):
+    """
+    Decorator for the async processor functions whose bodies do blocking pandas, SQLAlchemy and paramiko work.
+    The decorated coroutine is run to completion on its own event loop in the bounded thread pool, so the calling
+    event loop is free to run other tasks (ie, move_log_files) while it works.
+
+    If the timeout expires, the error is logged and False is returned, as processor functions do for any failure. The
+    abandoned thread can't be stopped, so each decorated function holds a lock until its thread actually finishes;
+    calls made while a previous run is still alive are logged and skipped (returning False), so two runs of the same
+    stage never write to its database at once.
+
+    :param timeout: float, seconds to wait for the function, or None to wait indefinitely
+    :return: decorator
+    """
+
+    def decorator(func):
+        running = threading.Lock()  # held from submission until the worker thread finishes, even if abandoned
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            import logging
+
+            def run():
+                return asyncio.run(func(*args, **kwargs))  # create the coroutine in the worker thread that runs it
+
+            if not running.acquire(blocking=False):
+                logging.getLogger(func.__module__).warning(f'The previous run of {func.__name__}() is still running, '
+                                                           + 'so this run was skipped.')
+                return False
+
+            # released when run() finishes, or when it's cancelled before it starts
+            future = get_blocking_executor().submit(run)
+            future.add_done_callback(lambda f: running.release())
+
+            try:
+                return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+            except asyncio.TimeoutError:
+                logging.getLogger(func.__module__).error(f'{func.__name__}() timed out after {timeout}s and was '
+                                                         + 'abandoned.')
+                return False
+
+        return wrapper
+
+    return decorator
+
+
+engine_pool_size = 5  # pooled connections kept open per database, per process
+_engines = {}  # {database key: (engine, sessionmaker)}, see get_engine()
+_engines_pid = None  # pid the registry was built in; forked workers must not share their parent's connections
+_engines_lock = threading.Lock()
+_created_tables = set()  # (database key, metadata, number of tables) that have already had create_all() run
+# metadata is held (not its id()), so a collected MetaData's id can't be reused by another and skip create_all()
+
+"""
+PRAGMAs applied to every new SQLite connection, in order. WAL lets the plotting and error-checking readers run while
+another processor is writing, and synchronous=NORMAL is safe in WAL mode while making commits much cheaper. Set a value
+to None to leave SQLite's default.
+"""
+sqlite_pragmas = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 30000,  # ms to wait for another writer's lock before raising 'database is locked'
+    'cache_size': -64000,  # negative values are in KiB, so ~64MB of page cache per connection
+    'mmap_size': 256 * 1024 ** 2,  # bytes of the database file to memory-map for reads
+    'temp_store': 'MEMORY',
+}
+
+
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    """
+    SQLAlchemy 'connect' event listener that applies sqlite_pragmas to each new DBAPI connection.
+
+    :param dbapi_connection: sqlite3.Connection, the new connection
+    :param connection_record: sqlalchemy connection record, unused
+    :return: None
+    """
+    cursor = dbapi_connection.cursor()
+    for pragma, value in sqlite_pragmas.items():
+        if value is not None:
+            cursor.execute(f'PRAGMA {pragma} = {value}')
+    cursor.close()
+
+
+def get_database_key(engine_str, directory):
+    """
+    Resolve a connection string and directory to the key for the engine registry. File-based SQLite databases are
+    keyed by the absolute path of the database so that the same file is only ever given one engine.
+
+    :param engine_str: str, connection string for the database, ie 'sqlite:///summit_picarro.sqlite'
+    :param directory: pathlib.Path or str, directory the database is in (relative SQLite paths are resolved from here)
+    :return: str, the absolute connection string
+    """
+    prefix = 'sqlite:///'
+
+    if engine_str.startswith(prefix) and engine_str != prefix and ':memory:' not in engine_str:
+        db_path = Path(engine_str[len(prefix):])
+        if not db_path.is_absolute():
+            db_path = Path(directory).resolve() / db_path
+        return prefix + str(db_path)
+
+    return engine_str
+
+
+def get_engine(engine_str, directory):
+    """
+    Get the engine and session factory for a database from the process-wide registry, creating them on first
+    use. Engines are created once per process and keep a pool of open connections, so stages don't pay for engine
+    creation and connection setup every time they run.
+
+    :param engine_str: str, connection string for the database
+    :param directory: pathlib.Path or str, directory the database is in
+    :return: (engine, sessionmaker), calling the sessionmaker gives a new session that the caller should close
+    """
+    global _engines_pid
+
+    from sqlalchemy import create_engine, event
+    from sqlalchemy.orm import sessionmaker
+    from sqlalchemy.pool import QueuePool
+
+    key = get_database_key(engine_str, directory)
+
+    with _engines_lock:
+        if _engines_pid != os.getpid():
+            # the registry was inherited by a forked process; drop it without disposing, since disposing would close
+            # connections still in use by the parent
+            _engines.clear()
+            _created_tables.clear()
+            _engines_pid = os.getpid()
+
+        entry = _engines.get(key)
+
+        if entry is None:
+            if key.startswith('sqlite'):
+                # connections are checked in and out by the threads running stages, so SQLite's same-thread check is
+                # disabled; sessions are never shared between threads
+                engine = create_engine(key, poolclass=QueuePool, pool_size=engine_pool_size, max_overflow=10,
+                                       connect_args={'check_same_thread': False})
+                event.listen(engine, 'connect', set_sqlite_pragmas)
+            else:
+                engine = create_engine(key)
+
+            entry = (engine, sessionmaker(bind=engine))
+            _engines[key] = entry
+
+    return entry
+
+
+def create_tables(engine, base):
+    """
+    Run base.metadata.create_all() against an engine, but only the first time it's called for that engine and set of
+    tables in this process.
+
+    :param engine: sqlalchemy engine
+    :param base: declarative base whose tables should exist
+    :return: None
+    """
+    key = (str(engine.url), base.metadata, len(base.metadata.tables))
+
+    if key not in _created_tables:
+        base.metadata.create_all(engine)
+        migrate_database(engine)
+        _created_tables.add(key)
+
+
+"""
+Versioned schema migrations for each database, keyed by database filename. Each migration is a tuple of
+(version, description, [statements]), and is applied to any database whose PRAGMA user_version is lower than its
+version, in order. New databases are created by create_all() and then migrated like any other, so statements must be
+safe to re-run against a schema that already has them (ie, CREATE INDEX IF NOT EXISTS). ALTER TABLE ... ADD COLUMN is
+allowed, and is skipped if the column already exists.
+"""
+database_migrations = {
+    'summit_core.sqlite': [
+        (1, 'Index moved files by location and type', [
+            'CREATE INDEX IF NOT EXISTS ix_files_location_type ON files (location, type)',
+        ]),
+        (2, 'Track a hash of the content of each moved file for incremental copies', [
+            'ALTER TABLE files ADD COLUMN hash VARCHAR',
+        ]),
+        (3, 'Track the byte offset and signature processors have read logs up to', [
+            'ALTER TABLE config ADD COLUMN read_offset INTEGER',
+            'ALTER TABLE config ADD COLUMN signature VARCHAR',
+        ]),
+    ],
+    'summit_picarro.sqlite': [
+        (1, 'Index data and file columns used for plotting, calibration and loading', [
+            'CREATE INDEX IF NOT EXISTS ix_data_date ON data (date)',
+            'CREATE INDEX IF NOT EXISTS ix_data_mpv_position_date ON data (mpv_position, date)',
+            'CREATE INDEX IF NOT EXISTS ix_data_cal_id_mpv_position ON data (cal_id, mpv_position)',
+            'CREATE INDEX IF NOT EXISTS ix_data_ambient '
+            + 'ON data (mpv_position, instrument_status, alarm_status, date)',
+            'CREATE INDEX IF NOT EXISTS ix_files_name ON files (_name)',
+            'CREATE INDEX IF NOT EXISTS ix_files_processed ON files (processed)',
+            'CREATE INDEX IF NOT EXISTS ix_cals_mastercal_id_standard_used ON cals (mastercal_id, standard_used)',
+        ]),
+        (2, 'Track the byte offset and signature of each data file for incremental reads', [
+            'ALTER TABLE files ADD COLUMN read_offset INTEGER',
+            'ALTER TABLE files ADD COLUMN signature VARCHAR',
+        ]),
+        (3, 'Make data dates unique so data can be bulk-inserted with INSERT OR IGNORE', [
+            'DELETE FROM data WHERE id NOT IN (SELECT MIN(id) FROM data GROUP BY date)',
+            'CREATE UNIQUE INDEX IF NOT EXISTS ux_data_date ON data (date)',
+            'DROP INDEX IF EXISTS ix_data_date',
+        ]),
+        (4, 'Add calibrated data columns, and date and applied flags to MasterCals', [
+            'ALTER TABLE data ADD COLUMN co_corrected FLOAT',
+            'ALTER TABLE data ADD COLUMN co2_corrected FLOAT',
+            'ALTER TABLE data ADD COLUMN ch4_corrected FLOAT',
+            'ALTER TABLE mastercals ADD COLUMN date DATETIME',
+            'ALTER TABLE mastercals ADD COLUMN applied BOOLEAN',
+            "UPDATE mastercals SET date = (SELECT date FROM cals WHERE cals.mastercal_id = mastercals.id "
+            + "AND cals.standard_used = 'low_std') WHERE date IS NULL",
+        ]),
+        (5, 'Index rollups by subset, resolution and date', [
+            'CREATE UNIQUE INDEX IF NOT EXISTS ux_rollups_subset_resolution_date ON rollups (subset, resolution, date)',
+        ]),
+        (6, 'Index ambient data that has never been corrected, so it can be found whatever its date', [
+            'CREATE INDEX IF NOT EXISTS ix_data_uncorrected ON data (date) WHERE mpv_position IN (0, 1) '
+            + 'AND co_corrected IS NULL AND co2_corrected IS NULL AND ch4_corrected IS NULL',
+        ]),
+    ],
+    'summit_voc.sqlite': [
+        (1, 'Index peaks, runs, logs and lines on their lookup columns', [
+            'CREATE INDEX IF NOT EXISTS ix_peaks_name_run_id ON peaks (name, run_id)',
+            'CREATE INDEX IF NOT EXISTS ix_peaks_run_id ON peaks (run_id)',
+            'CREATE INDEX IF NOT EXISTS ix_peaks_line_id ON peaks (line_id)',
+            'CREATE INDEX IF NOT EXISTS ix_gcruns_date ON gcruns (date)',
+            'CREATE INDEX IF NOT EXISTS ix_logfiles_filename ON logfiles (filename)',
+            'CREATE INDEX IF NOT EXISTS ix_logfiles_status ON logfiles (status)',
+            'CREATE INDEX IF NOT EXISTS ix_nmhclines_status ON nmhclines (status)',
+            'CREATE INDEX IF NOT EXISTS ix_nmhclines_correction_id ON nmhclines (correction_id)',
+            'CREATE INDEX IF NOT EXISTS ix_data_run_id ON data (run_id)',
+            'CREATE INDEX IF NOT EXISTS ix_data_line_id ON data (line_id)',
+        ]),
+    ],
+    'summit_methane.sqlite': [
+        (1, 'Index samples, peaks and runs on their matching columns', [
+            'CREATE INDEX IF NOT EXISTS ix_samples_peak_id_run_id ON samples (peak_id, run_id)',
+            'CREATE INDEX IF NOT EXISTS ix_samples_run_id ON samples (run_id)',
+            'CREATE INDEX IF NOT EXISTS ix_peaks_pa_line_id ON peaks (pa_line_id)',
+            'CREATE INDEX IF NOT EXISTS ix_runs_pa_line_id ON runs (pa_line_id)',
+            'CREATE INDEX IF NOT EXISTS ix_runs_median ON runs (median)',
+        ]),
+    ],
+    'summit_daily.sqlite': [
+        (1, 'Index dailies by date', [
+            'CREATE INDEX IF NOT EXISTS ix_dailies_date ON dailies (date)',
+        ]),
+    ],
+}
+
+
+# Production queries that filter or sort the processors' tables are built by the *_query and *_statement functions in
+# each module, and called wherever they're run, so tests/query_plan_test.py can check the plans of the queries the
+# processors actually make. New filtered queries should be built the same way, and added to that test.
+
+
+def config_query(session, processor):
+    """
+    :param session: Sqlalchemy session() for the core database
+    :param processor: str, name of the processor the Config is for
+    :return: Query, for the processor's Config
+    """
+    return session.query(Config).filter(Config.processor == processor)
+
+
+def staged_plots_query(session):
+    """
+    :param session: Sqlalchemy session() for the core database
+    :return: Query, for Plots that are staged to be uploaded
+    """
+    return session.query(Plot).filter(Plot.staged == True)
+
+
+def uploaded_files_query(session, remotes):
+    """
+    :param session: Sqlalchemy session() for the core database
+    :param remotes: iterable, of str remote paths
+    :return: Query, for the UploadedFiles at those remote paths
+    """
+    return session.query(UploadedFile).filter(UploadedFile.remote.in_(remotes))
+
+
+
+def get_schema_version(con):
+    """
+    Get the schema version of a SQLite database, as stored in PRAGMA user_version.
+
+    :param con: sqlalchemy connection
+    :return: int, 0 for databases that have never been migrated
+    """
+    return con.execute('PRAGMA user_version').scalar()
+
+
+def migrate_database(engine, migrations=None):
+    """
+    Apply any pending migrations to a database, in place. Migrations are only applied once all the tables they
+    reference exist, so a database that's missing tables (ie, before its processor has run create_all()) is left at
+    its current version and migrated on a later call.
+
+    :param engine: sqlalchemy engine
+    :param migrations: list, of (version, description, [statements]); defaults to database_migrations for the database
+    :return: int, the schema version of the database after migrating
+    """
+    import re
+    import logging
+    from sqlalchemy.exc import OperationalError
+
+    if not str(engine.url).startswith('sqlite') or not engine.url.database:
+        return 0
+
+    if migrations is None:
+        migrations = database_migrations.get(Path(engine.url.database).name, [])
+
+    logger = logging.getLogger(__name__)
+
+    with engine.connect() as con:
+        version = get_schema_version(con)
+
+        for migration_version, description, statements in sorted(migrations, key=lambda m: m[0]):
+            if migration_version <= version:
+                continue
+
+            tables = {t[0] for t in con.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+            needed = {table for statement in statements
+                      for table in re.findall(r'(?: ON|ALTER TABLE) (\w+)', statement)}
+
+            if not needed <= tables:
+                break  # tables are created by another base or processor; try again next time
+
+            try:
+                for statement in statements:
+                    try:
+                        con.execute(statement)
+                    except OperationalError as e:
+                        if 'duplicate column name' not in str(e):
+                            raise  # added columns will already exist in databases created after the model changed
+                con.execute(f'PRAGMA user_version = {int(migration_version)}')
+            except OperationalError as e:
+                logger.error(f'Migration {migration_version} ({description}) of {engine.url.database} '
+                             + f'failed with {e.args}')
+                break
+
+            version = migration_version
+            logger.info(f'Database {engine.url.database} migrated to version {version}: {description}')
+
+    return version
+
+
+def warm_engines(databases=None, bases=None):
+    """
+    Create the engines for all of the project's databases ahead of time, open one pooled connection to each, and apply
+    any pending migrations. Called once by summit.py at startup, before the processors' worker processes are started.
+
+    :param databases: list, of (engine_str, directory) tuples; defaults to project_databases
+    :param bases: list, of declarative bases to create tables for in each database
+    :return: None
+    """
+    databases = project_databases if databases is None else databases
+
+    for engine_str, directory in databases:
+        engine, _ = get_engine(engine_str, directory)
+
+        migrate_database(engine)  # also opens a connection, which is left in the pool
+
+        for base in (bases if bases else []):
+            create_tables(engine, base)
+
+
+def dispose_engines():
+    """
+    Close all pooled connections and empty the engine registry, ie before shutting down.
+    :return: None
+    """
+    with _engines_lock:
+        if _engines_pid == os.getpid():
+            for engine, _ in _engines.values():
+                engine.dispose()
+
+        _engines.clear()
+        _created_tables.clear()
+
+
+@offload(timeout=30 * 60)
+async def optimize_databases(logger, databases=None, full=False):
+    """
+    Maintenance for the project's SQLite databases. Runs PRAGMA optimize, which re-runs ANALYZE on any table whose
+    statistics are out of date so the query planner keeps using the right indexes, then checkpoints and truncates the
+    write-ahead log so it doesn't grow unbounded between quiet periods.
+
+    :param logger: logging logger to log to
+    :param databases: list, of (engine_str, directory) tuples; defaults to project_databases
+    :param full: boolean, run a full ANALYZE of every table instead of PRAGMA optimize
+    :return: boolean, True if all databases were maintained without error
+    """
+    try:
+        from summit_errors import send_processor_email
+    except ImportError:
+        logger.error('ImportError occurred in optimize_databases()')
+        return False
+
+    databases = project_databases if databases is None else databases
+    success = True
+
+    for engine_str, directory in databases:
+        try:
+            engine, _ = get_engine(engine_str, directory)
+
+            if not str(engine.url).startswith('sqlite'):
+                continue
+
+            with engine.connect() as con:
+                con.execute('ANALYZE' if full else 'PRAGMA optimize')
+                con.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+
+            logger.info(f'Database {engine.url.database} was optimized.')
+        except Exception as e:
+            logger.error(f'Exception {e.args} occurred while optimizing {engine_str} in optimize_databases()')
+            send_processor_email('Core', exception=e)
+            success = False
+
+    return success
+
+
 def connect_to_db(engine_str, directory):
     """
     Takes string name of the database to create/connect to, and the directory it should be in.
 
+    The engine comes from the process-wide registry (see get_engine()), so it is shared and should not be disposed of
+    by the caller; the session is new, and should be closed when finished with.
+
     :param engine_str: connection string for the database
     :param directory: directory the database should in (created?) in
-    :return: engine, session, Base
+    :return: engine, session
 
     Example:
-    engine, session, Base = connect_to_db('sqlite:///reservoir.sqlite', dir)
+    engine, session = connect_to_db('sqlite:///reservoir.sqlite', dir)
     """
+    engine, Session = get_engine(engine_str, directory)
 
-    from sqlalchemy import create_engine
-    from sqlalchemy.orm import sessionmaker
-
-    # Base = declarative_base()  # needed to subclass for sqlalchemy objects
-
-    with TempDir(directory):
-        engine = create_engine(engine_str)
-    sessy = sessionmaker(bind=engine)
-    sess = sessy()
-
-    return engine, sess
+    # a new session per call, since stages close their sessions and can hold sessions to more than one database
+    return engine, Session()
 
 
 def check_path_date(filepath):
@@ -240,6 +764,301 @@ def check_path_date(filepath):
         return dt.datetime.fromtimestamp(epochseconds)
 
 
+signature_bytes = 4096  # bytes at the start of a file that are hashed to detect if it's been rewritten
+
+
+def get_file_signature(filepath, offset):
+    """
+    Hash the beginning of a file, up to signature_bytes or offset (whichever is smaller). Comparing a stored signature
+    to a new one for the same offset shows whether the part of the file already read has been rewritten.
+
+    :param filepath: pathlib.Path, file to hash
+    :param offset: int, number of bytes of the file that have been read
+    :return: str, hex digest
+    """
+    import hashlib
+
+    with open(filepath, 'rb') as f:
+        return hashlib.sha1(f.read(min(offset, signature_bytes))).hexdigest()
+
+
+def read_file_tail(filepath, offset=None, signature=None, header_lines=1):
+    """
+    Read only the complete lines appended to a text file since it was last read. Reading starts at the byte offset
+    where the last read stopped, and stops after the last newline, so a partially-written final line is left to be read
+    next time. If the file is now shorter than the offset, or the start of it no longer matches the signature, it's
+    been rewritten and is read again from the start.
+
+    :param filepath: pathlib.Path, file to read
+    :param offset: int, byte offset returned by the last read, or None to read the whole file
+    :param signature: str, signature returned by the last read
+    :param header_lines: int, number of lines at the start of the file that are returned separately as the header
+    :return: (header, data, offset, signature, rewritten)
+        header: bytes, the header lines, always read from the start of the file
+        data: bytes, new complete lines (not including the header), possibly empty
+        offset: int, byte offset to resume reading from next time
+        signature: str, signature to pass in with offset next time
+        rewritten: boolean, True if the file had been read before but had to be read again from the start
+    """
+    rewritten = False
+
+    with open(filepath, 'rb') as f:
+        header = b''.join(f.readline() for _ in range(header_lines))
+
+        if header_lines and not header.endswith(b'\n'):
+            return b'', b'', offset if offset else 0, signature, False  # header isn't fully written yet
+
+        if offset is not None and offset > 0:
+            size = f.seek(0, os.SEEK_END)
+            if offset > size or (signature and get_file_signature(filepath, offset) != signature):
+                offset = None
+                rewritten = True
+
+        if not offset or offset < len(header):
+            offset = len(header)
+
+        f.seek(offset)
+        chunk = f.read()
+
+    end = chunk.rfind(b'\n') + 1  # only take through the last complete line
+    data = chunk[:end]
+    offset += end
+
+    return header, data, offset, get_file_signature(filepath, offset), rewritten
+
+
+peaksimple_date_format = '%m/%d/%Y %H:%M:%S'  # date and time fields of PeakSimple log lines, joined by a space
+
+PeakSimpleLines = namedtuple('PeakSimpleLines', ['dates', 'line', 'name', 'rt', 'pa'])
+
+
+def parse_peaksimple_dates(dates, times):
+    """
+    Parse the date and time fields of PeakSimple log lines. PeakSimple writes them zero-padded (ie, 04/09/2019 and
+    08:05:00), so on a fast path they're converted arithmetically from their bytes all at once. Anything else (ie, a
+    missing leading zero, or a stamp longer than 19 characters) falls back to pd.to_datetime() with
+    peaksimple_date_format, which caches repeated values and rejects stamps that don't match it.
+
+    :param dates: pd.Series, of str dates
+    :param times: pd.Series, of str times
+    :return: np.ndarray, of datetime64[us], NaT where the date couldn't be read
+    """
+    import numpy as np
+    import pandas as pd
+
+    stamps = dates.astype(str) + ' ' + times.astype(str)
+    full_length = (stamps.str.len() == 19).to_numpy()  # converting to S19 truncates longer stamps, ie 08:05:001
+
+    try:
+        raw = stamps.to_numpy(dtype='S19')
+    except UnicodeEncodeError:
+        raw = np.full(len(stamps), b'', dtype='S19')  # only ascii is on the fast path
+
+    digits = np.frombuffer(raw.tobytes(), dtype=np.uint8).reshape(-1, 19).astype(np.int64) - ord('0')
+
+    def number(*cols):
+        value = 0
+        for col in cols:
+            value = value * 10 + digits[:, col]
+        return value
+
+    month, day, year = number(0, 1), number(3, 4), number(6, 7, 8, 9)
+    hour, minute, second = number(11, 12), number(14, 15), number(17, 18)
+
+    digit_cols = [0, 1, 3, 4, 6, 7, 8, 9, 11, 12, 14, 15, 17, 18]
+    fast = (full_length & (digits[:, digit_cols] >= 0).all(axis=1) & (digits[:, digit_cols] <= 9).all(axis=1)
+            & (raw.view('S1').reshape(-1, 19)[:, [2, 5, 10, 13, 16]] == [b'/', b'/', b' ', b':', b':']).all(axis=1)
+            & (month >= 1) & (month <= 12) & (day >= 1) & (hour < 24) & (minute < 60) & (second < 60))
+
+    months = (year - 1970) * 12 + month - 1
+    parsed = (months.astype('datetime64[M]').astype('datetime64[D]') + (day - 1).astype('timedelta64[D]'))
+    fast &= parsed.astype('datetime64[M]') == months.astype('datetime64[M]')  # ie, not the 31st of a 30-day month
+    parsed = (parsed.astype('datetime64[us]')
+              + (hour * 3600 + minute * 60 + second).astype('timedelta64[s]').astype('timedelta64[us]'))
+
+    if not fast.all():
+        slow = ~fast
+        parsed[slow] = pd.to_datetime(stamps[slow], format=peaksimple_date_format, errors='coerce',
+                                      cache=True).to_numpy(dtype='datetime64[us]')
+
+    return parsed
+
+
+def parse_peaksimple_lines(lines):
+    """
+    Parse many lines of a PeakSimple log (ie, NMHC_PA.LOG or CH4.LOG) at once into columns, before any ORM objects are
+    created. Lines are tab-separated as [sample, date, time, "name", rt, pa, "name", rt, pa...]; any field after the
+    time that contains a " is a peak name, followed by its retention time and peak area.
+
+    Lines are tokenized together by pandas' C csv reader, so retention times and peak areas are converted to floats in
+    whole columns, and dates are parsed by parse_peaksimple_dates(). Peaks missing a numeric rt or pa are dropped, as
+    are all peaks on lines whose date couldn't be read.
+
+    :param lines: list, of str lines from the log
+    :return: PeakSimpleLines, a namedtuple of
+        dates: list, of datetime (or None if it couldn't be read) for each line, parallel to lines
+        line: np.ndarray, of int, the index in lines of each peak
+        name: np.ndarray, of str peak names
+        rt: np.ndarray, of float retention times
+        pa: np.ndarray, of float peak areas
+    """
+    import io
+    import csv
+    import numpy as np
+    import pandas as pd
+
+    if not lines:
+        return PeakSimpleLines([], np.array([], dtype=int), np.array([], dtype=object), np.array([], dtype=float),
+                               np.array([], dtype=float))
+
+    lines = [line.rstrip('\r\n') for line in lines]  # one row per line, whatever the line endings
+    width = max(3, max(line.count('\t') for line in lines) + 1)
+
+    fields = pd.read_csv(io.StringIO('\n'.join(lines)), sep='\t', header=None, names=range(width),
+                         dtype={0: str, 1: str, 2: str}, quoting=csv.QUOTE_NONE, skip_blank_lines=False,
+                         float_precision='round_trip')
+
+    dates = parse_peaksimple_dates(fields[1], fields[2])
+    valid_dates = ~np.isnat(dates)
+
+    def numbers(col):
+        if col >= width:
+            return np.full(len(fields), np.nan)
+        values = fields[col]
+        return values.to_numpy() if values.dtype.kind == 'f' else pd.to_numeric(values, errors='coerce').to_numpy()
+
+    rows, cols, names, rts, pas = [], [], [], [], []
+    for col in range(3, width):
+        if fields[col].dtype != object:
+            continue  # all numbers (or empty), so there are no names
+
+        codes, uniques = pd.factorize(fields[col])  # names repeat, so only check and strip each one once
+        is_name = np.array(['"' in value for value in uniques] + [False])[codes]  # codes are -1 for empty fields
+        ind = np.flatnonzero(is_name & valid_dates)
+
+        if len(ind):
+            rows.append(ind)
+            cols.append(np.full(len(ind), col))
+            names.append(np.array([value.strip('"') for value in uniques], dtype=object)[codes[ind]])
+            rts.append(numbers(col + 1)[ind])
+            pas.append(numbers(col + 2)[ind])
+
+    if not rows:
+        return PeakSimpleLines(dates.astype(object).tolist(), np.array([], dtype=int), np.array([], dtype=object),
+                               np.array([], dtype=float), np.array([], dtype=float))
+
+    rows, cols, names, rts, pas = (np.concatenate(c) for c in (rows, cols, names, rts, pas))
+    order = np.lexsort((cols, rows))  # back into the order they're in each line
+    keep = order[~np.isnan(rts[order]) & ~np.isnan(pas[order])]
+
+    return PeakSimpleLines(dates.astype(object).tolist(), rows[keep], names[keep], rts[keep], pas[keep])
+
+
+def peaksimple_lines_query(session, line_class, dates):
+    """
+    :param session: Sqlalchemy session()
+    :param line_class: class, of the lines (ie, NmhcLine or PaLine), which must have a unique date
+    :param dates: list, of datetimes; SQLite allows at most 999 in one query
+    :return: Query, for the ids and dates of lines with any of the dates
+    """
+    return session.query(line_class.id, line_class.date).filter(line_class.date.in_(dates))
+
+
+def read_peaksimple_lines(lines, line_class, make_line, session=None):
+    """
+    Takes many lines as strings from a PeakSimple log, and processes them into line objects containing their peaks.
+    Lines are parsed together into columns by parse_peaksimple_lines(), and objects are only created for lines that
+    are new: lines with no valid peaks or no readable date are logged and skipped, as are lines with the same date as
+    an earlier one in lines or (if a session is given) one already in the database.
+
+    :param lines: list, of str lines from the log
+    :param line_class: class, of the lines to create (ie, NmhcLine or PaLine)
+    :param make_line: function, taking a datetime and a list of (name, pa, rt) tuples and returning a line_class
+    :param session: sqlalchemy session, to check for lines that are already in the database
+    :return: list, of new line_class objects, in the order of lines
+    """
+    import logging
+
+    logger = logging.getLogger(__name__)
+
+    parsed = parse_peaksimple_lines(lines)
+
+    line_peaks = [[] for _ in lines]
+    for ind, name, rt, pa in zip(parsed.line.tolist(), parsed.name.tolist(), parsed.rt.tolist(), parsed.pa.tolist()):
+        line_peaks[ind].append((name, pa, rt))
+
+    skip_dates = set()
+    if session is not None:
+        dates = [date for date in parsed.dates if date is not None]
+        for dates in split_into_sets_of_n(dates, 500):  # SQLite can't take in clauses with > 1000 variables
+            skip_dates.update(l.date for l in peaksimple_lines_query(session, line_class, dates).all())
+
+    new_lines = []
+    for line, date, peaks in zip(lines, parsed.dates, line_peaks):
+        if date is None or not peaks:
+            logger.warning(f'A {line_class.__name__} had no readable date or peaks and was not processed: {line}')
+        elif date not in skip_dates:
+            skip_dates.add(date)
+            new_lines.append(make_line(date, peaks))
+
+    return new_lines
+
+
+def save_peaksimple_lines(session, lines, peaks):
+    """
+    Insert new lines from read_peaksimple_lines() and their peaks in bulk. Adding them to the session instead would
+    flush each one with its own INSERT to fetch its id, which dominates rebuilding a database from a whole log. Lines
+    are inserted together, their ids are read back by their (unique) dates, and then their peaks are inserted together.
+    The objects aren't added to the session, so query for them to use them afterwards. Nothing is committed.
+
+    :param session: sqlalchemy session
+    :param lines: list, of new line objects (ie, NmhcLines or PaLines), all of the same class
+    :param peaks: str, name of the relationship from each line to its peaks (ie, 'peaklist')
+    :return: int, number of lines inserted
+    """
+    if not lines:
+        return 0
+
+    line_class = type(lines[0])
+    (_, foreign_key), = getattr(line_class, peaks).property.local_remote_pairs  # ie, Peak.line_id
+
+    session.bulk_save_objects(lines)
+
+    ids = {}
+    for dates in split_into_sets_of_n([line.date for line in lines], 500):
+        ids.update((l.date, l.id) for l in peaksimple_lines_query(session, line_class, dates).all())
+
+    new_peaks = []
+    for line in lines:
+        for peak in getattr(line, peaks):
+            setattr(peak, foreign_key.key, ids[line.date])
+            new_peaks.append(peak)
+
+    session.bulk_save_objects(new_peaks)
+
+    return len(ids)
+
+
+def find_line_offset(filepath, line_number):
+    """
+    Find the byte offset of the start of a line, ie to convert a stored line number into an offset for read_file_tail().
+
+    :param filepath: pathlib.Path, file to search
+    :param line_number: int, zero-indexed line to find the start of
+    :return: int, byte offset of the line, or of the end of the file if it has fewer lines
+    """
+    offset = 0
+
+    with open(filepath, 'rb') as f:
+        for _ in range(line_number):
+            line = f.readline()
+            if not line.endswith(b'\n'):
+                break  # ie, the last line is still being written; don't skip past it
+            offset += len(line)
+
+    return offset
+
+
 def check_filesize(filepath):
     """
     Returns the filesize in bytes.
@@ -283,6 +1102,41 @@ def get_all_data_files(path, filetype):
     return files
 
 
+def start_directory_watcher(path, on_change, filetype=None):
+    """
+    Watch a directory tree for new and modified files with inotify (or the platform's equivalent), through watchdog.
+    watchdog is optional; if it isn't installed, None is returned and callers should fall back to polling.
+
+    on_change is called from the watcher's own thread, so it should only hand the path off, ie with
+    loop.call_soon_threadsafe().
+
+    :param path: Path, directory to watch, recursively
+    :param on_change: callable, called with the pathlib.Path of each created, modified or moved-in file
+    :param filetype: str, ".type" of file to report, or None for all files
+    :return: watchdog Observer that has been started (call .stop() to end it), or None if watchdog isn't available
+    """
+    try:
+        from watchdog.observers import Observer
+        from watchdog.events import FileSystemEventHandler
+    except ImportError:
+        return None
+
+    class Handler(FileSystemEventHandler):
+        def on_any_event(self, event):
+            if event.is_directory or event.event_type not in ('created', 'modified', 'moved'):
+                return
+
+            changed = Path(getattr(event, 'dest_path', None) or event.src_path)
+            if filetype is None or filetype in changed.name:
+                on_change(changed)
+
+    observer = Observer()
+    observer.schedule(Handler(), str(path), recursive=True)
+    observer.daemon = True
+    observer.start()
+    return observer
+
+
 def merge_lists(a, b):
     """
     Generator to merge the lists a, and b, starting with the first element in a.
@@ -322,6 +1176,103 @@ def search_for_attr_value(obj_list, attr, value):
     return next((obj for obj in obj_list if getattr(obj, attr, None) == value), None)
 
 
+class AttrIndex:
+    """
+    An index over one attribute of a list of objects (ie, ORM objects loaded for a batch), built once so that repeated
+    lookups don't each scan the list the way search_for_attr_value() does. Equality lookups use a dict, and range
+    lookups a sorted list searched with bisect. Like search_for_attr_value(), get() returns the *first* matching object
+    in the original list order.
+
+    The index doesn't see changes made to the objects after it's built; call update(obj) after changing the indexed
+    attribute of an object, and add(obj) for objects appended to the list.
+    """
+
+    def __init__(self, obj_list, attr):
+        """
+        :param obj_list: list, of objects to index
+        :param attr: string, attribute to index them by
+        """
+        self.attr = attr
+        self._positions = {}  # {id(obj): (position in list, indexed value)}
+        self._buckets = {}  # {value: [(position, obj)]}, sorted by position
+        self._sorted = None  # [(value, position, obj)], sorted by value for range lookups; built on first use
+        self._keys = None  # values of self._sorted, for bisecting
+
+        for obj in obj_list:
+            self.add(obj)
+
+    def _insert(self, position, obj):
+        value = getattr(obj, self.attr, None)
+        self._positions[id(obj)] = (position, value)
+        bisect.insort(self._buckets.setdefault(value, []), (position, obj))
+        self._sorted = None
+
+    def add(self, obj):
+        """
+        Index an object as if it were appended to the end of the list.
+        :param obj: object to add
+        :return: None
+        """
+        self._insert(len(self._positions), obj)
+
+    def update(self, obj):
+        """
+        Re-index an object after its attribute has changed, keeping its original place in the list.
+        :param obj: object, already in the index
+        :return: None
+        """
+        position, value = self._positions.pop(id(obj))
+        bucket = self._buckets[value]
+        del bucket[bisect.bisect_left(bucket, (position,))]
+
+        if not bucket:
+            del self._buckets[value]
+
+        self._insert(position, obj)
+
+    def get(self, value, default=None):
+        """
+        :param value: mixed types, value that should be searched for
+        :return: obj, the first in the list whose attribute equals value, or default if there is none
+        """
+        bucket = self._buckets.get(value)
+        return bucket[0][1] if bucket else default
+
+    def get_all(self, value):
+        """
+        :param value: mixed types, value that should be searched for
+        :return: list, of all objects whose attribute equals value, in list order
+        """
+        return [obj for _, obj in self._buckets.get(value, [])]
+
+    def between(self, low, high, inclusive=True):
+        """
+        Objects whose attribute is between two values. Objects where it's None are never included.
+
+        :param low: lower limit of the attribute
+        :param high: upper limit of the attribute
+        :param inclusive: boolean, if False objects equal to either limit are excluded
+        :return: list, of matching objects, in list order
+        """
+        if self._sorted is None:
+            self._sorted = sorted((value, position, obj) for value, bucket in self._buckets.items() if value is not None
+                                  for position, obj in bucket)
+            self._keys = [value for value, _, _ in self._sorted]
+
+        if inclusive:
+            start, end = bisect.bisect_left(self._keys, low), bisect.bisect_right(self._keys, high)
+        else:
+            start, end = bisect.bisect_right(self._keys, low), bisect.bisect_left(self._keys, high)
+
+        return [obj for _, _, obj in sorted(self._sorted[start:end], key=lambda entry: entry[1])]
+
+    def __contains__(self, value):
+        return value in self._buckets
+
+    def __len__(self):
+        return len(self._positions)
+
+
 def find_closest_date(date, list_of_dates, how='abs'):
     """
     This is a helper function that works on Python datetimes. It returns the closest date value, either absolutely,
@@ -361,6 +1312,77 @@ def find_closest_date(date, list_of_dates, how='abs'):
     return match, delta
 
 
+def match_dates(dates, candidates, how='abs', tolerance=None, one_to_one=True, exact=True):
+    """
+    Match each date to the closest of a list of candidate dates, in the sense of find_closest_date(), for whole lists at
+    once. Candidates are sorted once and searched with np.searchsorted, so matching is O(n log n) rather than a linear
+    search per date.
+
+    With one_to_one, each candidate is matched at most once; dates claim their closest candidate in date order, and a
+    date whose closest candidate has already been claimed is left unmatched.
+
+    :param dates: list, of datetimes to find matches for
+    :param candidates: list, of datetimes that can be matched to
+    :param how: ['abs', 'pos', 'neg']
+            'abs': Absolute closest candidate, either above or below the given date
+            'pos': Matched candidate must be greater than or equal to the given date
+            'neg': Matched candidate must be less than or equal to the given date
+    :param tolerance: timedelta, matches must be strictly less than this far apart; None for no limit
+    :param one_to_one: boolean, if False candidates can be matched to any number of dates
+    :param exact: boolean, if False a candidate at exactly the same date is not a match
+    :return: list, of (date index, candidate index) tuples, in the order of dates
+    """
+    import numpy as np
+
+    dates = np.array(dates, dtype='datetime64[us]')
+    candidates = np.array(candidates, dtype='datetime64[us]')
+
+    order = np.argsort(candidates, kind='stable')
+    order = order[~np.isnat(candidates[order])]  # NaT sorts last, and can't match anything
+    candidates = candidates[order]
+
+    if not len(dates) or not len(candidates):
+        return []
+
+    last = len(candidates) - 1
+
+    if how == 'abs':
+        after = np.minimum(np.searchsorted(candidates, dates, side='left'), last)
+        before = np.maximum(after - 1, 0)
+        closest = np.where(np.abs(dates - candidates[before]) <= np.abs(candidates[after] - dates), before, after)
+    elif how == 'pos':
+        closest = np.searchsorted(candidates, dates, side='left')  # first candidate at or after each date
+    elif how == 'neg':
+        closest = np.searchsorted(candidates, dates, side='right') - 1  # last candidate at or before each date
+    else:
+        raise ValueError("Supplied 'how' not in ['abs', 'pos', 'neg']")
+
+    found = (closest >= 0) & (closest <= last) & ~np.isnat(dates)
+    closest = np.clip(closest, 0, last)
+    diff = np.abs(candidates[closest] - dates)
+
+    if tolerance is not None:
+        found &= diff < np.timedelta64(tolerance)
+    if not exact:
+        found &= diff > np.timedelta64(0, 'us')
+
+    pairs = []
+    claimed = set()
+    for ind in np.argsort(dates, kind='stable'):
+        if not found[ind]:
+            continue
+
+        match = int(order[closest[ind]])
+        if one_to_one:
+            if match in claimed:
+                continue
+            claimed.add(match)
+
+        pairs.append((int(ind), match))
+
+    return sorted(pairs)
+
+
 def create_daily_ticks(days_in_plot, minors_per_day=4):
     """
     Takes a number of days to plot back, and creates major (1 day) and minor (6 hour) ticks.
@@ -399,17 +1421,169 @@ def five_minute_medians(dates, vals):
     return df.index.tolist(), df['vals'].tolist()
 
 
-def connect_to_sftp():
+sftp_channels = 4  # SFTP channels opened over the one SSH connection, ie the number of files uploaded at once
+sftp_keepalive = 30  # seconds between keepalive packets, so the pooled connection isn't dropped while it's idle
+_sftp_pool = None
+_sftp_lock = threading.Lock()
+
+
+def connect_to_ssh():
     """
-    Uses paramiko to create a connection to the Taylor drive. Relies on authetication information from a JSON file.
-    :return: SFTP_Client
+    Uses paramiko to create an SSH connection to the Taylor drive. Relies on authetication information from a JSON file.
+    :return: SSHClient, connected
     """
     import paramiko
     client = paramiko.SSHClient()
     client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
     server_info = json.loads(taylor_auth.read_text())
     client.connect(**server_info)
-    return client.open_sftp()
+    client.get_transport().set_keepalive(sftp_keepalive)
+    return client
+
+
+def connect_to_sftp():
+    """
+    Uses paramiko to create a connection to the Taylor drive. Relies on authetication information from a JSON file.
+    :return: SFTP_Client
+    """
+    return connect_to_ssh().open_sftp()
+
+
+class SftpPool:
+    """
+    An SSH connection with a pool of SFTP channels opened over it. Upload threads check channels out and return them
+    when done, so several files are sent at once without a new SSH handshake for every file or directory. The
+    connection is opened on the first checkout and kept until close(); if it drops, the next checkout reconnects.
+
+    Files are uploaded to a hidden temporary name and renamed over the old file, so the website never serves a
+    partially-uploaded plot.
+    """
+
+    def __init__(self, connect=connect_to_ssh, channels=sftp_channels):
+        """
+        :param connect: callable, returning a connected paramiko SSHClient (or anything with open_sftp() and
+            get_transport())
+        :param channels: int, max number of SFTP channels open at once
+        """
+        self.connect = connect
+        self.channels = channels
+        self._client = None
+        self._generation = 0  # incremented on each reconnect, so channels from a dropped connection aren't reused
+        self._idle = []  # [(generation, SFTPClient)], open channels waiting to be checked out
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(channels)
+
+    def _checkout(self):
+        """
+        :return: (int, SFTPClient), the connection generation the channel belongs to and the channel
+        """
+        with self._lock:
+            transport = self._client.get_transport() if self._client is not None else None
+
+            if transport is None or not transport.is_active():
+                self.close()
+                self._client = self.connect()
+                self._generation += 1
+
+            if self._idle:
+                return self._idle.pop()
+
+            return self._generation, self._client.open_sftp()
+
+    def _checkin(self, generation, sftp, ok):
+        with self._lock:
+            if ok and generation == self._generation:
+                self._idle.append((generation, sftp))
+                return
+
+        try:
+            sftp.close()
+        except Exception:
+            pass
+
+    def upload(self, path, remote_dir):
+        """
+        Upload a file to a remote directory, through a temporary file that's renamed into place.
+
+        :param path: Path, local file to upload
+        :param remote_dir: str, directory on the remote server to upload it to
+        :return: None, raises the underlying exception if the upload failed
+        """
+        import posixpath
+
+        remote = posixpath.join(remote_dir, path.name)
+        temp = posixpath.join(remote_dir, f'.{path.name}.tmp')
+
+        with self._slots:
+            generation, sftp = self._checkout()
+            ok = False
+            try:
+                sftp.put(str(path), temp)
+                try:
+                    sftp.posix_rename(temp, remote)  # atomically replaces the old file
+                except IOError:
+                    # without the posix-rename extension, a plain SFTP rename can't overwrite an existing file
+                    try:
+                        sftp.remove(remote)
+                    except IOError:
+                        pass
+                    sftp.rename(temp, remote)
+                ok = True
+            finally:
+                self._checkin(generation, sftp, ok)
+
+    def upload_files(self, files):
+        """
+        Upload files concurrently, over up to self.channels channels.
+
+        :param files: list, of (Path, str) pairs of local files and the remote directories to upload them to
+        :return: list, of booleans of which files uploaded successfully
+        """
+        def try_upload(file):
+            try:
+                self.upload(*file)
+                return True
+            except Exception:
+                return False
+
+        if not files:
+            return []
+
+        with ThreadPoolExecutor(max_workers=min(self.channels, len(files)), thread_name_prefix='summit-sftp') as pool:
+            return list(pool.map(try_upload, files))
+
+    def close(self):
+        """
+        Close all idle channels and the SSH connection. Checked-out channels are closed when they're returned.
+        :return: None
+        """
+        for _, sftp in self._idle:
+            try:
+                sftp.close()
+            except Exception:
+                pass
+        self._idle = []
+
+        if self._client is not None:
+            try:
+                self._client.close()
+            except Exception:
+                pass
+            self._client = None
+
+
+def get_sftp_pool():
+    """
+    Returns the process-wide SftpPool, creating it on first use.
+    :return: SftpPool
+    """
+    global _sftp_pool
+
+    with _sftp_lock:
+        if _sftp_pool is None:
+            _sftp_pool = SftpPool()
+
+    return _sftp_pool
 
 
 def add_or_ignore_plot(plot, core_session):
@@ -495,39 +1669,25 @@ def append_df_to_excel(filename, df, sheet_name='Sheet1', startrow=None,
 
 async def send_files_sftp(filepaths, remote_path):
     """
-    Send a list of files to the provided remote path.
+    Send a list of files to the provided remote path, several at a time over the pooled SFTP connection.
     :param filepaths: list, of pathlib Path objects
     :param remote_path: string, path on the remote server to send files to
     :return: list, of booleans of which plots uploaded sucessfully
     """
-
-    bools = []
-    try:
-        con = connect_to_sftp()
-        con.chdir(remote_path)
-
-        for file in filepaths:
-            try:
-                con.put(str(file), file.name)
-                bools.append(True)
-            except:
-                bools.append(False)
-
-        con.close()
-    except:
-        while len(bools) < len(filepaths):
-            bools.append(False)
-
-    return bools
+    return get_sftp_pool().upload_files([(file, remote_path) for file in filepaths])
 
 
+@offload(timeout=15 * 60)
 async def check_send_plots(logger):
     """
-    Look through all plots staged to be uploaded and remove them if successfully uploaded.
+    Look through all plots staged to be uploaded and remove them if successfully uploaded. Plots whose bytes match the
+    last upload to the same remote file (see UploadedFile) are unstaged without being sent again.
+
     :param logger: logging logger to log to
     :return: boolean, True if ran without errors
     """
     try:
+        import posixpath
         from summit_errors import send_processor_email
     except ImportError:
         logger.error('ImportError occurred in check_send_plots()')
@@ -541,44 +1701,66 @@ async def check_send_plots(logger):
         return False
 
     try:
-        plots_to_upload = session.query(Plot).filter(Plot.staged == True)
-
-        remote_dirs = set([p.remote_path for p in plots_to_upload.all()])
+        plots_to_upload = staged_plots_query(session).all()
 
-        for remote_dir in remote_dirs:
-            plot_set = plots_to_upload.filter(Plot.remote_path == remote_dir).all()
+        remotes = {plot.id: posixpath.join(plot.remote_path, plot.name) for plot in plots_to_upload}
+        uploaded = {u.remote: u for u in uploaded_files_query(session, set(remotes.values())).all()}
 
-            if plot_set:
-                paths_to_upload = [p.path for p in plot_set]
-                successes = await send_files_sftp(paths_to_upload, remote_dir)
-
-                for plot, success in zip(plots_to_upload, successes):
-                    if success:
-                        logger.info(f'Plot {plot.name} uploaded to website.')
-                        session.delete(plot)
-                    else:
-                        logger.warning(f'Plot {plot.name} failed to upload.')
+        to_send = []  # [(plot, hash, size)]
+        for plot in plots_to_upload:
+            try:
+                size = plot.path.stat().st_size
+                hash = hash_file(plot.path, size)
+            except OSError:
+                size = hash = None  # missing or unreadable; let the upload fail and report it
+
+            last = uploaded.get(remotes[plot.id])
+            if hash is not None and last is not None and last.hash == hash:
+                logger.info(f'Plot {plot.name} unchanged since it was last uploaded, not sent again.')
+                session.delete(plot)
+            else:
+                to_send.append((plot, hash, size))
+
+        successes = get_sftp_pool().upload_files([(plot.path, plot.remote_path) for plot, _, _ in to_send])
+
+        for (plot, hash, size), success in zip(to_send, successes):
+            if success:
+                logger.info(f'Plot {plot.name} uploaded to website.')
+                session.delete(plot)
+
+                remote = remotes[plot.id]
+                if remote in uploaded:
+                    uploaded[remote].hash = hash
+                    uploaded[remote].size = size
+                    uploaded[remote].date = datetime.now()
+                else:
+                    uploaded[remote] = UploadedFile(remote, hash, size, datetime.now())
+                    session.add(uploaded[remote])
+            else:
+                logger.warning(f'Plot {plot.name} failed to upload.')
 
         session.commit()
-
-        session.close()
-        engine.dispose()
         return True
 
     except Exception as e:
         logger.error(f'Exception {e.args} occurred in check_send_plots().')
         send_processor_email('Core', exception=e)
-        session.close()
-        engine.dispose()
         return False
 
+    finally:
+        session.close()
+        # this stage runs in whichever scheduler worker is free, so don't leave a connection open in each of them
+        get_sftp_pool().close()
+
 
 class MovedFile(Base):
     """
     MovedFiles are used to track files that have been moved to the /data directory from their FTP directories.
     The FTP directories are cleaned somewhat regularly, so they're not a good home for the permanent data files.
 
-    Filepaths are used to track and move them, and filesize is the sole determiner if a file is moved again.
+    Filepaths are used to track and move them. A file is moved again if it's grown, or if it's the same size but its
+    content has changed. The hash of what was last copied lets copy_file() append only the new part of a file that's
+    grown, after checking that the part already copied hasn't changed.
     """
     __tablename__ = 'files'
 
@@ -589,6 +1771,7 @@ class MovedFile(Base):
     location = Column(String)
     size = Column(Integer)
     type = Column(String)
+    hash = Column(String)  # sha1 of the first size bytes of the file, as last copied
 
     def __init__(self, path, type, location, size):
         self.path = path
@@ -610,110 +1793,474 @@ class MovedFile(Base):
         return self._name
 
 
-async def move_log_files(logger):
+move_timeout = 30 * 60  # seconds a single pass of moving files is waited on before being abandoned
+_move_lock = threading.Lock()  # prevents a new pass from starting while an abandoned one is still running
+
+"""
+Settings for move_log_files(). Sync directories are watched with start_directory_watcher() if watchdog is installed, and
+files are moved within move_batch_seconds of being written. Without a watcher, or as a safety net with one, the sync
+trees are re-scanned against a snapshot of every directory and file that's saved between runs (see scan_sync_tree()).
+"""
+move_batch_seconds = 5  # seconds to collect file events for before moving the files, so bursts of writes are batched
+move_poll_seconds = 10 * 60  # seconds between scans of the sync directories when there's no watcher
+move_rescan_seconds = 60 * 60  # seconds between scans when there is a watcher, to catch any missed events
+move_recent_days = 2  # files modified this recently are re-checked on every scan, even if their directory isn't
+move_full_scan_hours = 24  # hours between scans that check every file and directory, regardless of the snapshot
+move_snapshot_path = core_dir / 'move_snapshot.json'
+
+_moved_files = {}  # {type: {name: MovedFile}}, detached copies of every file moved to the data directories
+
+
+def get_sync_trees():
+    """
+    :return: list, of (sync_path, type, data_path, file_type) for each directory data files are moved from
     """
-    Runs continuously and sleeps for 10 minutes at a time. Comb the directories for new data files and move any that
-    are new or have been updated. This WILL NOT handle turning over a new year in the daily files well, as they have no
-    year in the filename. I can't fix that.
+    return list(zip([methane_logs_sync, voc_logs_sync, daily_logs_sync, picarro_logs_sync],
+                    ['methane', 'voc', 'daily', 'picarro'],
+                    [methane_logs_path, voc_logs_path, daily_logs_path, picarro_logs_path],
+                    ['.txt', '.txt', '.txt', '.dat']))
 
-    :param logger: logging logger to log to
-    :return: boolean, True if ran without errors
+
+def moved_files_query(session, type_):
+    """
+    :param session: Sqlalchemy session() for the core database
+    :param type_: str, type of file, ie 'voc'
+    :return: Query, for the MovedFiles of that type in the data directory
+    """
+    return (session.query(MovedFile)
+            .filter(MovedFile.location == 'data')
+            .filter(MovedFile.type == type_))
+
+
+def get_moved_files(session, type_):
+    """
+    Get every file of a type that's been moved to the data directory, by name. The files are queried once per process
+    and then kept in memory, detached from any session, since move_file() is the only thing that adds or changes them.
+
+    :param session: Sqlalchemy session() for the core database
+    :param type_: str, type of file, ie 'voc'
+    :return: dict, of {name: MovedFile}
+    """
+    if type_ not in _moved_files:
+        files = moved_files_query(session, type_).all()
+
+        for file in files:
+            session.expunge(file)
+
+        _moved_files[type_] = {file.name: file for file in reversed(files)}  # the first file wins for any duplicates
+
+    return _moved_files[type_]
+
+
+_renamed_daily_files = set()  # paths produced by add_year_to_daily_file(), whose renames are reported by the watcher
+
+
+def add_year_to_daily_file(path):
+    """
+    Change the name of a daily file from this year to include the year, since the instrument doesn't write one
+    (implemented: 2/14/2020). This WILL NOT handle turning over a new year well, as the files have no year to go by.
+    Files that already end in _<year> (ie, that this renamed before) are left alone.
+
+    :param path: Path, of a daily file in the sync directory
+    :return: Path, of the file after renaming, or the original path if it wasn't renamed
+    """
+    year = dt.datetime.now().year
+
+    if path in _renamed_daily_files or path.stem.endswith(f'_{year}'):
+        return path
+
+    date = check_path_date(path)
+
+    if date and date.year == year:
+        renamed = path.with_name(f'{path.stem}_{year}{path.suffix}')
+        path.rename(renamed)
+        _renamed_daily_files.add(renamed)
+        return renamed
+
+    return path
+
+
+def scan_sync_tree(path, filetype, snapshot=None, full=False):
+    """
+    Find the files in a sync directory tree that are new or have changed since the last scan, without listing and
+    stat-ing every file in a multi-year tree each time.
+
+    A directory's modification time only changes when files are added, removed or renamed in it, so only directories
+    whose mtime differs from the snapshot are listed. Within unchanged directories, only files that were modified in
+    the last move_recent_days are stat-ed again, since those are the ones still being appended to. A full scan checks
+    everything.
+
+    :param path: Path, root of the sync directory tree
+    :param filetype: str, ".type" of file to search for
+    :param snapshot: dict, returned by the last scan of this tree, or None to scan everything
+    :param full: boolean, list every directory and stat every file regardless of the snapshot
+    :return: (list, dict), of changed file Paths, and the new snapshot to pass in next time
     """
+    import time
+
+    snapshot = snapshot if snapshot else {'dirs': {}, 'files': {}}
+    old_dirs, old_files = snapshot['dirs'], snapshot['files']
+
+    children = {}  # directories and files in the last snapshot, by their parent directory
+    for d in old_dirs:
+        children.setdefault(os.path.dirname(d), ([], []))[0].append(d)
+    for f in old_files:
+        children.setdefault(os.path.dirname(f), ([], []))[1].append(f)
+
+    recent = time.time() - move_recent_days * 24 * 60 * 60
 
-    while True:
+    dirs, files = {}, {}
+    stack = [str(path)]
+    while stack:
+        d = stack.pop()
         try:
-            from summit_errors import send_processor_email, EmailTemplate, sender, processor_email_list
-            from shutil import copy
-            import datetime as dt
-            import os
-        except ImportError:
-            logger.error('ImportError occurred in move_log_files()')
-            return False
+            mtime = os.stat(d).st_mtime
+        except FileNotFoundError:
+            continue
+
+        dirs[d] = mtime
+
+        if full or old_dirs.get(d) != mtime:
+            with os.scandir(d) as entries:
+                for entry in entries:
+                    if entry.is_dir():
+                        stack.append(entry.path)
+                    elif filetype in entry.name:
+                        stat = entry.stat()
+                        files[entry.path] = [stat.st_size, stat.st_mtime]
+        else:
+            known_dirs, known_files = children.get(d, ([], []))
+            stack.extend(known_dirs)
+
+            for f in known_files:
+                if old_files[f][1] < recent:
+                    files[f] = old_files[f]
+                    continue
+
+                try:
+                    stat = os.stat(f)
+                except FileNotFoundError:
+                    continue
+                files[f] = [stat.st_size, stat.st_mtime]
+
+    changed = [Path(f) for f, stat in files.items() if old_files.get(f) != stat]
+    return changed, {'dirs': dirs, 'files': files, 'scanned': snapshot.get('scanned') if not full else time.time()}
+
+
+def load_move_snapshot():
+    """
+    :return: dict, of the last snapshot of each sync tree by type, or an empty dict if there isn't one
+    """
+    try:
+        return json.loads(move_snapshot_path.read_text())
+    except (FileNotFoundError, ValueError):
+        return {}
+
 
+def save_move_snapshot(snapshot):
+    """
+    Write the snapshot of each sync tree to a temporary file, then replace the old one, so it's never left half-written.
+
+    :param snapshot: dict, of the snapshot of each sync tree by type
+    :return: None
+    """
+    temp_path = move_snapshot_path.with_name(move_snapshot_path.name + '.tmp')
+    temp_path.write_text(json.dumps(snapshot))
+    os.replace(temp_path, move_snapshot_path)
+
+
+copy_chunk_bytes = 1024 ** 2  # bytes read at a time when hashing and copying files
+
+
+def copy_file(path, data_path, copied_size=None, copied_hash=None):
+    """
+    Copy a file into a directory, appending only the new bytes if the file has grown since it was last copied.
+
+    If the destination is the size of the last copy and the first copied_size bytes of the source still hash to
+    copied_hash, the source has only been appended to, so just the bytes after copied_size are appended to the
+    destination. Otherwise, the whole file is copied to a hidden temporary file beside the destination and renamed over
+    it, so readers only ever see the old file or the complete new one.
+
+    :param path: Path, file to copy
+    :param data_path: Path, directory to copy it to
+    :param copied_size: int, size of the source when it was last copied, if it has been
+    :param copied_hash: str, hash returned by the last copy
+    :return: (int, str, boolean), the number of bytes copied in total, their sha1, and True if the copy was an append
+    """
+    import shutil
+    import hashlib
+
+    dest = Path(data_path) / path.name
+    size = path.stat().st_size  # copy up to the current size, even if the file is still being written to
+
+    with open(path, 'rb') as src:
+        if copied_size and copied_hash and copied_size <= size and dest.exists() and dest.stat().st_size == copied_size:
+            digest = hashlib.sha1()
+            remaining = copied_size
+            while remaining:
+                chunk = src.read(min(copy_chunk_bytes, remaining))
+                if not chunk:
+                    break
+                digest.update(chunk)
+                remaining -= len(chunk)
+
+            if not remaining and digest.hexdigest() == copied_hash:
+                with open(dest, 'ab') as out:
+                    remaining = size - copied_size
+                    while remaining:
+                        chunk = src.read(min(copy_chunk_bytes, remaining))
+                        if not chunk:
+                            break
+                        digest.update(chunk)
+                        out.write(chunk)
+                        remaining -= len(chunk)
+
+                return size - remaining, digest.hexdigest(), True
+
+            src.seek(0)
+
+        digest = hashlib.sha1()
+        temp_path = dest.with_name(f'.{dest.name}.tmp')
+        copied = 0
         try:
-            engine, session = connect_to_db('sqlite:///summit_core.sqlite', core_dir)
-            MovedFile.__table__.create(engine, checkfirst=True)
-        except Exception as e:
-            logger.error(f'Exception {e.args} prevented connection to the database in move_log_files()')
-            send_processor_email('Core', exception=e)
+            with open(temp_path, 'wb') as out:
+                while copied < size:
+                    chunk = src.read(min(copy_chunk_bytes, size - copied))
+                    if not chunk:
+                        break
+                    digest.update(chunk)
+                    out.write(chunk)
+                    copied += len(chunk)
+
+            shutil.copystat(path, temp_path)
+            os.replace(temp_path, dest)
+        finally:
+            if temp_path.exists():
+                temp_path.unlink()
+
+    return copied, digest.hexdigest(), False
+
+
+def hash_file(path, size=None):
+    """
+    :param path: Path, file to hash
+    :param size: int, number of bytes at the start of the file to hash; defaults to all of it
+    :return: str, sha1 hex digest
+    """
+    import hashlib
+
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        remaining = size if size is not None else path.stat().st_size
+        while remaining:
+            chunk = f.read(min(copy_chunk_bytes, remaining))
+            if not chunk:
+                break
+            digest.update(chunk)
+            remaining -= len(chunk)
+
+    return digest.hexdigest()
+
+
+def move_file(session, logger, path, type_, data_path, moved):
+    """
+    Copy a file from a sync directory to its data directory if it's never been moved, has grown since it was, or is
+    the same size but its content has changed. Files that have grown are appended to where possible (see copy_file()).
+
+    :param session: Sqlalchemy session() for the core database
+    :param logger: logging logger to log to
+    :param path: Path, of the file in the sync directory
+    :param type_: str, type of file, ie 'voc'
+    :param data_path: Path, directory to move the file to
+    :param moved: dict, of {name: MovedFile} from get_moved_files()
+    :return: boolean, True if the file was copied, False if it didn't need to be or couldn't be
+    """
+    size = check_filesize(path)
+    matched_file = moved.get(path.name)
+
+    if size is None:
+        return False
+
+    if matched_file is not None:
+        if size < matched_file.size:
+            return False  # ie, part-way through being synced again; wait for it to catch up
+
+        if size == matched_file.size and (not matched_file.hash or hash_file(path) == matched_file.hash):
             return False
 
-        try:
+    try:
+        if matched_file is None:
+            copied_size, copied_hash, appended = copy_file(path, data_path)
+        else:
+            copied_size, copied_hash, appended = copy_file(path, data_path, matched_file.size, matched_file.hash)
+    except PermissionError:
+        logger.error(f'File {path.name} could not be moved due to a permissions error.')
+        from summit_errors import send_processor_warning
+        send_processor_warning(PROC, 'PermissionError',
+                               f'File {path.name} could not be moved due a permissions error.\n'
+                               + 'Copying/pasting the file, deleting the old one, and renaming '
+                               + 'the file to its old name should allow it to be processed.\n'
+                               + 'This will require admin privelidges.')
+        return False
+
+    if matched_file is None:
+        file = MovedFile(data_path / path.name, type_, 'data', copied_size)
+        file.hash = copied_hash
+        merged = session.merge(file)
+        session.flush()  # give the new row an id, so later merges of the cached copy update it
+        file.id = merged.id
+        moved[path.name] = file
+        logger.info(f'File {path.name} moved to data directory.')
+    else:
+        matched_file.size = copied_size
+        matched_file.hash = copied_hash
+        session.merge(matched_file)
+        if appended:
+            logger.info(f'File {path.name} appended to in data directory.')
+        else:
+            logger.info(f'File {path.name} updated in data directory.')
+
+    return True
+
+
+def move_new_files(logger, paths=None):
+    """
+    Move any data files that are new or have been updated from the sync directories to the data directories.
+
+    This is blocking, and is run in a worker thread by move_log_files(). If a previous pass timed out but is still
+    running, this pass is skipped.
+
+    :param logger: logging logger to log to
+    :param paths: list, of Paths that changed, ie from a directory watcher; if None, every sync tree is scanned
+    :return: boolean, True if ran without errors
+    """
+    if not _move_lock.acquire(blocking=False):
+        logger.warning('The previous pass of move_log_files() is still running, so this pass was skipped.')
+        return True
+
+    try:
+        return _move_new_files(logger, paths)
+    finally:
+        _move_lock.release()
+
+
+def _move_new_files(logger, paths=None):
+    try:
+        import time
+        from summit_errors import send_processor_email
+    except ImportError:
+        logger.error('ImportError occurred in move_log_files()')
+        return False
+
+    try:
+        engine, session = connect_to_db('sqlite:///summit_core.sqlite', core_dir)
+        create_tables(engine, Base)  # also migrates, ie to add MovedFile.hash
+    except Exception as e:
+        logger.error(f'Exception {e.args} prevented connection to the database in move_log_files()')
+        send_processor_email('Core', exception=e)
+        return False
+
+    try:
+        if paths is None:
             logger.info('Running move_log_files()')
+            snapshot = load_move_snapshot()
 
-            sync_paths = [methane_logs_sync, voc_logs_sync, daily_logs_sync, picarro_logs_sync]
-            data_paths = [methane_logs_path, voc_logs_path, daily_logs_path, picarro_logs_path]
-            data_types = ['methane', 'voc', 'daily', 'picarro']
-            file_types = ['.txt', '.txt', '.txt', '.dat']
-
-            for sync_path, type_, data_path, file_type in zip(sync_paths, data_types, data_paths, file_types):
-
-                # change the name of the daily files before reading them in (implemented: 2/14/2020)
-                for d in get_all_data_files(daily_logs_sync, '.txt'):
-                    if check_path_date(d).year == dt.datetime.now().year and "2020" not in str(d):
-                        name, extension = os.path.splitext(d)
-                        d.rename(name + '_' + str(dt.datetime.now().year) + extension)
-
-                sync_files = [MovedFile(path, type_, 'sync', check_filesize(path))
-                              for path in get_all_data_files(sync_path, file_type)]
-
-                data_files = (session.query(MovedFile)
-                              .filter(MovedFile.location == 'data')
-                              .filter(MovedFile.type == type_)
-                              .all())
-                moved_data_files = [d.name for d in data_files]
-
-                for file in sync_files:
-                    if file.name not in moved_data_files:
-                        try:
-                            copy(file.path, data_path)  # will overwrite
-                        except PermissionError:
-                            logger.error(f'File {file.name} could not be moved due to a permissions error.')
-                            from summit_errors import send_processor_warning
-                            send_processor_warning(PROC, 'PermissionError',
-                                                   f'File {file.name} could not be moved due a permissions error.\n'
-                                                   + 'Copying/pasting the file, deleting the old one, and renaming '
-                                                   + 'the file to its old name should allow it to be processed.\n'
-                                                   + 'This will require admin privelidges.')
-                            continue
-                        file.path = data_path / file.name
-                        file.location = 'data'
-                        session.merge(file)
-                        logger.info(f'File {file.name} moved to data directory.')
-                    else:
-                        matched_file = search_for_attr_value(data_files, 'name', file.name)
-                        if file.size > matched_file.size:
-                            try:
-                                copy(file.path, data_path)  # will overwrite
-                            except PermissionError:
-                                logger.error(f'File {file.name} could not be moved due to a permissions error.')
-                                from summit_errors import send_processor_warning
-
-                                send_processor_warning(PROC, 'PermissionError',
-                                                       f'File {file.name} could not be moved due a permissions error.\n'
-                                                       + 'Copying/pasting the file, deleting the old one, and renaming '
-                                                       + 'the file to its old name should allow it to be processed.\n'
-                                                       + 'This will require admin privelidges.')
-                                continue
-
-                            matched_file.size = check_filesize(matched_file.path)
-                            session.merge(matched_file)
-                            logger.info(f'File {matched_file.name} updated in data directory.')
-
-            session.commit()
-
-            session.close()
-            engine.dispose()
-
-            import gc
-            gc.collect()
-
-            for i in range(20):
-                await asyncio.sleep(30)
+        for sync_path, type_, data_path, file_type in get_sync_trees():
+            if paths is None:
+                tree_snapshot = snapshot.get(type_)
+                full = (not tree_snapshot or not tree_snapshot.get('scanned')
+                        or time.time() - tree_snapshot['scanned'] > move_full_scan_hours * 60 * 60)
 
-        except Exception as e:
-            logger.error(f'Exception {e.args} occurred in move_log_files().')
-            send_processor_email('Core', exception=e)
-            session.close()
-            engine.dispose()
-            return False
+                changed, snapshot[type_] = scan_sync_tree(sync_path, file_type, tree_snapshot, full)
+            else:
+                changed = [p for p in paths if file_type in p.name and Path(sync_path) in p.parents]
+
+            if type_ == 'daily':
+                changed = [add_year_to_daily_file(p) for p in changed if p.exists()]
+
+            moved = get_moved_files(session, type_)
+
+            for path in sorted(changed):
+                if not move_file(session, logger, path, type_, data_path, moved) and paths is None:
+                    if check_filesize(path) is not None and path.name not in moved:
+                        snapshot[type_]['files'].pop(str(path), None)  # couldn't be moved; try again next scan
+
+        session.commit()
+
+        if paths is None:
+            save_move_snapshot(snapshot)
+
+        session.close()
+        return True
+
+    except Exception as e:
+        logger.error(f'Exception {e.args} occurred in move_log_files().')
+        send_processor_email('Core', exception=e)
+        session.rollback()
+        session.close()
+        _moved_files.clear()  # files added to the cache may not have been committed; re-query them next time
+        return False
+
+
+async def move_log_files(logger):
+    """
+    Runs continuously, moving new and updated data files from the sync directories to the data directories. If
+    watchdog is installed, the sync directories are watched, and files are moved within a few seconds of being written;
+    the trees are still scanned every move_rescan_seconds to catch anything that was missed. Without a watcher, they're
+    scanned every move_poll_seconds. Each pass of move_new_files() is run in the blocking thread pool so the event loop
+    (and the processors scheduled on it) keeps running while files are copied.
+
+    :param logger: logging logger to log to
+    :return: boolean, False if it stopped due to an error
+    """
+    import time
+
+    loop = asyncio.get_event_loop()
+    wake = asyncio.Event()
+    changed = set()
+
+    def file_changed(path):
+        changed.add(path)
+        wake.set()
+
+    watchers = [start_directory_watcher(sync_path, lambda path: loop.call_soon_threadsafe(file_changed, path))
+                for sync_path, *_ in get_sync_trees() if Path(sync_path).is_dir()]
+    watching = bool(watchers) and all(watchers)
+
+    logger.info('Watching sync directories for new files.' if watching
+                else f'Scanning sync directories for new files every {move_poll_seconds}s.')
+
+    last_scan = None
+
+    try:
+        while True:
+            scan = last_scan is None or time.monotonic() - last_scan >= (move_rescan_seconds if watching
+                                                                          else move_poll_seconds)
+            paths = None if scan else sorted(changed)
+
+            if scan or paths:
+                changed.clear()
+                wake.clear()
+
+                try:
+                    moved = await run_blocking(move_new_files, logger, paths, timeout=move_timeout)
+                except asyncio.TimeoutError:
+                    logger.error(f'move_log_files() did not finish within {move_timeout}s and was abandoned.')
+                    moved = True  # a slow pass (ie, a large backfill) isn't fatal; try again after sleeping
+
+                if not moved:
+                    return False
+
+                if scan:
+                    last_scan = time.monotonic()
+
+            try:
+                await asyncio.wait_for(wake.wait(), timeout=30)  # wake in 30s periods to permit keyboard interrupts
+                await asyncio.sleep(move_batch_seconds)  # let a burst of writes finish before moving the files
+            except asyncio.TimeoutError:
+                pass
+
+    finally:
+        for watcher in watchers:
+            if watcher:
+                watcher.stop()
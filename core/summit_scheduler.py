@@ -0,0 +1,226 @@
+"""
+Dependency-graph scheduling for the processors run by summit.py.
+
+Each processor's main() is a ProcessorNode in a graph, where a node lists the nodes it depends on and a condition for
+running based on their results (ie, the dual methane plot only runs if the Picarro or methane processors created new
+data). Nodes with no unfinished dependencies are submitted to a process pool as soon as possible, so independent
+processors (VOC, Picarro, dailies) run at the same time on their own cores, and a full cycle takes about as long as the
+slowest chain of processors instead of the sum of all of them.
+
+Processors are run in the worker processes by module and function name, so nothing but strings and their boolean
+returns are passed between processes. Workers are spawned rather than forked, since summit.py is already running threads
+(the file watcher, streaming and blocking executors) when the pool starts, and forking a threaded process is unsafe.
+"""
+
+import os
+import asyncio
+import logging
+import importlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+
+def any_result(results):
+    """
+    Default run condition for a node; run if any dependency returned True (ie, created new data).
+    :param results: dict, of {dependency name: result}
+    :return: boolean
+    """
+    return any(results.values())
+
+
+def always_run(results):
+    """
+    Run condition for nodes that should run after their dependencies regardless of their results.
+    :param results: dict, of {dependency name: result}
+    :return: boolean, always True
+    """
+    return True
+
+
+class ProcessorNode:
+    """
+    A single processor in the scheduling graph. The processor is an async function, given by its module and function
+    name so it can be imported and run in a worker process.
+
+    Nodes with depends_on will wait for all their dependencies to finish, then run only if run_if(results) is True,
+    where results is a dict of {dependency name: result}. Dependencies that were skipped have a result of None.
+    """
+
+    def __init__(self, name, module, function, depends_on=None, run_if=any_result, logger_name=None, log_dir=None):
+        """
+        :param name: str, unique name of the node in the graph
+        :param module: str, name of the module the processor is imported from, ie 'voc_main_loop'
+        :param function: str, name of the async function to run, ie 'main'
+        :param depends_on: list, of node names that must finish before this one runs
+        :param run_if: callable, takes a dict of dependency results and returns True if this node should run
+        :param logger_name: str, if given, a logger is configured with this name and passed to the function
+        :param log_dir: str or Path, directory whose processor_logs/ the logger writes to; defaults to methane_dir
+        """
+        self.name = name
+        self.module = module
+        self.function = function
+        self.depends_on = depends_on if depends_on else []
+        self.run_if = run_if
+        self.logger_name = logger_name
+        self.log_dir = str(log_dir) if log_dir else None
+
+    def __repr__(self):
+        return f'<ProcessorNode {self.name} ({self.module}.{self.function})>'
+
+
+def init_worker(paths):
+    """
+    Initializer for worker processes. Workers are spawned, so they start from a fresh interpreter and inherit nothing
+    from summit.py; this makes the processor directories importable. Database engines are created on first use in each
+    worker. Migrations aren't run here, since summit.py runs them once with warm_engines() before the pool is started,
+    rather than having every worker migrate the same files at once.
+    :param paths: list, of str paths to add to sys.path
+    :return: None
+    """
+    from summit_core import extend_sys_path
+
+    extend_sys_path(paths)
+
+
+def run_processor(module, function, logger_name=None, log_dir=None):
+    """
+    Import and run a processor to completion in the current (worker) process.
+
+    :param module: str, name of the module containing the processor
+    :param function: str, name of the async function to run
+    :param logger_name: str, if given, a logger is configured with this name and passed to the function
+    :param log_dir: str, directory whose processor_logs/ the logger writes to; defaults to methane_dir
+    :return: the return value of the processor, usually a boolean
+    """
+    func = getattr(importlib.import_module(module), function)
+
+    if logger_name:
+        from summit_core import methane_dir, configure_logger
+
+        # methane_dir is where summit.py has always kept the shared logs (dailies, plots, maintenance), so nodes
+        # without a log_dir keep writing there. Workers are reused between cycles, so the logger is only configured
+        # the first time a processor runs in each one, and looked up by name after that
+        logger = logging.getLogger(logger_name)
+        if not logger.handlers:
+            logger = configure_logger(log_dir if log_dir else methane_dir, logger_name)
+        return asyncio.run(func(logger))
+
+    return asyncio.run(func())
+
+
+class ProcessorScheduler:
+    """
+    Runs a graph of ProcessorNodes concurrently in a pool of worker processes. The pool persists between cycles so
+    worker state (imports, database engines) is reused, and is only re-created if a worker process dies.
+    """
+
+    def __init__(self, nodes, max_workers=None):
+        """
+        :param nodes: list, of ProcessorNodes
+        :param max_workers: int, number of worker processes; defaults to one per node, up to the CPU count
+        """
+        self.nodes = {node.name: node for node in nodes}
+        self.order = self.sort_nodes(nodes)
+        self.max_workers = max_workers if max_workers else min(len(nodes), os.cpu_count() or 1)
+        self.executor = None
+
+    @staticmethod
+    def sort_nodes(nodes):
+        """
+        Topologically sort the nodes so every node comes after all of its dependencies.
+
+        :param nodes: list, of ProcessorNodes
+        :return: list, of ProcessorNodes in a valid run order
+        """
+        names = {node.name for node in nodes}
+
+        for node in nodes:
+            for dep in node.depends_on:
+                assert dep in names, f'Node {node.name} depends on {dep}, which is not in the graph.'
+
+        order = []
+        placed = set()
+        remaining = list(nodes)
+
+        while remaining:
+            ready = [node for node in remaining if all(dep in placed for dep in node.depends_on)]
+            assert ready, 'Processor graph contains a dependency cycle.'
+
+            for node in ready:
+                order.append(node)
+                placed.add(node.name)
+                remaining.remove(node)
+
+        return order
+
+    def start(self):
+        """
+        Create the process pool if it doesn't exist yet.
+        :return: None
+        """
+        if self.executor is None:
+            from summit_core import processor_dirs
+            self.executor = ProcessPoolExecutor(max_workers=self.max_workers,
+                                                mp_context=multiprocessing.get_context('spawn'),
+                                                initializer=init_worker,
+                                                initargs=([str(d) for d in processor_dirs],))
+
+    def shutdown(self):
+        """
+        Shut down the process pool, waiting for any running processors.
+        :return: None
+        """
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+
+    async def run_cycle(self, logger):
+        """
+        Run every node in the graph once, starting each as soon as its dependencies have finished.
+
+        :param logger: logging logger to log to
+        :return: dict, of {node name: result}, where skipped nodes have a result of None and failed nodes False
+        """
+        self.start()
+        loop = asyncio.get_event_loop()
+
+        results = {}
+        tasks = {}
+        broken = []
+
+        async def run_node(node):
+            if node.depends_on:
+                await asyncio.gather(*[tasks[dep] for dep in node.depends_on])
+                dep_results = {dep: results.get(dep) for dep in node.depends_on}
+
+                if not node.run_if(dep_results):
+                    logger.info(f'Processor {node.name} skipped; no new data from {", ".join(node.depends_on)}.')
+                    results[node.name] = None
+                    return
+
+            logger.info(f'Starting processor {node.name}.')
+            try:
+                results[node.name] = await loop.run_in_executor(self.executor, run_processor,
+                                                                node.module, node.function, node.logger_name,
+                                                                node.log_dir)
+                logger.info(f'Processor {node.name} finished.')
+            except BrokenProcessPool as e:
+                logger.error(f'Worker process died while running {node.name}; the pool will be re-created.')
+                broken.append(e)
+                results[node.name] = False
+            except Exception as e:
+                logger.error(f'Exception {e.args} occurred while running processor {node.name}.')
+                results[node.name] = False
+
+        for node in self.order:
+            tasks[node.name] = asyncio.ensure_future(run_node(node))
+
+        await asyncio.gather(*tasks.values())
+
+        if broken:
+            self.executor.shutdown(wait=False)
+            self.executor = None
+
+        return results
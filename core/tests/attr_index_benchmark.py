@@ -0,0 +1,141 @@
+"""
+Benchmarks AttrIndex against search_for_attr_value() for the lookup-in-a-loop pattern used by check_load_dailies(),
+load_excel_corrections() and similar call sites, where every item of one list is looked up in another.
+
+search_for_attr_value() scans the list for every lookup, so the loop is O(n*m) and the time of each lookup grows with
+the list. AttrIndex is built once and each lookup is a dict or bisect lookup, so the loop is O(n + m) (or O(n log m)
+for ranges) and the time of each lookup stays roughly flat. Results are checked to be identical to a linear scan, and
+the time per indexed lookup at the largest size is checked to be within max_lookup_growth of the time at the smallest,
+while the list grows 8x. The script exits with status 1 if either check fails.
+
+Run from anywhere inside the project: python core/tests/attr_index_benchmark.py
+"""
+
+import sys
+import time
+import importlib
+import random
+from pathlib import Path
+from types import SimpleNamespace
+
+core = Path(__file__).resolve().parents[1]
+sys.path.append(str(core))
+
+sizes = [500, 1000, 2000, 4000]
+rt_tolerance = .011  # same fuzzy retention time limit as summit_voc.find_approximate_rt()
+index_repeats = 5  # indexed lookups are fast enough to be noisy, so the best of several runs is used
+max_lookup_growth = 3  # allowed growth in time per indexed lookup from the smallest to the largest size; a scan is ~8x
+
+
+def make_files(n):
+    """
+    :param n: int, number of files
+    :return: (list, list) of objects like DailyFiles in the database, and the files found on disk to look up
+    """
+    in_db = [SimpleNamespace(path=Path(f'/data/daily/daily_{i:05d}.txt'), size=i) for i in range(n)]
+    random.shuffle(in_db)
+    on_disk = [SimpleNamespace(path=Path(f'/data/daily/daily_{i:05d}.txt')) for i in range(n + n // 10)]
+    return in_db, on_disk
+
+
+def make_peaks(n):
+    """
+    :param n: int, number of peaks
+    :return: (list, list) of objects like Peaks, and retention times to find approximate matches for
+    """
+    span = n / 50  # keep the density of peaks constant, so about as many lookups find a match at every size
+    peaks = [SimpleNamespace(rt=round(random.uniform(0, span), 3)) for _ in range(n)]
+    rts = [round(random.uniform(0, span), 3) for _ in range(n)]
+    return peaks, rts
+
+
+def exact_scan(in_db, on_disk):
+    from summit_core import search_for_attr_value
+
+    return [search_for_attr_value(in_db, 'path', file.path) for file in on_disk]
+
+
+def exact_index(in_db, on_disk):
+    from summit_core import AttrIndex
+
+    index = AttrIndex(in_db, 'path')
+    return [index.get(file.path) for file in on_disk]
+
+
+def range_scan(peaks, rts):
+    return [next((p for p in peaks if p.rt and rt - rt_tolerance < p.rt < rt + rt_tolerance), None) for rt in rts]
+
+
+def range_index(peaks, rts):
+    from summit_core import AttrIndex
+
+    index = AttrIndex(peaks, 'rt')
+    return [next((p for p in index.between(rt - rt_tolerance, rt + rt_tolerance, inclusive=False) if p.rt), None)
+            for rt in rts]
+
+
+def timed(func, *args, repeats=1):
+    """
+    :param func: function, to time
+    :param args: arguments to call it with
+    :param repeats: int, number of times to call it
+    :return: (result, float) of the last call, and the fastest time in seconds
+    """
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = func(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best
+
+
+def check(name, passed, failures):
+    print(f'{"ok  " if passed else "FAIL"} {name}')
+    return failures if passed else failures + 1
+
+
+def main():
+    if not (core / 'file_locations.json').exists():
+        print(f'{core / "file_locations.json"} is missing, and summit_core reads it on import. Copy the deployed '
+              'one, or create one mapping the file_locations keys summit_core uses to any paths.')
+        return 1
+
+    importlib.import_module('summit_core')  # before anything is timed, so the first timed call doesn't import it
+
+    random.seed(0)
+    failures = 0
+
+    benchmarks = [('exact lookups', make_files, exact_scan, exact_index),
+                  ('range lookups', make_peaks, range_scan, range_index)]
+
+    for name, make, scan, index in benchmarks:
+        print(f'{name}:')
+        per_lookup = {}  # {n: (seconds per scanned lookup, seconds per indexed lookup)}
+        same = True
+
+        for n in sizes:
+            data = make(n)
+            scanned, scan_time = timed(scan, *data)
+            indexed, index_time = timed(index, *data, repeats=index_repeats)
+
+            same &= len(scanned) == len(indexed) and all(a is b for a, b in zip(scanned, indexed))
+
+            per_lookup[n] = (scan_time / len(data[1]), index_time / len(data[1]))
+            print(f'  n={n:>5}: {per_lookup[n][0] * 1e6:8.2f}us per scanned lookup, '
+                  + f'{per_lookup[n][1] * 1e6:6.2f}us per indexed lookup')
+
+        failures = check(f'{name}: AttrIndex returns the same results as a linear scan', same, failures)
+
+        scan_growth = per_lookup[sizes[-1]][0] / per_lookup[sizes[0]][0]
+        index_growth = per_lookup[sizes[-1]][1] / per_lookup[sizes[0]][1]
+        failures = check(f'{name}: time per indexed lookup stays flat from n={sizes[0]} to n={sizes[-1]} '
+                         + f'(x{index_growth:.1f}, against x{scan_growth:.1f} for a scan)',
+                         index_growth < max_lookup_growth, failures)
+
+    print(f'{failures} AttrIndex checks failed.')
+    return failures
+
+
+if __name__ == '__main__':
+    sys.exit(1 if main() else 0)
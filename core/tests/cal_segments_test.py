@@ -0,0 +1,133 @@
+"""
+Checks that find_cal_segments() splits calibration dates into the same events as the find_cal_indices() it replaced in
+find_cal_events(): a new event starts after any gap of more than 60 seconds, and not after a gap of exactly 60. Then
+checks that a CalStateMachine fed the same stream in small chunks closes the same events as one fed it all at once, and
+that it only closes an event once its standard stops running: when the MPV position changes, after a gap, or on close().
+
+Each check prints ok or FAIL, and the script exits with status 1 if any fail.
+
+Run from anywhere, in a checkout of any name: python core/tests/cal_segments_test.py
+"""
+
+import sys
+import random
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+core = Path(__file__).resolve().parents[1]
+sys.path.append(str(core))
+
+t0 = np.datetime64('2020-01-01T00:00:00', 's')
+
+
+def seconds(*offsets):
+    """
+    :param offsets: int, seconds after t0
+    :return: np.ndarray, of datetime64[us]
+    """
+    return (t0 + np.array(offsets, dtype='timedelta64[s]')).astype('datetime64[us]')
+
+
+def picarro_block(offsets, positions):
+    """
+    :param offsets: list, of int seconds after t0
+    :param positions: list, of int MPV positions, parallel to offsets
+    :return: dict, of np.ndarrays by original Picarro column name, like blocks from parse_data_file()
+    """
+    epochs = (seconds(*offsets) - np.datetime64(0, 'us')) / np.timedelta64(1, 's')
+    return {'EPOCH_TIME': epochs, 'MPVPosition': np.array(positions, dtype='float64'),
+            'CO_sync': epochs % 7, 'CO2_dry_sync': epochs % 11, 'CH4_dry_sync': epochs % 13}
+
+
+def feed_all(machine, blocks):
+    """
+    :param machine: CalStateMachine
+    :param blocks: list, of blocks to feed in order
+    :return: list, of (mpv_position, first date, last date, number of points, co values) for every event closed,
+        including the one left open at the end
+    """
+    events = []
+    for block in blocks:
+        events.extend(machine.feed(block))
+    events.extend(machine.close())
+    return [(position, cols['date'][0], cols['date'][-1], len(cols['date']), cols['co'].tolist())
+            for position, cols in events]
+
+
+def check(name, passed, failures):
+    print(f'{"ok  " if passed else "FAIL"} {name}')
+    return failures if passed else failures + 1
+
+
+def main():
+    if not (core / 'file_locations.json').exists():
+        print(f'{core / "file_locations.json"} is missing, and summit_core reads it on import. Copy the deployed '
+              'one, or create one mapping the file_locations keys summit_core uses to any paths.')
+        return 1
+
+    from summit_core import processor_dirs
+
+    for d in processor_dirs:
+        sys.path.append(str(d))
+
+    from summit_picarro import find_cal_segments, find_cal_indices, CalStateMachine
+
+    failures = 0
+    random.seed(0)
+
+    failures = check('a gap of exactly 60s continues an event, and 61s starts a new one',
+                     find_cal_segments(seconds(0, 5, 65, 126, 130)) == [(0, 3), (3, 5)], failures)
+
+    failures = check('no dates gives no events, and one date gives one',
+                     find_cal_segments(seconds()) == [] and find_cal_segments(seconds(0)) == [(0, 1)], failures)
+
+    offsets = np.cumsum([random.choice([1, 5, 5, 5, 60, 61, 3600]) for _ in range(5000)])
+    dates = seconds(*offsets)
+    indices = find_cal_indices(pd.Series(dates))
+    segments = find_cal_segments(dates)
+    failures = check('segments start where find_cal_indices() starts events, and cover every date once',
+                     [start for start, _ in segments[1:]] == indices
+                     and all(prev[1] == seg[0] for prev, seg in zip(segments, segments[1:]))
+                     and segments[0][0] == 0 and segments[-1][1] == len(dates), failures)
+
+    machine = CalStateMachine()
+    first = machine.feed(picarro_block([0, 5, 10, 15], [1, 2, 2, 2]))
+    second = machine.feed(picarro_block([20, 25, 30], [2, 2, 1]))
+    failures = check('an event stays open while its standard runs, across feeds, and closes when the position changes',
+                     first == [] and len(second) == 1 and second[0][0] == 2
+                     and second[0][1]['date'].tolist() == seconds(5, 10, 15, 20, 25).tolist(), failures)
+
+    events = feed_all(CalStateMachine(), [picarro_block([0, 5, 10, 71, 76, 80], [3, 3, 3, 3, 3, 4])])
+    failures = check('a gap of more than 60s on the same position closes the event, and close() closes the last one',
+                     [(e[0], e[3]) for e in events] == [(3, 3), (3, 2), (4, 1)], failures)
+
+    failures = check('ambient and no_sequence data closes no events',
+                     feed_all(CalStateMachine(), [picarro_block([0, 5, 10], [1, 0, 1])]) == [], failures)
+
+    events = feed_all(CalStateMachine(), [picarro_block([10, 0, 5], [2, 2, 2])])
+    failures = check('a block is read in date order, and compound values stay with their dates',
+                     events[0][1:4] == (seconds(0)[0], seconds(10)[0], 3)
+                     and events[0][4] == [(t0.astype(int) + s) % 7 for s in (0, 5, 10)], failures)
+
+    offsets = np.cumsum([random.choice([5, 5, 5, 5, 61]) for _ in range(3000)]).tolist()
+    positions = []
+    while len(positions) < len(offsets):
+        positions.extend([random.choice([0, 1, 1, 2, 3, 4])] * random.randrange(1, 60))
+    positions = positions[:len(offsets)]
+
+    whole = feed_all(CalStateMachine(), [picarro_block(offsets, positions)])
+    bounds = np.cumsum([0] + [random.randrange(1, 100) for _ in range(100)])
+    bounds = sorted(set(np.clip(bounds, 0, len(offsets)).tolist()) | {len(offsets)})
+    chunked = feed_all(CalStateMachine(), [picarro_block(offsets[a:b], positions[a:b])
+                                           for a, b in zip(bounds, bounds[1:])])
+    failures = check(f'feeding {len(offsets)} points in {len(bounds) - 1} chunks closes the same '
+                     + f'{len(whole)} events as feeding them at once', len(whole) > 10 and chunked == whole, failures)
+
+    print(f'{failures} calibration segmentation checks failed.')
+    return failures
+
+
+if __name__ == '__main__':
+    sys.exit(1 if main() else 0)
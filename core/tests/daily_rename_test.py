@@ -0,0 +1,66 @@
+"""
+Checks that add_year_to_daily_file() adds the year to a daily file only once, so the rename it reports to the sync
+directory watcher doesn't cause it to be renamed again and again.
+
+Each check prints ok or FAIL, and the script exits with status 1 if any fail.
+
+Run from anywhere, in a checkout of any name: python core/tests/daily_rename_test.py
+"""
+
+import os
+import sys
+import tempfile
+import datetime as dt
+from pathlib import Path
+
+core = Path(__file__).resolve().parents[1]
+sys.path.append(str(core))
+
+
+def check(name, passed, failures):
+    print(f'{"ok  " if passed else "FAIL"} {name}')
+    return failures if passed else failures + 1
+
+
+def main():
+    if not (core / 'file_locations.json').exists():
+        print(f'{core / "file_locations.json"} is missing, and summit_core reads it on import. Copy the deployed '
+              'one, or create one mapping the file_locations keys summit_core uses to any paths.')
+        return 1
+
+    from summit_core import add_year_to_daily_file
+
+    failures = 0
+    year = dt.datetime.now().year
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = Path(tmpdir) / 'daily_0214.txt'
+        path.write_text('data')
+
+        renamed = add_year_to_daily_file(path)
+        failures = check('a daily file from this year gets the year added',
+                         renamed == Path(tmpdir) / f'daily_0214_{year}.txt' and renamed.exists() and not path.exists(),
+                         failures)
+
+        again = add_year_to_daily_file(renamed)
+        failures = check('renaming the renamed file again gives the same name',
+                         again == renamed and renamed.exists() and len(os.listdir(tmpdir)) == 1, failures)
+
+        named = Path(tmpdir) / f'daily_0215_{year}.txt'
+        named.write_text('data')
+        failures = check('a file already ending in _<year> is not renamed',
+                         add_year_to_daily_file(named) == named and named.exists(), failures)
+
+        old = Path(tmpdir) / 'daily_1231.txt'
+        old.write_text('data')
+        last_year = dt.datetime(year - 1, 12, 31).timestamp()
+        os.utime(old, (last_year, last_year))
+        failures = check('a file last modified in another year is not renamed',
+                         add_year_to_daily_file(old) == old and old.exists(), failures)
+
+    print(f'{failures} daily file rename checks failed.')
+    return failures
+
+
+if __name__ == '__main__':
+    sys.exit(1 if main() else 0)
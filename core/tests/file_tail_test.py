@@ -0,0 +1,99 @@
+"""
+Checks that read_file_tail() returns each complete line of a growing log exactly once: a partially-written last line is
+held back until it's finished, and a log that's truncated or replaced is read again from the start. Then checks that
+find_line_offset() converts the line number check_load_pas() used to store into an offset that resumes reading at the
+same line, without skipping a line that's still being written.
+
+Each check prints ok or FAIL, and the script exits with status 1 if any fail.
+
+Run from anywhere, in a checkout of any name: python core/tests/file_tail_test.py
+"""
+
+import sys
+import tempfile
+from pathlib import Path
+
+core = Path(__file__).resolve().parents[1]
+sys.path.append(str(core))
+
+
+def append(path, text):
+    """
+    :param path: Path, file to append to
+    :param text: str, to append as it is, without adding a newline
+    :return: None
+    """
+    with open(path, 'ab') as f:
+        f.write(text.encode())
+
+
+def check(name, passed, failures):
+    print(f'{"ok  " if passed else "FAIL"} {name}')
+    return failures if passed else failures + 1
+
+
+def main():
+    if not (core / 'file_locations.json').exists():
+        print(f'{core / "file_locations.json"} is missing, and summit_core reads it on import. Copy the deployed '
+              'one, or create one mapping the file_locations keys summit_core uses to any paths.')
+        return 1
+
+    from summit_core import read_file_tail, find_line_offset
+
+    failures = 0
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = Path(tmpdir) / 'data.dat'
+
+        append(path, 'HEADER')
+        header, data, offset, signature, rewritten = read_file_tail(path)
+        failures = check('nothing is read until the header line is complete', (header, data) == (b'', b''), failures)
+
+        append(path, '\nline 1\nline 2\nli')
+        header, data, offset, signature, rewritten = read_file_tail(path, offset, signature)
+        failures = check('complete lines are read, and a partial last line is held back',
+                         header == b'HEADER\n' and data == b'line 1\nline 2\n' and not rewritten, failures)
+
+        header, data, offset, signature, rewritten = read_file_tail(path, offset, signature)
+        failures = check('nothing is read again if the line is still unfinished', data == b'', failures)
+
+        append(path, 'ne 3\nline 4\n')
+        header, data, offset, signature, rewritten = read_file_tail(path, offset, signature)
+        failures = check('the held-back line is read whole once it is finished',
+                         header == b'HEADER\n' and data == b'line 3\nline 4\n' and not rewritten, failures)
+
+        path.write_bytes(b'HEADER\nnew 1\n')
+        header, data, offset, signature, rewritten = read_file_tail(path, offset, signature)
+        failures = check('a truncated file is read again from the start', data == b'new 1\n' and rewritten, failures)
+
+        path.write_bytes(b'HEADER\nNEW 1\nnew 2\nnew 3\n')
+        header, data, offset, signature, rewritten = read_file_tail(path, offset, signature)
+        failures = check('a file replaced by a longer one is read again from the start',
+                         data == b'NEW 1\nnew 2\nnew 3\n' and rewritten, failures)
+
+        log = Path(tmpdir) / 'NMHC_PA.LOG'
+        lines = [f'{n}\t04/09/2019\t08:0{n}:00\t"ethane"\t2.1\t1234.5' for n in range(6)]
+        log.write_text('\n'.join(lines) + '\n')
+
+        offset = find_line_offset(log, 4)
+        _, data, offset, signature, rewritten = read_file_tail(log, offset, header_lines=0)
+        failures = check('an offset from a line number resumes reading at that line, as the line number did',
+                         data.decode().split('\n')[:-1] == lines[4:], failures)
+
+        failures = check('an offset from a line number past the end of the file reads nothing',
+                         read_file_tail(log, find_line_offset(log, 10), header_lines=0)[1] == b''
+                         and find_line_offset(log, 10) == log.stat().st_size, failures)
+
+        append(log, '6\t04/09/2019\t08:06')
+        offset = find_line_offset(log, 7)
+        append(log, ':00\t"ethane"\t2.1\t1234.5\n')
+        _, data, offset, signature, rewritten = read_file_tail(log, offset, header_lines=0)
+        failures = check('an offset from a line number stops before a line that is still being written',
+                         data == b'6\t04/09/2019\t08:06:00\t"ethane"\t2.1\t1234.5\n', failures)
+
+    print(f'{failures} file tail checks failed.')
+    return failures
+
+
+if __name__ == '__main__':
+    sys.exit(1 if main() else 0)
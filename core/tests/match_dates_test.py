@@ -0,0 +1,82 @@
+"""
+Checks that match_dates() pairs dates the way the VOC, methane and Picarro matchers rely on: each candidate is used at
+most once (claimed by dates in date order), matches must be strictly within the tolerance, a candidate at exactly the
+same date is skipped when exact=False, and 'pos'/'neg' only look forward or back.
+
+Each check prints ok or FAIL, and the script exits with status 1 if any fail.
+
+Run from anywhere, in a checkout of any name: python core/tests/match_dates_test.py
+"""
+
+import sys
+import datetime as dt
+from pathlib import Path
+
+core = Path(__file__).resolve().parents[1]
+sys.path.append(str(core))
+
+t0 = dt.datetime(2020, 1, 1, 12)
+
+
+def minutes(*offsets):
+    """
+    :param offsets: int, minutes after t0
+    :return: list, of datetimes
+    """
+    return [t0 + dt.timedelta(minutes=m) for m in offsets]
+
+
+def check(name, passed, failures):
+    print(f'{"ok  " if passed else "FAIL"} {name}')
+    return failures if passed else failures + 1
+
+
+def main():
+    if not (core / 'file_locations.json').exists():
+        print(f'{core / "file_locations.json"} is missing, and summit_core reads it on import. Copy the deployed '
+              'one, or create one mapping the file_locations keys summit_core uses to any paths.')
+        return 1
+
+    from summit_core import match_dates
+
+    failures = 0
+
+    failures = check('each date is matched to its closest candidate, in the order of dates',
+                     match_dates(minutes(21, 0, 10), minutes(9, 1, 20)) == [(0, 2), (1, 1), (2, 0)], failures)
+
+    failures = check('a candidate is only matched once, by the earliest date that claims it',
+                     match_dates(minutes(2, 1), minutes(0, 30)) == [(1, 0)], failures)
+
+    failures = check('a date whose closest candidate is claimed is left unmatched, not given the next closest',
+                     match_dates(minutes(1, 2), minutes(0, 5)) == [(0, 0)], failures)
+
+    failures = check('without one_to_one, a candidate can be matched to every date',
+                     match_dates(minutes(1, 2), minutes(0, 30), one_to_one=False) == [(0, 0), (1, 0)], failures)
+
+    failures = check('matches must be strictly within the tolerance',
+                     match_dates(minutes(0, 10), minutes(5, 20), tolerance=dt.timedelta(minutes=5)) == []
+                     and match_dates(minutes(0), minutes(5), tolerance=dt.timedelta(minutes=6)) == [(0, 0)],
+                     failures)
+
+    failures = check('with exact=False, a candidate at the same date is not a match',
+                     match_dates(minutes(0, 10), minutes(0, 12), exact=False) == [(1, 1)]
+                     and match_dates(minutes(0, 10), minutes(0, 12)) == [(0, 0), (1, 1)], failures)
+
+    failures = check("'pos' only matches candidates at or after the date, and 'neg' at or before",
+                     match_dates(minutes(5), minutes(4, 10), how='pos') == [(0, 1)]
+                     and match_dates(minutes(5), minutes(4, 10), how='neg') == [(0, 0)]
+                     and match_dates(minutes(11), minutes(4, 10), how='pos') == [], failures)
+
+    failures = check('candidate indices refer to the list as given, not sorted',
+                     match_dates(minutes(0, 30), minutes(31, 50, 1)) == [(0, 2), (1, 0)], failures)
+
+    failures = check('None dates and candidates are never matched',
+                     match_dates([None, t0], [None, t0]) == [(1, 1)]
+                     and match_dates(minutes(0), []) == [] and match_dates([], minutes(0)) == [], failures)
+
+    print(f'{failures} match_dates checks failed.')
+    return failures
+
+
+if __name__ == '__main__':
+    sys.exit(1 if main() else 0)
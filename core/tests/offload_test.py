@@ -0,0 +1,107 @@
+"""
+Checks that a stage decorated with offload() never runs twice at once, even after it times out.
+
+A timed-out stage's thread keeps running in the background, so re-invoking the stage before that thread finishes must
+skip it rather than start a second writer against the same database. A stage whose run is cancelled while still queued
+for a thread must not stay locked either. Each check prints ok or FAIL, and the script exits with status 1 if any fail.
+
+Run from anywhere inside the project: python core/tests/offload_test.py
+"""
+
+import sys
+import time
+import asyncio
+import threading
+from pathlib import Path
+
+core = Path(__file__).resolve().parents[1]
+sys.path.append(str(core))
+
+stage_seconds = .5  # how long the slow stage blocks for
+timeout = .1  # offload() timeout, well under stage_seconds so the first run is abandoned
+
+calls = {'started': 0, 'active': 0, 'max_active': 0}
+calls_lock = threading.Lock()
+
+
+async def slow_body():
+    with calls_lock:
+        calls['started'] += 1
+        calls['active'] += 1
+        calls['max_active'] = max(calls['max_active'], calls['active'])
+
+    time.sleep(stage_seconds)  # blocking, like the pandas/SQLAlchemy work in a real stage
+
+    with calls_lock:
+        calls['active'] -= 1
+
+    return True
+
+
+async def queued_body():
+    calls['started'] += 1
+    return True
+
+
+def check(name, passed, failures):
+    print(f'{"ok  " if passed else "FAIL"} {name}')
+    return failures if passed else failures + 1
+
+
+async def run_checks():
+    import summit_core
+    from summit_core import offload, get_blocking_executor
+
+    slow_stage = offload(timeout=timeout)(slow_body)
+    queued_stage = offload(timeout=timeout)(queued_body)
+
+    failures = 0
+
+    first = await slow_stage()
+    failures = check('first run times out and returns False', first is False, failures)
+
+    second = await slow_stage()  # the first run's thread is still sleeping
+    failures = check('re-invoked stage is skipped while the abandoned run is alive',
+                     second is False and calls['started'] == 1, failures)
+
+    await asyncio.sleep(stage_seconds * 2)  # let the abandoned thread finish
+
+    failures = check('stage never ran twice at once', calls['max_active'] == 1, failures)
+
+    third = await slow_stage()  # times out again, but it must have been allowed to start
+    failures = check('stage runs again once the abandoned run has finished', third is False and calls['started'] == 2,
+                     failures)
+
+    await asyncio.sleep(stage_seconds * 2)
+
+    # occupy every worker so queued_stage() times out before it gets a thread and is cancelled in the queue
+    executor = get_blocking_executor()
+    blockers = [executor.submit(time.sleep, stage_seconds) for _ in range(summit_core.blocking_workers)]
+
+    calls['started'] = 0
+    queued = await queued_stage()
+    failures = check('stage cancelled while queued times out', queued is False and calls['started'] == 0, failures)
+
+    for blocker in blockers:
+        blocker.result()
+
+    requeued = await queued_stage()
+    failures = check('stage cancelled while queued is not left locked', requeued is True and calls['started'] == 1,
+                     failures)
+
+    return failures
+
+
+def main():
+    if not (core / 'file_locations.json').exists():
+        print(f'{core / "file_locations.json"} is missing, and summit_core reads it on import. Copy the deployed '
+              'one, or create one mapping the file_locations keys summit_core uses to any paths.')
+        return 1
+
+    failures = asyncio.run(run_checks())
+    print(f'{failures} offload checks failed.')
+    return failures
+
+
+if __name__ == '__main__':
+    sys.exit(1 if main() else 0)
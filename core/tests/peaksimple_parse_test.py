@@ -0,0 +1,93 @@
+"""
+Checks that parse_peaksimple_dates() gives the same dates as strptime with peaksimple_date_format, both for zero-padded
+stamps read on its fast path and for others that fall back to pd.to_datetime(), and that stamps which don't match the
+format (ie, the long 08:05:001 PeakSimple sometimes writes, or the 31st of a 30-day month) are NaT rather than being
+truncated or rolled over. parse_peaksimple_lines() is then checked to drop the peaks of lines it couldn't read.
+
+Each check prints ok or FAIL, and the script exits with status 1 if any fail.
+
+Run from anywhere, in a checkout of any name: python core/tests/peaksimple_parse_test.py
+"""
+
+import sys
+import random
+import datetime as dt
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+core = Path(__file__).resolve().parents[1]
+sys.path.append(str(core))
+
+
+def parse(stamps):
+    """
+    :param stamps: list, of str 'date time' stamps
+    :return: list, of datetime, or None where parse_peaksimple_dates() returned NaT
+    """
+    from summit_core import parse_peaksimple_dates
+
+    dates, times = zip(*(stamp.split(' ') for stamp in stamps))
+    return parse_peaksimple_dates(pd.Series(dates), pd.Series(times)).astype(object).tolist()
+
+
+def check(name, passed, failures):
+    print(f'{"ok  " if passed else "FAIL"} {name}')
+    return failures if passed else failures + 1
+
+
+def main():
+    if not (core / 'file_locations.json').exists():
+        print(f'{core / "file_locations.json"} is missing, and summit_core reads it on import. Copy the deployed '
+              'one, or create one mapping the file_locations keys summit_core uses to any paths.')
+        return 1
+
+    from summit_core import parse_peaksimple_lines, peaksimple_date_format
+
+    failures = 0
+    random.seed(0)
+
+    start = dt.datetime(2018, 1, 1)
+    dates = [start + dt.timedelta(seconds=random.randrange(0, 3 * 365 * 86400)) for _ in range(5000)]
+    padded = [date.strftime(peaksimple_date_format) for date in dates]
+    failures = check('zero-padded stamps are parsed the same as strptime', parse(padded) == dates, failures)
+
+    unpadded = ['4/9/2019 08:05:00', '04/09/2019 8:05:00', '4/9/2019 8:5:0']
+    failures = check('stamps without leading zeros fall back and are still parsed',
+                     parse(unpadded) == [dt.datetime(2019, 4, 9, 8, 5)] * 3, failures)
+
+    failures = check('a stamp longer than the format (ie, 08:05:001) is NaT, not truncated to 08:05:00',
+                     parse(['04/09/2019 08:05:001', '04/09/2019 08:05:00']) == [None, dt.datetime(2019, 4, 9, 8, 5)],
+                     failures)
+
+    failures = check('impossible dates and times are NaT, not rolled over',
+                     parse(['04/31/2019 08:05:00', '02/29/2019 08:05:00', '13/01/2019 08:05:00',
+                            '04/09/2019 24:00:00', '02/29/2020 23:59:59'])
+                     == [None, None, None, None, dt.datetime(2020, 2, 29, 23, 59, 59)], failures)
+
+    failures = check('non-ascii and non-numeric stamps are NaT',
+                     parse(['04/09/2019 08:05:0é', 'ab/cd/efgh ij:kl:mn', '04-09-2019 08:05:00']) == [None] * 3,
+                     failures)
+
+    lines = ['1\t04/09/2019\t08:05:00\t"ethane"\t2.1\t1234.5\t"propane"\t3.2\t567.8\n',
+             '2\t04/09/2019\t08:05:001\t"ethane"\t2.1\t1234.5\n',
+             '3\t04/09/2019\t09:05:00\t"ethane"\t\t1234.5\t"propane"\t3.2\t99\r\n',
+             '4\t04/09/2019\t10:05:00\n']
+    parsed = parse_peaksimple_lines(lines)
+
+    failures = check('parse_peaksimple_lines() returns a date for every line, None where it was unreadable',
+                     parsed.dates == [dt.datetime(2019, 4, 9, 8, 5), None, dt.datetime(2019, 4, 9, 9, 5),
+                                      dt.datetime(2019, 4, 9, 10, 5)], failures)
+
+    failures = check('peaks are returned in line order, without those on unreadable lines or missing an rt or pa',
+                     parsed.line.tolist() == [0, 0, 2] and parsed.name.tolist() == ['ethane', 'propane', 'propane']
+                     and np.allclose(parsed.rt, [2.1, 3.2, 3.2]) and np.allclose(parsed.pa, [1234.5, 567.8, 99]),
+                     failures)
+
+    print(f'{failures} PeakSimple parsing checks failed.')
+    return failures
+
+
+if __name__ == '__main__':
+    sys.exit(1 if main() else 0)
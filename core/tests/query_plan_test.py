@@ -0,0 +1,266 @@
+"""
+Checks that every filtered production query is answered from an index, not a full table scan.
+
+Fresh copies of each processor's database are created in a temporary directory and migrated with the same
+create_tables()/migrate_database() used in production. Every query builder listed in example_queries() is then called
+with example arguments, along with the lookups the relationships in lazy_loads issue, and each query is run through
+EXPLAIN QUERY PLAN. Any plan step that scans a whole table (other than the tables in small_tables) is printed and the
+script exits with status 1, so a new query or a dropped index shows up before the Picarro data table makes it slow.
+
+Run from anywhere, in a checkout of any name: python core/tests/query_plan_test.py
+"""
+
+import re
+import sys
+import inspect
+import tempfile
+from pathlib import Path
+from datetime import datetime
+
+core_dir = Path(__file__).resolve().parents[1]
+
+small_tables = {'config', 'plots', 'standards', 'crfs', 'compound_windows', 'mastercals'}  # tens of rows, scans are ok
+
+example_date = datetime(2020, 1, 1)  # date to build example queries with
+
+# relationships the processors walk for many objects at a time, so their lazy loads need an index too
+lazy_loads = {
+    'summit_voc.sqlite': ['GcRun.peaks', 'NmhcLine.peaklist'],
+    'summit_methane.sqlite': ['GcRun.samples', 'PaLine.peaks'],
+}
+
+
+def import_processors():
+    """
+    Put core and the processor directories on sys.path, and import the modules that define each database.
+
+    :return: dict, of {database filename: module}
+    """
+    sys.path.append(str(core_dir))
+
+    from summit_core import processor_dirs
+
+    for d in processor_dirs:
+        sys.path.append(str(d))
+
+    import summit_core
+    import summit_daily
+    import summit_voc
+    import summit_picarro
+    import summit_methane
+
+    return {
+        'summit_picarro.sqlite': summit_picarro,
+        'summit_voc.sqlite': summit_voc,
+        'summit_methane.sqlite': summit_methane,
+        'summit_daily.sqlite': summit_daily,
+        'summit_core.sqlite': summit_core,
+    }
+
+
+def example_queries(modules):
+    """
+    The production query builders of each database, with example arguments to build them with (after the session, for
+    builders that take one). A builder is listed once for each variant of the query its arguments can produce.
+
+    :param modules: dict, of {database filename: module}, from import_processors()
+    :return: dict, of {database filename: [(builder, example args)]}
+    """
+    core, voc, picarro, methane, daily = (modules[f'summit_{name}.sqlite']
+                                          for name in ('core', 'voc', 'picarro', 'methane', 'daily'))
+    chunk = picarro.correction_chunk_size
+
+    return {
+        'summit_core.sqlite': [
+            (core.config_query, ('Picarro',)),
+            (core.staged_plots_query, ()),
+            (core.uploaded_files_query, (['/a.png', '/b.png'],)),
+            (core.moved_files_query, ('voc',)),
+        ],
+        'summit_daily.sqlite': [
+            (daily.recent_dailies_query, (example_date,)),
+        ],
+        'summit_voc.sqlite': [
+            (voc.log_filenames_query, ()),
+            (core.peaksimple_lines_query, (voc.NmhcLine, [example_date])),
+            (voc.single_lines_query, ()),
+            (voc.single_logs_query, ()),
+            (voc.run_dates_query, ([example_date],)),
+            (voc.unintegrated_runs_query, ()),
+            (voc.recent_run_dates_query, (example_date,)),
+            (voc.pentane_data_query, (example_date,)),
+            (voc.recent_logs_query, (example_date,)),
+            (voc.newest_log_query, ()),
+            (voc.new_logs_query, (example_date,)),
+            (voc.uncorrected_lines_query, ()),
+            (voc.correction_line_query, (1,)),
+            (voc.line_data_query, (1,)),
+        ],
+        'summit_picarro.sqlite': [
+            (picarro.unprocessed_files_query, ()),
+            (picarro.data_file_query, ('file.dat',)),
+            (picarro.data_date_query, (False,)),
+            (picarro.data_date_query, (True,)),
+            (picarro.newest_ambient_query, ()),
+            (picarro.uncalibrated_data_query, (2,)),
+            (picarro.unmatched_cals_query, ('low_std',)),
+            (picarro.cal_id_update_statement, ()),
+            (picarro.assigned_cal_data_query, (2, example_date, example_date)),
+            (picarro.postcal_flag_statement, ()),
+            (picarro.correction_chunk_query, (None, None, example_date, chunk)),
+            (picarro.correction_chunk_query, (example_date, example_date, None, chunk)),
+            (picarro.correction_chunk_query, (None, None, None, chunk, True)),
+            (picarro.correction_chunk_query, (None, None, example_date, chunk, True)),
+            (picarro.correction_update_statement, ()),
+            (picarro.rollup_data_query, (['date', 'co'], example_date, example_date)),
+            (picarro.rollup_delete_statement, ('qc', 300, example_date, example_date)),
+            (picarro.ambient_days_query, ()),
+            (picarro.rollup_days_query, ()),
+            (picarro.rollups_query, (['date', 'co_median'], 300, 'qc', example_date, None)),
+            (picarro.archive_month_query, (example_date, example_date)),
+            (picarro.archive_rows_query, (example_date, example_date)),
+        ],
+        'summit_methane.sqlite': [
+            (core.peaksimple_lines_query, (methane.PaLine, [example_date])),
+            (methane.unmatched_lines_query, ()),
+            (methane.unmatched_runs_query, ()),
+            (methane.unmatched_samples_query, ()),
+            (methane.run_samples_query, (1,)),
+            (methane.line_peaks_query, (1,)),
+            (methane.unquantified_runs_query, ()),
+            (methane.runs_with_medians_query, (True,)),
+            (methane.runs_with_medians_query, (False,)),
+            (methane.newest_run_query, ()),
+            (methane.new_runs_query, (example_date,)),
+        ],
+    }
+
+
+def build_queries(session, examples):
+    """
+    Build each example query.
+
+    :param session: sqlalchemy session, connected to the database
+    :param examples: list, of (builder, example args) for the database, from example_queries()
+    :return: dict, of {name: query or core statement}
+    """
+    queries = {}
+    for builder, example_args in examples:
+        if next(iter(inspect.signature(builder).parameters), None) == 'session':
+            query = builder(session, *example_args)
+        else:
+            query = builder(*example_args)
+
+        queries[f'{builder.__name__}{example_args if example_args else ""}'] = query
+
+    return queries
+
+
+def relationship_queries(session, base, names):
+    """
+    Build the queries that lazy-loading one-to-many relationships issues, ie for run.peaks, since those filter the
+    related table by its foreign key.
+
+    :param session: sqlalchemy session, connected to the database
+    :param base: declarative base of the database's models
+    :param names: list, of 'Model.relationship' names
+    :return: dict, of {name: query}
+    """
+    from sqlalchemy.orm import class_mapper
+
+    models = {name: model for name, model in base._decl_class_registry.items() if isinstance(model, type)}
+
+    queries = {}
+    for name in names:
+        model, key = name.split('.')
+        rel = class_mapper(models[model]).relationships[key]
+
+        query = session.query(rel.mapper)
+        for _, remote in rel.local_remote_pairs:
+            query = query.filter(remote == 1)
+
+        queries[name] = query
+
+    return queries
+
+
+def find_table_scans(engine, query):
+    """
+    Run a query through EXPLAIN QUERY PLAN and return any steps that scan an entire table.
+
+    :param engine: sqlalchemy engine the query is for
+    :param query: sqlalchemy query, or core statement (ie, an update)
+    :return: list, of str plan details for each full table scan
+    """
+    statement = getattr(query, 'statement', query)
+    compiled = statement.compile(dialect=engine.dialect)
+    params = [compiled.params[name] for name in compiled.positiontup]
+
+    con = engine.raw_connection()
+    try:
+        plan = con.cursor().execute(f'EXPLAIN QUERY PLAN {compiled}', params).fetchall()
+    finally:
+        con.close()
+
+    # relationship == None filters are anti-joins, which have to visit every row of the outer table; for those, only
+    # the correlated lookup into the related table needs to be indexed
+    anti_join = any('CORRELATED' in step[-1] for step in plan)
+
+    scans = []
+    for step in plan:
+        detail = step[-1]
+        match = re.match(r'SCAN (?:TABLE )?(\w+)', detail)
+
+        if anti_join and step[1] == 0:
+            continue
+
+        if match and 'USING' not in detail and match.group(1) not in small_tables:
+            scans.append(detail)
+
+    return scans
+
+
+def main():
+    if not (core_dir / 'file_locations.json').exists():
+        print(f'{core_dir / "file_locations.json"} is missing, and summit_core reads it on import. Copy the deployed '
+              'one, or create one mapping the file_locations keys summit_core uses to any paths.')
+        return 1
+
+    modules = import_processors()
+    examples = example_queries(modules)
+
+    from summit_core import connect_to_db, create_tables
+
+    failures = 0
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for filename, module in modules.items():
+            engine, session = connect_to_db(f'sqlite:///{filename}', tmpdir)
+            create_tables(engine, module.Base)
+
+            queries = build_queries(session, examples.get(filename, []))
+
+            if not queries:
+                failures += 1
+                print(f'FAIL {filename}: no example queries are listed in example_queries()')
+
+            queries.update(relationship_queries(session, module.Base, lazy_loads.get(filename, [])))
+
+            for name, query in queries.items():
+                scans = find_table_scans(engine, query)
+
+                if scans:
+                    failures += 1
+                    print(f'FAIL {filename}: {name} -> {"; ".join(scans)}')
+                else:
+                    print(f'ok   {filename}: {name}')
+
+            session.close()
+            engine.dispose()
+
+    print(f'{failures} queries use full table scans.')
+    return failures
+
+
+if __name__ == '__main__':
+    sys.exit(1 if main() else 0)
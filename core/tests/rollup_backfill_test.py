@@ -0,0 +1,123 @@
+"""
+Checks that Picarro data loaded before rollups were kept is rolled up once its database is migrated, so the plots that
+read only rollups show it.
+
+A Picarro database is created as it was before the rollups table existed (at schema version 0, with two days of
+ambient and calibration data separated by a day without any), then migrated with the same create_tables() used in
+production. backfill_rollups() is run against it, and the 5-minute rollups plot_new_data() reads are compared to
+medians of the raw data. The rollups for one day are then deleted to check that a gap between days is filled too. Each
+check prints ok or FAIL, and the script exits with status 1 if any fail.
+
+Run from anywhere, in a checkout of any name: python core/tests/rollup_backfill_test.py
+"""
+
+import sys
+import sqlite3
+import tempfile
+import datetime as dt
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine
+
+core = Path(__file__).resolve().parents[1]
+sys.path.append(str(core))
+
+days = [dt.datetime(2020, 1, 1), dt.datetime(2020, 1, 3)]  # 2020-01-02 has no data, so needs no rollups
+points_per_day = 17280  # one point every 5 seconds
+
+
+def create_old_database(path):
+    """
+    Create a Picarro database with data, as it was before rollups were kept.
+
+    :param path: Path, of the database file to create
+    :return: pd.DataFrame, of the ambient data inserted
+    """
+    from summit_picarro import Base, Rollup, epoch_to_db_dates
+
+    engine = create_engine(f'sqlite:///{path}')
+    Base.metadata.create_all(engine, tables=[t for t in Base.metadata.sorted_tables if t.name != Rollup.__tablename__])
+    engine.dispose()
+
+    rng = np.random.default_rng(0)
+    epochs = np.concatenate([day.replace(tzinfo=dt.timezone.utc).timestamp() + 5 * np.arange(points_per_day)
+                             for day in days])
+    mpv = np.where((epochs // 60) % 360 < 30, 2, 1)  # a half-hour of calibration every six hours
+
+    df = pd.DataFrame({'date': epoch_to_db_dates(epochs), 'mpv_position': mpv, 'instrument_status': 963,
+                       'alarm_status': 0, 'co': rng.normal(100, 5, len(epochs)),
+                       'co2': rng.normal(410, 1, len(epochs)), 'ch4': rng.normal(1900, 5, len(epochs))})
+
+    con = sqlite3.connect(path)
+    con.executemany('INSERT INTO data (date, mpv_position, instrument_status, alarm_status, co, co2, ch4) '
+                    + 'VALUES (?, ?, ?, ?, ?, ?, ?)', df.astype(object).itertuples(index=False))
+    con.commit()
+    assert con.execute('PRAGMA user_version').fetchone()[0] == 0
+    con.close()
+
+    ambient = df.loc[df['mpv_position'] == 1].copy()
+    ambient['date'] = pd.to_datetime(ambient['date'])
+    return ambient
+
+
+def check(name, passed, failures):
+    print(f'{"ok  " if passed else "FAIL"} {name}')
+    return failures if passed else failures + 1
+
+
+def main():
+    if not (core / 'file_locations.json').exists():
+        print(f'{core / "file_locations.json"} is missing, and summit_core reads it on import. Copy the deployed '
+              'one, or create one mapping the file_locations keys summit_core uses to any paths.')
+        return 1
+
+    from summit_core import processor_dirs
+
+    for d in processor_dirs:
+        sys.path.append(str(d))
+
+    from summit_core import connect_to_db, create_tables, dispose_engines
+    from summit_picarro import Base, Rollup, backfill_rollups, query_rollups, rollup_resolutions
+
+    failures = 0
+    resolution = rollup_resolutions['5min']
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        ambient = create_old_database(Path(tmpdir) / 'summit_picarro.sqlite')
+
+        engine, session = connect_to_db('sqlite:///summit_picarro.sqlite', tmpdir)
+        create_tables(engine, Base)
+
+        failures = check('migrated database has no rollups for its existing data',
+                         not len(query_rollups(session, resolution, 'qc')), failures)
+
+        written = backfill_rollups(session)
+        rollups = query_rollups(session, resolution, 'qc', start=days[0], fill_gaps=True).dropna()
+
+        expected = ambient.groupby(ambient['date'].dt.floor(f'{resolution}s'))['co'].median()
+        failures = check('backfill writes rollups for all existing data',
+                         written > 0 and list(rollups['date']) == list(expected.index), failures)
+        failures = check('backfilled rollups match the data', np.allclose(rollups['co_median'], expected), failures)
+
+        failures = check('backfill does nothing once every day is rolled up', backfill_rollups(session) == 0,
+                         failures)
+
+        session.query(Rollup).filter(Rollup.date >= days[1]).delete()
+        session.commit()
+
+        refilled = backfill_rollups(session)
+        rollups = query_rollups(session, resolution, 'qc', start=days[0]).dropna()
+        failures = check('backfill fills a day missing its rollups, and only that day',
+                         0 < refilled < written and list(rollups['date']) == list(expected.index), failures)
+
+        session.close()
+        dispose_engines()
+
+    print(f'{failures} rollup backfill checks failed.')
+    return failures
+
+
+if __name__ == '__main__':
+    sys.exit(1 if main() else 0)
@@ -0,0 +1,170 @@
+"""
+Checks that SftpPool uploads files over one reused SSH connection, reconnects when that connection goes stale, and
+closes everything it opened.
+
+The SSH client, transport and SFTP channels are fakes that keep "remote" files in a dict, so no server or credentials
+are needed. Each check prints ok or FAIL, and the script exits with status 1 if any fail.
+
+Run from anywhere, in a checkout of any name: python core/tests/sftp_pool_test.py
+"""
+
+import sys
+import tempfile
+from pathlib import Path
+
+core = Path(__file__).resolve().parents[1]
+sys.path.append(str(core))
+
+
+class FakeTransport:
+    def __init__(self):
+        self.active = True
+
+    def is_active(self):
+        return self.active
+
+
+class FakeSftp:
+    """
+    An SFTP channel writing to a shared dict of {remote path: bytes}. posix_rename() can be disabled to act like a
+    server without the posix-rename extension, and put() can be made to fail.
+    """
+
+    def __init__(self, server):
+        self.server = server
+        self.closed = False
+
+    def put(self, local, remote):
+        assert not self.closed, 'put() on a closed channel'
+        if self.server.fail_puts:
+            raise IOError('upload failed')
+        self.server.files[remote] = Path(local).read_bytes()
+
+    def posix_rename(self, old, new):
+        if not self.server.posix_rename:
+            raise IOError('posix-rename@openssh.com not supported')
+        self.server.files[new] = self.server.files.pop(old)
+
+    def rename(self, old, new):
+        if new in self.server.files:
+            raise IOError('rename can not overwrite an existing file')
+        self.server.files[new] = self.server.files.pop(old)
+
+    def remove(self, path):
+        del self.server.files[path]
+
+    def close(self):
+        self.closed = True
+
+
+class FakeClient:
+    def __init__(self, server):
+        self.server = server
+        self.transport = FakeTransport()
+        self.closed = False
+
+    def get_transport(self):
+        return self.transport
+
+    def open_sftp(self):
+        sftp = FakeSftp(self.server)
+        self.server.channels.append(sftp)
+        return sftp
+
+    def close(self):
+        self.closed = True
+        self.transport.active = False
+
+
+class FakeServer:
+    def __init__(self):
+        self.files = {}
+        self.clients = []
+        self.channels = []
+        self.posix_rename = True
+        self.fail_puts = False
+
+    def connect(self):
+        client = FakeClient(self)
+        self.clients.append(client)
+        return client
+
+
+def check(name, passed, failures):
+    print(f'{"ok  " if passed else "FAIL"} {name}')
+    return failures if passed else failures + 1
+
+
+def main():
+    if not (core / 'file_locations.json').exists():
+        print(f'{core / "file_locations.json"} is missing, and summit_core reads it on import. Copy the deployed '
+              'one, or create one mapping the file_locations keys summit_core uses to any paths.')
+        return 1
+
+    from summit_core import SftpPool
+
+    failures = 0
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        paths = []
+        for i in range(6):
+            path = Path(tmpdir) / f'plot{i}.png'
+            path.write_bytes(f'plot {i}'.encode())
+            paths.append(path)
+
+        files = [(path, '/web/a' if i % 2 else '/web/b') for i, path in enumerate(paths)]
+
+        server = FakeServer()
+        pool = SftpPool(connect=server.connect, channels=3)
+
+        results = pool.upload_files(files)
+        failures = check('files upload to their remote directories, without temporary files left behind',
+                         all(results) and server.files == {f'{d}/{p.name}': p.read_bytes() for p, d in files},
+                         failures)
+        failures = check('one connection is used for every file and directory, over at most 3 channels',
+                         len(server.clients) == 1 and 0 < len(server.channels) <= 3, failures)
+
+        opened = len(server.channels)
+        pool.upload_files(files)
+        failures = check('a second batch reuses the connection and its open channels',
+                         len(server.clients) == 1 and len(server.channels) == opened, failures)
+
+        stale = server.clients[0]
+        stale.transport.active = False  # ie, the server dropped the connection while it was idle
+        paths[0].write_bytes(b'changed')
+        results = pool.upload_files(files[:1])
+        failures = check('a stale connection is replaced, and the upload succeeds over the new one',
+                         results == [True] and len(server.clients) == 2 and stale.closed
+                         and server.files['/web/b/plot0.png'] == b'changed', failures)
+        failures = check("the stale connection's idle channels are closed",
+                         all(sftp.closed for sftp in server.channels[:opened]), failures)
+
+        server.fail_puts = True
+        results = pool.upload_files(files[:1])
+        failed_channel = server.channels[-1]
+        server.fail_puts = False
+        failures = check('a failed upload returns False and its channel is closed, not reused',
+                         results == [False] and failed_channel.closed, failures)
+
+        server.posix_rename = False
+        paths[1].write_bytes(b'replaced')
+        results = pool.upload_files(files[1:2])
+        failures = check('without posix-rename, the old file is removed and the upload renamed over it',
+                         results == [True] and server.files['/web/a/plot1.png'] == b'replaced'
+                         and not any('.tmp' in remote for remote in server.files), failures)
+
+        pool.close()
+        failures = check('close() closes the connection and every idle channel',
+                         server.clients[-1].closed and all(sftp.closed for sftp in server.channels), failures)
+
+        results = pool.upload_files(files[:1])
+        failures = check('an upload after close() opens a new connection',
+                         results == [True] and len(server.clients) == 3, failures)
+        pool.close()
+
+    print(f'{failures} SFTP pool checks failed.')
+    return failures
+
+
+if __name__ == '__main__':
+    sys.exit(1 if main() else 0)
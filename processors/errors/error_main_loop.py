@@ -53,7 +53,6 @@ def get_last_processor_date(processor, logger):
             val = val[0]
 
     session.close()
-    engine.dispose()
 
     return val
 
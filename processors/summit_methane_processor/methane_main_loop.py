@@ -8,6 +8,7 @@ The per-run logs contain sample pressures, etc; those are associated with pairs
 Some runtime QC is needed to prevent quantification from failed standard runs, poor integrations, etc.
 """
 from summit_errors import send_processor_email
+from summit_core import offload
 from datetime import datetime
 import statistics as s
 import asyncio
@@ -15,6 +16,7 @@ import asyncio
 PROC = 'Methane Processor'
 
 
+@offload(timeout=30 * 60)
 async def check_load_pa_log(logger):
     """
     Read the PA log and create new PaLine objects if possible.
@@ -27,8 +29,9 @@ async def check_load_pa_log(logger):
 
     try:
         from summit_core import methane_LOG_path as pa_filepath
-        from summit_core import connect_to_db, check_filesize, core_dir, Config, split_into_sets_of_n
-        from summit_methane import Base, read_pa_line, PaLine
+        from summit_core import connect_to_db, create_tables, check_filesize, core_dir, Config, config_query
+        from summit_core import save_peaksimple_lines
+        from summit_methane import Base, read_pa_lines
         from summit_core import methane_dir as rundir
         from pathlib import Path
     except ImportError as e:
@@ -38,7 +41,7 @@ async def check_load_pa_log(logger):
 
     try:
         engine, session = connect_to_db('sqlite:///summit_methane.sqlite', rundir)
-        Base.metadata.create_all(engine)
+        create_tables(engine, Base)
     except Exception as e:
         logger.error(f'Exception {e.args} prevented connection to the database in check_load_pa_log()')
         send_processor_email(PROC, exception=e)
@@ -48,7 +51,7 @@ async def check_load_pa_log(logger):
         core_engine, core_session = connect_to_db('sqlite:///summit_core.sqlite', core_dir)
         Config.__table__.create(core_engine, checkfirst=True)
 
-        ch4_config = core_session.query(Config).filter(Config.processor == PROC).one_or_none()
+        ch4_config = config_query(core_session, PROC).one_or_none()
 
         if not ch4_config:
             ch4_config = Config(processor=PROC)  # use all default values except processor on init
@@ -79,61 +82,32 @@ async def check_load_pa_log(logger):
 
         pa_file_contents[:] = [line for line in pa_file_contents if line]
 
-        pa_lines = []
-        for line in pa_file_contents:
-            pa_lines.append(read_pa_line(line))
+        pa_lines = read_pa_lines(pa_file_contents, session=session)  # only lines that aren't in the db yet
 
         if not pa_lines:
             logger.info('No new PaLines found.')
             return False
         else:
-            ct = 0  # count committed logs
-            all_line_dates = [line.date for line in pa_lines]
-
-            # SQLite can't take in clauses with > 1000 variables, so chunk to sets of 500
-            if len(all_line_dates) > 500:
-                sets = split_into_sets_of_n(all_line_dates, 500)
-            else:
-                sets = [all_line_dates]
-                # TODO: Can be reduced to just splitting, this step is done automatically by split_into.
-
-            dates_already_in_db = []
-            for set in sets:
-                set_matches = session.query(PaLine.date).filter(PaLine.date.in_(set)).all()
-                set_matches[:] = [s.date for s in set_matches]
-                dates_already_in_db.extend(set_matches)
-
-            for line in pa_lines:
-                if line.date not in dates_already_in_db:
-                    session.add(line)
-                    logger.info(f'PaLine for {line.date} added.')
-                    ct += 1
-
-            if ct == 0:
-                logger.info('No new PaLines found.')
-            else:
-                logger.info(f'{ct} PaLines added.')
-                session.commit()
+            inserted = save_peaksimple_lines(session, pa_lines, 'peaks')
+            session.commit()
+            logger.info(f'{inserted} PaLines added.')
 
         core_session.merge(ch4_config)
         core_session.commit()
 
         session.close()
-        engine.dispose()
         core_session.close()
-        core_engine.dispose()
         return True
 
     except Exception as e:
         session.close()
-        engine.dispose()
         core_session.close()
-        core_engine.dispose()
         logger.error(f'Exception {e.args} occurred in check_load_pa_log()')
         send_processor_email(PROC, exception=e)
         return False
 
 
+@offload(timeout=30 * 60)
 async def check_load_run_logs(logger):
     """
     Read new log files and create new GcRun and Sample objects if possible.
@@ -145,7 +119,7 @@ async def check_load_run_logs(logger):
     try:
         from summit_core import methane_logs_path
         from summit_core import methane_dir as rundir
-        from summit_core import get_all_data_files, connect_to_db
+        from summit_core import get_all_data_files, connect_to_db, create_tables
         from summit_methane import Base, GcRun, Sample, read_log_file
     except ImportError as e:
         logger.error('ImportError occurred in check_load_run_logs()')
@@ -154,7 +128,7 @@ async def check_load_run_logs(logger):
 
     try:
         engine, session = connect_to_db('sqlite:///summit_methane.sqlite', rundir)
-        Base.metadata.create_all(engine)
+        create_tables(engine, Base)
     except Exception as e:
         logger.error(f'Exception {e.args} prevented connection to the database in check_load_pa_log()')
         send_processor_email(PROC, exception=e)
@@ -192,18 +166,17 @@ async def check_load_run_logs(logger):
                 logger.warning('There were not ten Samples per GcRun as expected.')
 
         session.close()
-        engine.dispose()
         return True
 
     except Exception as e:
         session.close()
-        engine.dispose()
 
         logger.error(f'Exception {e.args} occurred in check_load_pa_log()')
         send_processor_email(PROC, exception=e)
         return False
 
 
+@offload(timeout=30 * 60)
 async def match_runs_to_lines(logger):
     """
     Read new log files and create new GcRun and Sample objects if possible.
@@ -214,8 +187,9 @@ async def match_runs_to_lines(logger):
 
     try:
         from summit_core import methane_dir as rundir
-        from summit_core import connect_to_db
-        from summit_methane import GcRun, PaLine, match_lines_to_runs, Base
+        from summit_core import connect_to_db, create_tables
+        from summit_methane import match_lines_to_runs, Base
+        from summit_methane import unmatched_lines_query, unmatched_runs_query
     except ImportError as e:
         send_processor_email(PROC, exception=e)
         logger.error('ImportError occured in match_runs_to_lines()')
@@ -223,7 +197,7 @@ async def match_runs_to_lines(logger):
 
     try:
         engine, session = connect_to_db('sqlite:///summit_methane.sqlite', rundir)
-        Base.metadata.create_all(engine)
+        create_tables(engine, Base)
     except Exception as e:
         logger.error(f'Exception {e.args} prevented connection to the database in check_load_pa_log()')
         send_processor_email(PROC, exception=e)
@@ -234,8 +208,8 @@ async def match_runs_to_lines(logger):
 
         engine, session = connect_to_db('sqlite:///summit_methane.sqlite', rundir)
 
-        unmatched_lines = session.query(PaLine).filter(PaLine.run == None).all()
-        unmatched_runs = session.query(GcRun).filter(GcRun.pa_line_id == None).all()
+        unmatched_lines = unmatched_lines_query(session).all()
+        unmatched_runs = unmatched_runs_query(session).all()
 
         # married_runs_count = session.query(GcRun).filter(GcRun.status == 'married').count()
 
@@ -257,6 +231,7 @@ async def match_runs_to_lines(logger):
         return False
 
 
+@offload(timeout=30 * 60)
 async def match_peaks_to_samples(logger):
     """
     All detected peaks in a run are attached to NmhcLines, but are not linked to Samples until they've passed certain
@@ -268,8 +243,9 @@ async def match_peaks_to_samples(logger):
 
     try:
         from summit_core import methane_dir as rundir
-        from summit_core import connect_to_db, split_into_sets_of_n
-        from summit_methane import Peak, Sample, GcRun, Base, sample_rts
+        from summit_core import connect_to_db, create_tables, split_into_sets_of_n
+        from summit_methane import Peak, GcRun, Base, sample_rts
+        from summit_methane import unmatched_samples_query, run_samples_query, line_peaks_query
         from operator import attrgetter
         import datetime as dt
     except ImportError as e:
@@ -279,7 +255,7 @@ async def match_peaks_to_samples(logger):
 
     try:
         engine, session = connect_to_db('sqlite:///summit_methane.sqlite', rundir)
-        Base.metadata.create_all(engine)
+        create_tables(engine, Base)
     except Exception as e:
         logger.error(f'Exception {e.args} prevented connection to the database in match_peaks_to_samples()')
         send_processor_email(PROC, exception=e)
@@ -288,7 +264,7 @@ async def match_peaks_to_samples(logger):
     try:
         logger.info('Running match_peaks_to_samples()')
 
-        unmatched_samples = session.query(Sample).filter(Sample.peak_id == None, Sample.run_id != None).all()
+        unmatched_samples = unmatched_samples_query(session).all()
 
         whole_set = list({s.run_id for s in unmatched_samples})
         # SQLite can't take in clauses with > 1000 variables, so chunk to sets of 500
@@ -305,8 +281,8 @@ async def match_peaks_to_samples(logger):
 
         for run in runs_w_unmatched_samples:
             # loop through runs containing samples that haven't been matched with peaks
-            samples = session.query(Sample).filter(Sample.run_id == run.id).all()
-            peaks = session.query(Peak).filter(Peak.pa_line_id == run.pa_line_id)
+            samples = run_samples_query(session, run.id).all()
+            peaks = line_peaks_query(session, run.pa_line_id)
 
             for sample in samples:
                 sn = sample.sample_num
@@ -324,7 +300,6 @@ async def match_peaks_to_samples(logger):
 
         session.commit()
         session.close()
-        engine.dispose()
         return True
 
     except Exception as e:
@@ -333,6 +308,7 @@ async def match_peaks_to_samples(logger):
         return False
 
 
+@offload(timeout=10 * 60)
 async def add_one_standard(logger):
     """
     Add a single standard (the current working one), so that quantifications are possible. VERY TEMPORARY.
@@ -343,7 +319,7 @@ async def add_one_standard(logger):
 
     try:
         from summit_core import methane_dir as rundir
-        from summit_core import connect_to_db
+        from summit_core import connect_to_db, create_tables
         from summit_methane import Standard, Base
     except ImportError as e:
         logger.error('ImportError occurred in add_one_standard()')
@@ -352,7 +328,7 @@ async def add_one_standard(logger):
 
     try:
         engine, session = connect_to_db('sqlite:///summit_methane.sqlite', rundir)
-        Base.metadata.create_all(engine)
+        create_tables(engine, Base)
     except Exception as e:
         logger.error(f'Exception {e.args} prevented connection to the database in check_load_pa_log()')
         send_processor_email(PROC, exception=e)
@@ -370,7 +346,6 @@ async def add_one_standard(logger):
             session.commit()
 
         session.close()
-        engine.dispose()
         return True
 
     except Exception as e:
@@ -379,6 +354,7 @@ async def add_one_standard(logger):
         return False
 
 
+@offload(timeout=30 * 60)
 async def quantify_samples(logger):
     """
     On a per-run basis, use std1 to calc samples 1-5 (~3) and std2 to calculate samples 6-10 (~8). Output warnings
@@ -390,8 +366,8 @@ async def quantify_samples(logger):
 
     try:
         from summit_core import methane_dir as rundir
-        from summit_core import connect_to_db, search_for_attr_value
-        from summit_methane import Standard, GcRun, Base
+        from summit_core import connect_to_db, create_tables, AttrIndex
+        from summit_methane import Standard, Base, unquantified_runs_query
         from summit_methane import calc_ch4_mr, valid_sample
     except Exception as e:
         logger.error('ImportError occurred in qunatify_samples()')
@@ -400,7 +376,7 @@ async def quantify_samples(logger):
 
     try:
         engine, session = connect_to_db('sqlite:///summit_methane.sqlite', rundir)
-        Base.metadata.create_all(engine)
+        create_tables(engine, Base)
     except Exception as e:
         logger.error(f'Exception {e.args} prevented connection to the database in check_load_pa_log()')
         send_processor_email(PROC, exception=e)
@@ -409,7 +385,7 @@ async def quantify_samples(logger):
     try:
         logger.info('Running quantify_samples()')
 
-        unquantified_runs = session.query(GcRun).filter(GcRun.median == None).all()
+        unquantified_runs = unquantified_runs_query(session).all()
 
         ct = 0
         for run in unquantified_runs:
@@ -423,8 +399,9 @@ async def quantify_samples(logger):
 
             if standard is not None:
                 ambients = [sample for sample in samples if (sample.sample_type == 3 and valid_sample(sample))]
-                standard1 = search_for_attr_value(samples, 'sample_num', 2)
-                standard2 = search_for_attr_value(samples, 'sample_num', 7)
+                samples_by_num = AttrIndex(samples, 'sample_num')
+                standard1 = samples_by_num.get(2)
+                standard2 = samples_by_num.get(7)
 
                 if not ambients:
                     logger.warning(f'No ambient samples were quantifiable in GcRun for {run.date}')
@@ -478,12 +455,10 @@ async def quantify_samples(logger):
         if ct:
             logger.info(f'{ct} GcRuns were successfully quantified.')
             session.close()
-            engine.dispose()
             return True
         else:
             logger.info('No GcRuns quantified.')
             session.close()
-            engine.dispose()
             return False
 
     except Exception as e:
@@ -492,6 +467,7 @@ async def quantify_samples(logger):
         return False
 
 
+@offload(timeout=15 * 60)
 async def plot_new_data(logger):
     """
     If newer data exists, plot it going back one week from the day of the plotting.
@@ -502,10 +478,10 @@ async def plot_new_data(logger):
 
     try:
         from pathlib import Path
-        from summit_core import core_dir, Config
+        from summit_core import core_dir, Config, config_query
         from summit_core import methane_dir as rundir
-        from summit_core import connect_to_db, create_daily_ticks, TempDir, Plot, add_or_ignore_plot
-        from summit_methane import Sample, GcRun, Base, plottable_sample, summit_methane_plot
+        from summit_core import connect_to_db, create_tables, create_daily_ticks, TempDir, Plot, add_or_ignore_plot
+        from summit_methane import Sample, Base, plottable_sample, summit_methane_plot, runs_with_medians_query
 
         remotedir = r'/data/web/htdocs/instaar/groups/arl/summit/plots'
 
@@ -516,7 +492,7 @@ async def plot_new_data(logger):
 
     try:
         engine, session = connect_to_db('sqlite:///summit_methane.sqlite', rundir)
-        Base.metadata.create_all(engine)
+        create_tables(engine, Base)
     except Exception as e:
         logger.error(f'Exception {e.args} prevented connection to the database in plot_new_data()')
         send_processor_email(PROC, exception=e)
@@ -527,7 +503,7 @@ async def plot_new_data(logger):
         Plot.__table__.create(core_engine, checkfirst=True)
         Config.__table__.create(core_engine, checkfirst=True)
 
-        ch4_config = core_session.query(Config).filter(Config.processor == PROC).one_or_none()
+        ch4_config = config_query(core_session, PROC).one_or_none()
 
         if not ch4_config:
             ch4_config = Config(processor=PROC)  # use all default values except processor on init
@@ -544,12 +520,7 @@ async def plot_new_data(logger):
 
         engine, session = connect_to_db('sqlite:///summit_methane.sqlite', rundir)
 
-        runs_with_medians = (session.query(GcRun)
-                             .filter(GcRun.median != None)
-                             .filter(GcRun.standard_rsd < .02)
-                             .filter(GcRun.rsd < .02)
-                             .order_by(GcRun.date)
-                             .all())
+        runs_with_medians = runs_with_medians_query(session).all()
 
         last_ambient_date = runs_with_medians[-1].date
         # get date after filtering, ie don't plot if there's no new data getting plotted
@@ -580,23 +551,20 @@ async def plot_new_data(logger):
             logger.info('No new data found to be plotted.')
 
         session.close()
-        engine.dispose()
 
         core_session.commit()
         core_session.close()
-        core_engine.dispose()
         return True
 
     except Exception as e:
         logger.error(f'Exception {e.args} occurred in plot_new_data()')
         send_processor_email(PROC, exception=e)
         core_session.close()
-        core_engine.dispose()
         session.close()
-        engine.dispose()
         return False
 
 
+@offload(timeout=15 * 60)
 async def dual_plot_methane(logger):
     """
     Connects to both the methane [gc] and picarro databases to create an overlayed plot of both data.
@@ -609,12 +577,12 @@ async def dual_plot_methane(logger):
 
     try:
         from pathlib import Path
-        from summit_core import core_dir, Config
+        from summit_core import core_dir, Config, config_query
         from summit_core import methane_dir
         from summit_core import picarro_dir
-        from summit_core import connect_to_db, create_daily_ticks, TempDir, Plot, add_or_ignore_plot
-        from summit_picarro import Datum
-        from summit_methane import Base, GcRun, summit_methane_plot
+        from summit_core import connect_to_db, create_tables, create_daily_ticks, TempDir, Plot, add_or_ignore_plot
+        from summit_picarro import query_rollups, rollup_resolutions, newest_ambient_query
+        from summit_methane import Base, GcRun, summit_methane_plot, runs_with_medians_query
 
         from summit_picarro import Base as PicarroBase
 
@@ -627,10 +595,10 @@ async def dual_plot_methane(logger):
 
     try:
         gc_engine, gc_session = connect_to_db('sqlite:///summit_methane.sqlite', methane_dir)
-        Base.metadata.create_all(gc_engine)
+        create_tables(gc_engine, Base)
 
         picarro_engine, picarro_session = connect_to_db('sqlite:///summit_picarro.sqlite', picarro_dir)
-        PicarroBase.metadata.create_all(picarro_engine)
+        create_tables(picarro_engine, PicarroBase)
     except Exception as e:
         logger.error(f'Exception {e.args} prevented connection to the database in dual_plot_methane()')
         send_processor_email(PROC, exception=e)
@@ -641,7 +609,7 @@ async def dual_plot_methane(logger):
         Plot.__table__.create(core_engine, checkfirst=True)
         Config.__table__.create(core_engine, checkfirst=True)
 
-        twoplot_config = core_session.query(Config).filter(Config.processor == PROC).one_or_none()
+        twoplot_config = config_query(core_session, PROC).one_or_none()
 
         if not twoplot_config:
             twoplot_config = Config(processor=PROC)  # use all default values except processor on init
@@ -656,17 +624,11 @@ async def dual_plot_methane(logger):
     try:
         logger.info('Running dual_plot_methane()')
 
-        newest_picarro_data_point = (picarro_session.query(Datum.date)
-            .filter(Datum.mpv_position == 1)
-            .order_by(Datum.date.desc())
-            .first()[0])
+        newest_picarro_data_point = newest_ambient_query(picarro_session).first()[0]
         try:
-            newest_gc_data_point = (gc_session.query(GcRun.date)
-                .filter(GcRun.median != None)
-                .filter(GcRun.standard_rsd < .02)
-                .filter(GcRun.rsd < .02)
-                .order_by(GcRun.date.desc())
-                .first()[0])
+            newest_gc_data_point = (runs_with_medians_query(gc_session, newest_first=True)
+                                    .with_entities(GcRun.date)
+                                    .first()[0])
         except TypeError:
             logger.error('NoneType not subscriptable encountered due to lack of methane data to query.')
             from summit_errors import send_processor_warning
@@ -683,33 +645,24 @@ async def dual_plot_methane(logger):
         if newest_data_point <= twoplot_config.last_data_date:
             logger.info('No new data was found to plot.')
             core_session.close()
-            core_engine.dispose()
             picarro_session.close()
-            picarro_engine.dispose()
             return False
 
         date_limits, major_ticks, minor_ticks = create_daily_ticks(twoplot_config.days_to_plot)
 
         if newest_data_point > twoplot_config.last_data_date:
 
-            runs_with_medians = (gc_session.query(GcRun)
-                                 .filter(GcRun.median != None)
-                                 .filter(GcRun.standard_rsd < .02)
-                                 .filter(GcRun.rsd < .02)
-                                 .order_by(GcRun.date)
-                                 .all())
+            runs_with_medians = runs_with_medians_query(gc_session).all()
 
             gc_dates = [run.date for run in runs_with_medians]
             gc_ch4 = [run.median for run in runs_with_medians]
 
-            picarro_data = (picarro_session.query(Datum.date, Datum.ch4)
-                            .filter((Datum.mpv_position == 0) | (Datum.mpv_position == 1))
-                            .filter((Datum.instrument_status == 963), (Datum.alarm_status == 0))
-                            .filter(Datum.date >= date_limits['left'])
-                            .all())  # grab only data that falls in plotting period
+            # 5-minute medians of QC'd Picarro data that falls in the plotting period
+            picarro_data = query_rollups(picarro_session, rollup_resolutions['5min'], 'qc',
+                                         start=date_limits['left'], fill_gaps=True)
 
-            picarro_dates = [p.date for p in picarro_data]
-            picarro_ch4 = [p.ch4 for p in picarro_data]
+            picarro_dates = picarro_data['date'].dt.to_pydatetime().tolist()
+            picarro_ch4 = picarro_data['ch4_median'].tolist()
 
             with TempDir(methane_dir / 'plots'):
                 name = summit_methane_plot(None, {'Summit Methane [Picarro]': [picarro_dates, picarro_ch4],
@@ -732,15 +685,12 @@ async def dual_plot_methane(logger):
             logger.info('No new data found to be plotted.')
 
         gc_session.close()
-        gc_engine.dispose()
 
         picarro_session.close()
-        picarro_engine.dispose()
 
         core_session.commit()
 
         core_session.close()
-        core_engine.dispose()
         return True
 
     except Exception as e:
@@ -748,16 +698,14 @@ async def dual_plot_methane(logger):
         send_processor_email(PROC, exception=e)
 
         core_session.close()
-        core_engine.dispose()
 
         gc_session.close()
-        gc_engine.dispose()
 
         picarro_session.close()
-        picarro_engine.dispose()
         return False
 
 
+@offload(timeout=15 * 60)
 async def update_excel_sheet(logger):
     """
     This checks for new GcRuns since it was last ran and creates a DataFrame containing run information that's appended
@@ -777,8 +725,9 @@ async def update_excel_sheet(logger):
         from summit_core import methane_dir as rundir
         from summit_errors import send_processor_warning
 
-        from summit_methane import GcRun, Base, add_formulas_and_format_sheet
-        from summit_core import Config, connect_to_db, append_df_to_excel
+        from summit_methane import Base, add_formulas_and_format_sheet
+        from summit_methane import newest_run_query, new_runs_query
+        from summit_core import Config, config_query, connect_to_db, create_tables, append_df_to_excel
         from summit_core import methane_dir, core_dir, data_file_paths
 
         methane_sheet = data_file_paths.get('methane_sheet', None)
@@ -797,7 +746,7 @@ async def update_excel_sheet(logger):
 
     try:
         engine, session = connect_to_db('sqlite:///summit_methane.sqlite', rundir)
-        Base.metadata.create_all(engine)
+        create_tables(engine, Base)
     except Exception as e:
         logger.error(f'Exception {e.args} prevented connection to the database in update_excel_sheet()')
         send_processor_email(PROC, exception=e)
@@ -807,7 +756,7 @@ async def update_excel_sheet(logger):
         core_engine, core_session = connect_to_db('sqlite:///summit_core.sqlite', core_dir)
         Config.__table__.create(core_engine, checkfirst=True)
 
-        methane_sheet_config = core_session.query(Config).filter(Config.processor == 'methane_sheet').one_or_none()
+        methane_sheet_config = config_query(core_session, 'methane_sheet').one_or_none()
 
         if not methane_sheet_config:
             methane_sheet_config = Config(processor='methane_sheet')
@@ -821,7 +770,7 @@ async def update_excel_sheet(logger):
         return False
 
     try:
-        most_recent_gcrun = session.query(GcRun.date).order_by(GcRun.date.desc()).first()
+        most_recent_gcrun = newest_run_query(session).first()
 
         if not most_recent_gcrun:
             most_recent_gcrun = datetime(1900, 1, 1)  # default to a safely historic date
@@ -829,7 +778,7 @@ async def update_excel_sheet(logger):
             most_recent_gcrun = most_recent_gcrun.date  # get date from tuple response
 
         # object list of all the runs past the most recent date
-        new_runs = session.query(GcRun).filter(GcRun.date > methane_sheet_config.last_data_date).all()
+        new_runs = new_runs_query(session, methane_sheet_config.last_data_date).all()
 
         if new_runs:
             col_list = ['date', 'filename', 'peak1', 'peak2', 'mr1', 'mr2', 'run_median', 'run_rsd', 'std_median',
@@ -864,21 +813,18 @@ async def update_excel_sheet(logger):
         core_session.commit()
 
         session.close()
-        engine.dispose()
         core_session.close()
-        core_engine.dispose()
         return True
 
     except Exception as e:
         session.close()
-        engine.dispose()
         core_session.close()
-        core_engine.dispose()
         logger.error(f'Exception {e.args} occurred in update_excel_sheet()')
         send_processor_email(PROC, exception=e)
         return False
 
 
+@offload(timeout=15 * 60)
 async def read_excel_sheet(logger):
     logger.info('Running update_excel_sheet()')
 
@@ -890,7 +836,7 @@ async def read_excel_sheet(logger):
         from summit_errors import send_processor_warning
 
         from summit_methane import GcRun, Base, add_formulas_and_format_sheet
-        from summit_core import Config, connect_to_db, append_df_to_excel
+        from summit_core import Config, config_query, connect_to_db, create_tables, append_df_to_excel
         from summit_core import methane_dir, core_dir, data_file_paths
 
         methane_sheet = data_file_paths.get('methane_sheet', None)
@@ -909,7 +855,7 @@ async def read_excel_sheet(logger):
 
     try:
         engine, session = connect_to_db('sqlite:///summit_methane.sqlite', rundir)
-        Base.metadata.create_all(engine)
+        create_tables(engine, Base)
     except Exception as e:
         logger.error(f'Exception {e.args} prevented connection to the database in update_excel_sheet()')
         send_processor_email(PROC, exception=e)
@@ -919,9 +865,7 @@ async def read_excel_sheet(logger):
         core_engine, core_session = connect_to_db('sqlite:///summit_core.sqlite', core_dir)
         Config.__table__.create(core_engine, checkfirst=True)
 
-        methane_sheet_read_config = (core_session.query(Config)
-                                                 .filter(Config.processor == 'methane_sheet_read')
-                                                 .one_or_none())
+        methane_sheet_read_config = config_query(core_session, 'methane_sheet_read').one_or_none()
 
         if not methane_sheet_read_config:
             methane_sheet_read_config = Config(processor='methane_sheet_read')
@@ -940,16 +884,12 @@ async def read_excel_sheet(logger):
         core_session.commit()
 
         session.close()
-        engine.dispose()
         core_session.close()
-        core_engine.dispose()
         return True
 
     except Exception as e:
         session.close()
-        engine.dispose()
         core_session.close()
-        core_engine.dispose()
         logger.error(f'Exception {e.args} occurred in update_excel_sheet()')
         send_processor_email(PROC, exception=e)
         return False
@@ -238,47 +238,110 @@ class Datum():
     pass
 
 
-def read_pa_line(line):
+def unmatched_lines_query(session):
     """
-    Takes one line as a string from a PeakSimple log, and processes it in Peak objects and an NmhcLine containing those
-    peaks. (This one is a minor modification of the one in summit_voc.py)
-    :param line: string, one line of data from VOC.LOG, NMHC_PA.LOG, etc.
-    :return: NmhcLine or None
+    :param session: Sqlalchemy session()
+    :return: Query, for PaLines that haven't been matched to a GcRun
     """
+    return session.query(PaLine).filter(PaLine.run == None)
 
-    ls = line.split('\t')
-    line_peaks = []
 
-    line_date = datetime.strptime(ls[1] + ' ' + ls[2], '%m/%d/%Y %H:%M:%S')
+def unmatched_runs_query(session):
+    """
+    :param session: Sqlalchemy session()
+    :return: Query, for GcRuns that haven't been matched to a PaLine
+    """
+    return session.query(GcRun).filter(GcRun.pa_line_id == None)
 
-    for ind, item in enumerate(ls[3:]):
 
-        ind = ind + 3  # offset ind since we're working with ls[3:]
+def unmatched_samples_query(session):
+    """
+    :param session: Sqlalchemy session()
+    :return: Query, for Samples in a GcRun that haven't been matched to a Peak
+    """
+    return session.query(Sample).filter(Sample.peak_id == None, Sample.run_id != None)
 
-        peak_dict = dict()
 
-        if '"' in item:
+def run_samples_query(session, run_id):
+    """
+    :param session: Sqlalchemy session()
+    :param run_id: int, id of the GcRun
+    :return: Query, for the Samples in the GcRun
+    """
+    return session.query(Sample).filter(Sample.run_id == run_id)
 
-            peak_dict['name'] = item.strip('"')  # can't fail, " is definitely there
 
-            try:
-                peak_dict['rt'] = float(ls[ind + 1])
-            except:
-                peak_dict['rt'] = None
-            try:
-                peak_dict['pa'] = float(ls[ind + 2])
-            except:
-                peak_dict['pa'] = None
+def line_peaks_query(session, pa_line_id):
+    """
+    :param session: Sqlalchemy session()
+    :param pa_line_id: int, id of the PaLine
+    :return: Query, for the Peaks in the PaLine
+    """
+    return session.query(Peak).filter(Peak.pa_line_id == pa_line_id)
 
-            if None not in peak_dict.values():
-                line_peaks.append(Peak(peak_dict['name'], peak_dict['pa'], peak_dict['rt']))
 
-    if len(line_peaks) == 0:
-        this_line = None
-    else:
-        this_line = PaLine(line_date, line_peaks)
+def unquantified_runs_query(session):
+    """
+    :param session: Sqlalchemy session()
+    :return: Query, for GcRuns that haven't been quantified
+    """
+    return session.query(GcRun).filter(GcRun.median == None)
+
+
+def runs_with_medians_query(session, newest_first=False):
+    """
+    :param session: Sqlalchemy session()
+    :param newest_first: boolean, order by date descending instead of ascending
+    :return: Query, for quantified GcRuns with RSDs under 2%, by date
+    """
+    return (session.query(GcRun)
+            .filter(GcRun.median != None)
+            .filter(GcRun.standard_rsd < .02)
+            .filter(GcRun.rsd < .02)
+            .order_by(GcRun.date.desc() if newest_first else GcRun.date))
+
+
+def newest_run_query(session):
+    """
+    :param session: Sqlalchemy session()
+    :return: Query, for the date of the newest GcRun
+    """
+    return session.query(GcRun.date).order_by(GcRun.date.desc()).limit(1)
+
+
+def new_runs_query(session, after):
+    """
+    :param session: Sqlalchemy session()
+    :param after: datetime, only GcRuns after this date are included
+    :return: Query, for GcRuns after the date
+    """
+    return session.query(GcRun).filter(GcRun.date > after)
+
+
+def read_pa_lines(lines, session=None):
+    """
+    Takes many lines as strings from CH4.LOG, and processes them into PaLines containing their Peaks. Only new lines
+    are returned; see summit_core.read_peaksimple_lines().
+
+    :param lines: list, of strings of data from CH4.LOG
+    :param session: sqlalchemy session, to check for PaLines that are already in the database
+    :return: list, of new PaLines, in the order of lines
+    """
+    from summit_core import read_peaksimple_lines
 
-    return this_line
+    return read_peaksimple_lines(lines, PaLine, lambda date, peaks: PaLine(date, [Peak(*peak) for peak in peaks]),
+                                 session=session)
+
+
+def read_pa_line(line):
+    """
+    Takes one line as a string from a PeakSimple log, and processes it in Peak objects and a PaLine containing those
+    peaks. Use read_pa_lines() for more than one line.
+    :param line: string, one line of data from CH4.LOG
+    :return: PaLine or None
+    """
+    lines = read_pa_lines([line])
+    return lines[0] if lines else None
 
 
 def read_log_file(path):
@@ -342,45 +405,37 @@ def read_log_file(path):
 def match_lines_to_runs(lines, runs):
     """
     This takes a list of PaLine and GcRun objects and matched them by date, within a tolerance.
-    When matching objects, it WILL modify their parameters and status if warranted.
+    When matching objects, it WILL modify their parameters and status if warranted. Each run is matched to at most one
+    line.
 
     :param lines: list, of PaLine objects that are unmatched
     :param runs: list, of GcRun objects that are unmatched
     :return: (lines, runs, match_count) list of line objects, list of run objects, and int of runs that were matched
     """
     match_count = 0
-    from summit_core import find_closest_date, search_for_attr_value
+    from summit_core import match_dates
 
     logger = logging.getLogger(__name__)
 
-    for line in lines:
-        # For each log, attempt to find matching NmhcLine
-        # unpack date attr from all NmhcLines provided
-        run_dates = [run.date for run in runs]
+    # Valid matches *usually* *HAD* ~03:22 difference
+    # on 6/12/2019, the sequence was changed, which resulted in differences ranging from 15 min to 55 min.
+    # on 6/20/2019 a handful of runs were ~60 min after, so the tolerance was upped to 70 min
+    pairs = match_dates([line.date for line in lines], [run.date for run in runs],
+                        tolerance=dt.timedelta(minutes=70), exact=False)
 
-        [match, diff] = find_closest_date(line.date, run_dates)  # get matching date and it's difference
+    for line_ind, run_ind in pairs:
+        line = lines[line_ind]
+        matched_run = runs[run_ind]
 
-        if not match or not diff:
-            continue
+        line.status = 'married'
+        matched_run.status = 'married'
 
-        if abs(diff) < dt.timedelta(minutes=70):
-            # Valid matches *usually* *HAD* ~03:22 difference
-            # on 6/12/2019, the sequence was changed, which resulted in differences ranging from 15 min to 55 min.
-            # on 6/20/2019 a handful of runs were ~60 min after, so the tolerance was upped to 70 min
+        for peak in line.peaks:
+            peak.run = matched_run  # relate all peaks in pa line to the newly matched run
 
-            matched_run = search_for_attr_value(runs, 'date', match)  # pull matching NmhcLine
-
-            line.status = 'married'
-            matched_run.status = 'married'
-
-            for peak in line.peaks:
-                peak.run = matched_run  # relate all peaks in pa line to the newly matched run
-
-            matched_run.pa_line = line
-            logger.info(f'PaLine {line.date} matched to GcRun for {matched_run.date}.')
-            match_count += 1
-        else:
-            continue
+        matched_run.pa_line = line
+        logger.info(f'PaLine {line.date} matched to GcRun for {matched_run.date}.')
+        match_count += 1
 
     return (lines, runs, match_count)
 
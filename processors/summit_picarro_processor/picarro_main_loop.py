@@ -1,9 +1,8 @@
 import asyncio
 import datetime as dt
-import pandas as pd
 from summit_errors import send_processor_email
+from summit_core import offload
 
-from pandas.errors import EmptyDataError
 
 # async def fake_move_data(directory, sleeptime):
 # 	"""
@@ -35,7 +34,12 @@ from pandas.errors import EmptyDataError
 
 PROC = 'Picarro Processor'
 
+archive_interval = dt.timedelta(hours=24)  # minimum time between updates of the Parquet data archive
 
+rollups_checked = False  # set once check_rollups() has backfilled any missing rollups in this process
+
+
+@offload(timeout=60 * 60)
 async def check_load_new_data(logger):
     """
     Checks for new files, checks length of old ones for updates, and processes/commits new data to the database.
@@ -49,12 +53,11 @@ async def check_load_new_data(logger):
     try:
         from summit_core import picarro_logs_path as data_path
         from summit_core import picarro_dir as rundir
-        from summit_core import connect_to_db, get_all_data_files, check_filesize
-        from summit_picarro import Base, DataFile, Datum
+        from summit_core import connect_to_db, create_tables, get_all_data_files, check_filesize
+        from summit_picarro import Base, DataFile, insert_data, parse_data_files, update_rollups
+        from summit_picarro import unprocessed_files_query, data_file_query
         from sqlalchemy.orm.exc import MultipleResultsFound
         from summit_errors import EmailTemplate, sender, processor_email_list
-
-        from pandas.errors import ParserError
     except ImportError as e:
         logger.error('ImportError occurred in check_load_new_data()')
         send_processor_email(PROC, exception=e)
@@ -62,31 +65,30 @@ async def check_load_new_data(logger):
 
     try:
         engine, session = connect_to_db('sqlite:///summit_picarro.sqlite', rundir)
-        Base.metadata.create_all(engine)
+        create_tables(engine, Base)
     except Exception as e:
         logger.error(f'Exception {e.args} caused database connection to fail in check_load_new_data()')
         send_processor_email(PROC, exception=e)
         return False
 
     try:
-        db_files = session.query(DataFile)
-        db_filenames = [d.name for d in db_files.all()]
+        db_filenames = [d.name for d in session.query(DataFile).all()]
 
         all_available_files = get_all_data_files(data_path, '.dat')
 
-        files_to_process = session.query(DataFile).filter(DataFile.processed == False).all()
+        files_to_process = unprocessed_files_query(session).all()
 
         for file in all_available_files:
             try:
-                db_match = db_files.filter(DataFile._name == file.name).one_or_none()
+                db_match = data_file_query(session, file.name).one_or_none()
             except MultipleResultsFound:
                 logger.warning(f'Multiple results found for file {file.name}. The first was used.')
-                db_match = db_files.filter(DataFile._name == file.name).first()
+                db_match = data_file_query(session, file.name).first()
 
             if file.name not in db_filenames:
                 files_to_process.append(DataFile(file))
-            elif check_filesize(file) > db_match.size:
-                # if a matching file was found and it's now bigger, append for processing
+            elif check_filesize(file) != db_match.size:
+                # if a matching file was found and it's now bigger (or was rewritten), append for processing
                 logger.info(f'File {file.name} had more data and was added for procesing.')
                 files_to_process.append(db_match)
 
@@ -99,77 +101,71 @@ async def check_load_new_data(logger):
             logger.info(f'File {file.name} added for processing.')
         session.commit()
 
-        for file in files_to_process:
-            try:
-                df = pd.read_csv(file.path, delim_whitespace=True)
-            except EmptyDataError as e:
-                logger.error(f'Exception {e.args} occurred while reading {file.name}')
-                send_processor_email(PROC, exception=e)
-                continue
-            except ParserError as e:
-                logger.error(f'Pandas ParserError occurred while reading {file.name}.')
+        blocks = parse_data_files([(file.path, file.read_offset, file.signature) for file in files_to_process])
+
+        loaded_epochs = []  # (first, last) epoch time of data in each file, for updating rollups
+
+        for file, block in zip(files_to_process, blocks):
+            if block['error']:
+                logger.error('Exception occurred in check_load_new_data() while reading a file. '
+                             + f'The file was {file.name}')
                 from summit_errors import send_processor_warning
-                try:
-                    df = pd.read_csv(file.path, delim_whitespace=True, error_bad_lines=False)
-                    send_processor_warning(PROC, 'Dataframe',
-                                           (f'The Picarro Processor failed to read file {file.name} '
-                                            + 'It was re-parsed, skipping unreadable lines, but should be'
-                                            + ' investigated.'))
-
-                except Exception as e:
-                    logger.error(f'Exception {e.args} occurred in check_load_new_data() while reading a file.'
-                                 + f' The file was {file.name}')
-                    send_processor_email(PROC, exception=e)
-                    continue
-            except Exception as e:
-                logger.error(f'Exception {e.args} occurred in check_load_new_data() while reading a file.'
-                             + f' The file was {file.name}')
-                send_processor_email(PROC, exception=e)
+                send_processor_warning(PROC, 'File Read',
+                                       (f'The Picarro Processor failed to read file {file.name}, and will retry it '
+                                        + f'next run. The error was:\n{block["error"]}'))
                 continue
 
-            original_length = len(df)
+            if block['rewritten']:
+                logger.warning(f'File {file.name} was rewritten since it was last read, and was re-read.')
 
-            df.dropna(axis=0, how='any', inplace=True)
-
-            new_length = len(df)
-            diff = original_length - new_length
+            if block['bad_lines']:
+                logger.error(f'Pandas ParserError occurred while reading {file.name}.')
+                from summit_errors import send_processor_warning
+                send_processor_warning(PROC, 'Dataframe',
+                                       (f'The Picarro Processor failed to read file {file.name} '
+                                        + 'It was re-parsed, skipping unreadable lines, but should be'
+                                        + ' investigated.'))
 
-            if diff:
-                logger.warning(f'Dataframe contained {diff} null values in {file.name}.')
+            if block['dropped']:
+                logger.warning(f'Dataframe contained {block["dropped"]} null values in {file.name}.')
                 from summit_errors import send_processor_warning
 
                 send_processor_warning(PROC, 'DataFrame',
-                                       (f'The Picarro Processor cut {diff} lines from a dataframe after reading it.\n'
-                                        + f'{file.name} should be investigated and cleaned if necessary.'))
-
-            # CO2 stays in ppm
-            df['CO_sync'] *= 1000  # convert CO to ppb
-            df['CH4_sync'] *= 1000  # convert CH4 to ppb
-            df['CH4_dry_sync'] *= 1000
-
-            df_list = df.to_dict('records')  # convert to list of dicts
-
-            data_list = []
-            for line in df_list:
-                data_list.append(Datum(line))
-
-            if data_list:
-                data_dates = [d.date for d in data_list]
-                dates_already_in_db = session.query(Datum.date).filter(Datum.date.in_(data_dates)).all()
-                dates_already_in_db[:] = [d.date for d in dates_already_in_db]
-
-                for d in data_list:
-                    if d.date not in dates_already_in_db:
-                        d.file_id = file.id  # relate Datum to the file it originated in
-                        session.add(d)
+                                       (f'The Picarro Processor cut {block["dropped"]} lines from a dataframe after '
+                                        + f'reading it.\n{file.name} should be investigated and cleaned if '
+                                        + 'necessary.'))
+
+            data = block['data']
+
+            if data:
+                inserted = insert_data(session, data, file.id)  # rows with dates already in the db are ignored
+                if len(data['EPOCH_TIME']):
+                    loaded_epochs.append((data['EPOCH_TIME'].min(), data['EPOCH_TIME'].max()))
+                logger.info(f'{inserted} new data points loaded from file {file.name}, '
+                            + f'{len(data["EPOCH_TIME"]) - inserted} were already in the database.')
             else:
                 logger.info(f'No new data created from file {file.name}.')
 
             file.processed = True
             file.size = check_filesize(file.path)
+            file.read_offset = block['offset']
+            file.signature = block['signature']
             logger.info(f'All data in file {file.name} processed.')
             session.commit()
 
+        spans = []  # [first, last] datetimes of loaded data, merged where files share a day so it's rolled up once
+        for first, last in sorted(loaded_epochs):
+            first, last = dt.datetime.utcfromtimestamp(first), dt.datetime.utcfromtimestamp(last)
+            if spans and first.date() <= spans[-1][1].date():
+                spans[-1][1] = max(spans[-1][1], last)
+            else:
+                spans.append([first, last])
+
+        if spans:
+            written = sum(update_rollups(session, first, last) for first, last in spans)
+            session.commit()
+            logger.info(f'{written} rollups were updated for new data.')
+
         return True
 
     except Exception as e:
@@ -177,7 +173,11 @@ async def check_load_new_data(logger):
         send_processor_email(PROC, exception=e)
         return False
 
+    finally:
+        session.close()
+
 
+@offload(timeout=30 * 60)
 async def find_cal_events(logger):
     """
     Searches the existing data for unused calibration data and creates/commits CalEvents if possible.
@@ -188,10 +188,13 @@ async def find_cal_events(logger):
 
     logger.info('Running find_cal_events()')
     try:
-        from summit_core import connect_to_db
+        from summit_core import connect_to_db, create_tables
         from summit_core import picarro_dir as rundir
-        from summit_picarro import Base, Datum, CalEvent, mpv_converter, find_cal_indices
-        from summit_picarro import log_event_quantification, filter_postcal_data
+        import numpy as np
+        from summit_picarro import Base, CalEvent, mpv_converter, query_cal_data, find_cal_segments
+        from summit_picarro import assign_cal_ids, quantify_cal_event, cal_positions, min_cal_seconds
+        from summit_picarro import log_event_quantification, get_postcal_window, flag_postcal_data, update_rollups
+        from summit_picarro import data_date_query
     except Exception as e:
         logger.error('ImportError occured in find_cal_events()')
         send_processor_email(PROC, exception=e)
@@ -199,73 +202,61 @@ async def find_cal_events(logger):
 
     try:
         engine, session = connect_to_db('sqlite:///summit_picarro.sqlite', rundir)
-        Base.metadata.create_all(engine)
+        create_tables(engine, Base)
     except Exception as e:
         logger.error(f'Exception {e.args} occurred in find_cal_events()')
         send_processor_email(PROC, exception=e)
         return False
 
     try:
-        standard_data = {}
-        for MPV in [2, 3, 4]:
-            mpv_data = pd.DataFrame(session
-                                    .query(Datum.id, Datum.date)
-                                    .filter(Datum.mpv_position == MPV)
-                                    .filter(Datum.cal_id == None)
-                                    .all())
-            # get only data for this switching valve position, and not already in any calibration event
+        newest_date = np.datetime64(data_date_query(session).scalar(), 'us')
 
-            if not len(mpv_data):
-                logger.info(f'No new calibration events found for standard {mpv_converter[MPV]}')
-                continue
+        postcal_windows = []
+        for MPV in cal_positions:
+            standard = mpv_converter[MPV]  # use mpv_converter dict to get standard information
 
-            mpv_data['date'] = pd.to_datetime(mpv_data['date'])
-            # use mpv_converter dict to get standard information
-            standard_data[mpv_converter[MPV]] = mpv_data.sort_values(by=['date']).reset_index(drop=True)
-
-        for standard, data in standard_data.items():
-            indices = find_cal_indices(data['date'])
+            # get only data for this switching valve position, and not already in any calibration event
+            data = query_cal_data(session, MPV)
 
-            cal_events = []
+            if not len(data['date']):
+                logger.info(f'No new calibration events found for standard {standard}')
+                continue
 
-            if not len(indices) and len(data):
-                # if there's not provided indices, but there's still calibration data, create the one event
-                event_data = session.query(Datum).filter(Datum.id.in_(data['id'])).all()
-                cal_events.append(CalEvent(event_data, standard))
+            segments = find_cal_segments(data['date'])
 
-            elif not len(indices):
-                # if there's no provided indices
-                logger.info(f'No new cal events were found for {standard} standard.')
-                continue
+            # a segment that runs up to the newest data may still be running; leave it until data after it arrives
+            if data['date'][-1] + np.timedelta64(60, 's') >= newest_date:
+                segments = segments[:-1]
 
-            prev_ind = 0
+            cal_events = [CalEvent.from_arrays(data['date'][start:stop], data['co'][start:stop],
+                                               data['co2'][start:stop], data['ch4'][start:stop], standard)
+                          for start, stop in segments]
 
-            for num, ind in enumerate(indices):  # get all data within this event
-                event_data = session.query(Datum).filter(Datum.id.in_(data['id'].iloc[prev_ind:ind])).all()
-                cal_events.append(CalEvent(event_data, standard))
+            for ev in cal_events:
+                if not quantify_cal_event(ev):
+                    logger.info(f'CalEvent for date {ev.date} had a duration < {min_cal_seconds}s and was ignored.')
+                else:
+                    logger.info(f'CalEvent for date {ev.date} added.')
+                    log_event_quantification(logger, ev)  # show quantification info as DEBUG in log
 
-                if num == (len(indices) - 1):  # if it's the last index, get all ahead of it as the last event
-                    event_data = session.query(Datum).filter(Datum.id.in_(data['id'].iloc[ind:])).all()
-                    cal_events.append(CalEvent(event_data, standard))
+            session.add_all(cal_events)
+            session.flush()  # give events ids so data can be assigned to them
 
-                prev_ind = ind
+            assigned = assign_cal_ids(session, cal_events, MPV)
+            logger.info(f'{assigned} data points were assigned to {len(cal_events)} {standard} CalEvents.')
 
-            for ev in cal_events:
+            # flag data after each event while the line flushes; by the standard measured, even if the event was dumped
+            postcal_windows.extend(get_postcal_window(ev, standard) for ev in cal_events)
 
-                filter_postcal_data(ev, session)  # flag the following minute as questionable data (inst_status = 999)
+        flagged = flag_postcal_data(session, postcal_windows)
+        if flagged:
+            logger.info(f'{flagged} data points after calibrations were flagged.')
 
-                if ev.date - ev.dates[0] < dt.timedelta(seconds=90):
-                    logger.info(f'CalEvent for date {ev.date} had a duration < 90s and was ignored.')
-                    ev.standard_used = 'dump'  # give not-long-enough events standard type 'dump' so they're ignored
-                    session.merge(ev)
-                else:
-                    for cpd in ['co', 'co2', 'ch4']:
-                        ev.calc_result(cpd, 21)  # calculate results for all compounds going 21s back
+            # flagged data leaves the QC rollups for those days
+            windows = [w for w in postcal_windows if w]
+            update_rollups(session, min(w[0] for w in windows), max(w[1] for w in windows))
 
-                    session.merge(ev)
-                    logger.info(f'CalEvent for date {ev.date} added.')
-                    log_event_quantification(logger, ev)  # show quantification info as DEBUG in log
-            session.commit()
+        session.commit()
         return True
 
     except Exception as e:
@@ -273,7 +264,11 @@ async def find_cal_events(logger):
         send_processor_email(PROC, exception=e)
         return False
 
+    finally:
+        session.close()
+
 
+@offload(timeout=30 * 60)
 async def create_mastercals(logger):
     """
     Searches all un-committed CalEvents, looking for (high, middle, low) sets that can then have a curve and
@@ -288,7 +283,7 @@ async def create_mastercals(logger):
     try:
         from summit_core import picarro_dir as rundir
         from summit_core import connect_to_db
-        from summit_picarro import MasterCal, CalEvent, match_cals_by_min
+        from summit_picarro import MasterCal, match_cal_triplets, unmatched_cals_query
         import matplotlib.pyplot as plt
         import seaborn as sns
         import numpy as np
@@ -305,27 +300,18 @@ async def create_mastercals(logger):
         return False
     try:
         # Get cals by standard, but only if they're not in another MasterCal already
-        lowcals = (session.query(CalEvent)
-                   .filter(CalEvent.mastercal_id == None, CalEvent.standard_used == 'low_std')
-                   .all())
-
-        highcals = (session.query(CalEvent)
-                    .filter(CalEvent.mastercal_id == None, CalEvent.standard_used == 'high_std')
-                    .all())
+        lowcals = unmatched_cals_query(session, 'low_std').all()
+        highcals = unmatched_cals_query(session, 'high_std').all()
+        midcals = unmatched_cals_query(session, 'mid_std').all()
 
-        midcals = (session.query(CalEvent)
-                   .filter(CalEvent.mastercal_id == None, CalEvent.standard_used == 'mid_std')
-                   .all())
+        triplets, leftovers = match_cal_triplets(lowcals, highcals, midcals, minutes=5)
+        mastercals = [MasterCal(list(triplet)) for triplet in triplets]
 
-        mastercals = []
-        for lowcal in lowcals:
-            matching_high = match_cals_by_min(lowcal, highcals, minutes=5)
-
-            if matching_high:
-                matching_mid = match_cals_by_min(matching_high, midcals, minutes=5)
-
-                if matching_mid:
-                    mastercals.append(MasterCal([lowcal, matching_high, matching_mid]))
+        for standard, cals in leftovers.items():
+            if cals:
+                # recent cals are expected here until the rest of their sequence has run
+                logger.debug(f'{len(cals)} {standard} CalEvents were not matched into MasterCals: '
+                             + ', '.join(str(cal.date) for cal in cals))
 
         if mastercals:
             for mc in mastercals:
@@ -346,7 +332,71 @@ async def create_mastercals(logger):
         send_processor_email(PROC, exception=e)
         return False
 
+    finally:
+        session.close()
 
+
+@offload(timeout=30 * 60)
+async def apply_mastercals(logger):
+    """
+    Applies MasterCal curves to ambient data, correcting only data that has never been corrected and the data around
+    any new MasterCals.
+
+    :param logger: logging logger at module level
+    :return: boolean, did it run/process new data?
+    """
+
+    logger.info('Running apply_mastercals()')
+
+    try:
+        from summit_core import picarro_dir as rundir
+        from summit_core import connect_to_db, create_tables
+        from summit_picarro import Base, query_mastercal_curves, get_correction_windows, apply_mastercal_corrections
+    except Exception as e:
+        logger.error('ImportError occured in apply_mastercals()')
+        send_processor_email(PROC, exception=e)
+        return False
+
+    try:
+        engine, session = connect_to_db('sqlite:///summit_picarro.sqlite', rundir)
+        create_tables(engine, Base)
+    except Exception as e:
+        logger.error(f'Exception {e.args} prevented connection to database in apply_mastercals()')
+        send_processor_email(PROC, exception=e)
+        return False
+
+    try:
+        curves = query_mastercal_curves(session)
+
+        if not len(curves['date']):
+            logger.info('No MasterCals exist to apply to data.')
+            return False
+
+        windows = get_correction_windows(curves)  # data around new MasterCals, which is corrected again
+
+        # then data that has never been corrected, by its own NULL corrected values rather than its date, so data
+        # loaded late (ie, a file re-read or backfilled from before the last MasterCal) is corrected too
+        corrected = apply_mastercal_corrections(session, curves, windows)
+        corrected += apply_mastercal_corrections(session, curves, [(None, None)], uncorrected=True)
+        session.commit()
+
+        if not corrected:
+            logger.info('No new data or MasterCals to apply.')
+            return False
+
+        logger.info(f'{corrected} data points were corrected, including {len(windows)} windows around new MasterCals.')
+        return True
+
+    except Exception as e:
+        logger.error(f'Exception {e.args} occurred in apply_mastercals()')
+        send_processor_email(PROC, exception=e)
+        return False
+
+    finally:
+        session.close()
+
+
+@offload(timeout=15 * 60)
 async def plot_new_data(logger):
     """
     Checks data against the last plotting time, and creates new plots for CO, CO2, and CH4 if new data exists.
@@ -361,7 +411,9 @@ async def plot_new_data(logger):
         from pathlib import Path
         from summit_core import picarro_dir as rundir
         from summit_core import create_daily_ticks, connect_to_db, TempDir, Plot, core_dir, Config, add_or_ignore_plot
-        from summit_picarro import Base, Datum, summit_picarro_plot
+        from summit_core import create_tables, config_query
+        from summit_picarro import Base, summit_picarro_plot, query_rollups, rollup_resolutions
+        from summit_picarro import newest_ambient_query
 
         plotdir = rundir / 'plots'
         remotedir = r'/data/web/htdocs/instaar/groups/arl/summit/plots'
@@ -373,7 +425,7 @@ async def plot_new_data(logger):
 
     try:
         engine, session = connect_to_db('sqlite:///summit_picarro.sqlite', rundir)
-        Base.metadata.create_all(engine)
+        create_tables(engine, Base)
     except Exception as e:
         logger.error(f'Exception {e.args} occurred in plot_new_data()')
         send_processor_email(PROC, exception=e)
@@ -384,7 +436,7 @@ async def plot_new_data(logger):
         Plot.__table__.create(core_engine, checkfirst=True)
         Config.__table__.create(core_engine, checkfirst=True)
 
-        picarro_config = core_session.query(Config).filter(Config.processor == PROC).one_or_none()
+        picarro_config = config_query(core_session, PROC).one_or_none()
 
         if not picarro_config:
             picarro_config = Config(processor=PROC)  # use all default values except processor on init
@@ -397,16 +449,12 @@ async def plot_new_data(logger):
         return False
 
     try:
-        newest_data_point = (session.query(Datum.date)
-            .filter(Datum.mpv_position == 1)
-            .order_by(Datum.date.desc()).first()[0])
+        newest_data_point = newest_ambient_query(session).first()[0]
 
         if newest_data_point <= picarro_config.last_data_date:
             logger.info('No new data was found to plot.')
             core_session.close()
-            core_engine.dispose()
             session.close()
-            engine.dispose()
             return False
 
         picarro_config.last_data_date = newest_data_point
@@ -414,37 +462,23 @@ async def plot_new_data(logger):
 
         date_limits, major_ticks, minor_ticks = create_daily_ticks(picarro_config.days_to_plot)
 
-        all_data = (session.query(Datum.date, Datum.co, Datum.co2, Datum.ch4)
-                    .filter((Datum.mpv_position == 0) | (Datum.mpv_position == 1))
-                    .filter((Datum.instrument_status == 963), (Datum.alarm_status == 0))
-                    .filter(Datum.date >= date_limits['left'])  # grab only data that falls in plotting period
-                    .all())
+        # 5-minute medians of QC'd ambient data that falls in the plotting period
+        rollups = query_rollups(session, rollup_resolutions['5min'], 'qc', start=date_limits['left'], fill_gaps=True)
 
-        if not all_data:
+        if not len(rollups):
             logger.info('No new data was found to plot.')
             core_session.close()
-            core_engine.dispose()
             session.close()
-            engine.dispose()
             return False
 
-        # get only ambient data
-        dates = []
-        co = []
-        co2 = []
-        ch4 = []
-        for result in all_data:
-            dates.append(result.date)
-            co.append(result.co)
-            co2.append(result.co2)
-            ch4.append(result.ch4)
+        dates = rollups['date'].dt.to_pydatetime().tolist()
+        co = rollups['co_median'].tolist()
+        co2 = rollups['co2_median'].tolist()
+        ch4 = rollups['ch4_median'].tolist()
 
         with TempDir(plotdir):
 
-            from summit_core import five_minute_medians
-            dates_co, co = five_minute_medians(dates, co)
-
-            name = summit_picarro_plot(None, ({'Summit CO': [dates_co, co]}),
+            name = summit_picarro_plot(None, ({'Summit CO': [dates, co]}),
                                        limits={'right': date_limits.get('right', None),
                                                'left': date_limits.get('left', None),
                                                'bottom': 60,
@@ -481,24 +515,279 @@ async def plot_new_data(logger):
         logger.info('New data plots were created.')
 
         session.close()
-        engine.dispose()
 
         core_session.commit()
         core_session.close()
-        core_engine.dispose()
         return True
     except Exception as e:
         logger.error(f'Exception {e.args} occurred in plot_new_data()')
         send_processor_email(PROC, exception=e)
 
         session.close()
-        engine.dispose()
 
         core_session.close()
-        core_engine.dispose()
         return False
 
 
+@offload(timeout=60 * 60)
+async def archive_data(logger):
+    """
+    Writes new and changed months of data to the Parquet archive, at most once per archive_interval. The archive is
+    optional, and is skipped if pyarrow is not installed.
+
+    :param logger: logging logger at module level
+    :return: boolean, did it run/process new data?
+    """
+
+    logger.info('Running archive_data()')
+
+    import importlib.util
+
+    if importlib.util.find_spec('pyarrow') is None:
+        logger.info('pyarrow is not installed, so no data archive is kept.')
+        return False
+
+    try:
+        from summit_core import picarro_dir as rundir
+        from summit_core import connect_to_db, create_tables
+        from summit_picarro import Base, export_data_archive
+    except Exception as e:
+        logger.error('ImportError occured in archive_data()')
+        send_processor_email(PROC, exception=e)
+        return False
+
+    try:
+        engine, session = connect_to_db('sqlite:///summit_picarro.sqlite', rundir)
+        create_tables(engine, Base)
+    except Exception as e:
+        logger.error(f'Exception {e.args} prevented connection to database in archive_data()')
+        send_processor_email(PROC, exception=e)
+        return False
+
+    try:
+        archive_dir = rundir / 'archive'
+
+        last_export = max((f.stat().st_mtime for f in archive_dir.rglob('data.parquet')), default=None)
+        if last_export and dt.datetime.now() - dt.datetime.fromtimestamp(last_export) < archive_interval:
+            logger.info('Data archive was updated recently and was not re-written.')
+            return False
+
+        months = export_data_archive(session, archive_dir)
+
+        logger.info(f'{len(months)} months of data were written to the archive.')
+        return bool(months)
+
+    except Exception as e:
+        logger.error(f'Exception {e.args} occurred in archive_data()')
+        send_processor_email(PROC, exception=e)
+        return False
+
+    finally:
+        session.close()
+
+
+async def stream_new_data(logger):
+    """
+    Runs continuously when streaming is enabled in summit.py. Follows the .dat file the Picarro is writing to in the
+    sync directory, parses new lines as they're written, and commits them every stream_batch_seconds, so data reaches
+    the database seconds after it's recorded instead of after the file is moved and loaded. Parsed data is also added
+    to summit_picarro.live_window for live plots.
+
+    Calibrations are found as data streams in by a CalStateMachine, and each CalEvent is created, quantified and has
+    the flush after it flagged as soon as its standard stops running; find_cal_events() then only has to handle data
+    that was loaded from files without being streamed, ie backfills.
+
+    Changes are picked up by a directory watcher if watchdog is installed, or by polling if not. Streamed data has no
+    DataFile until check_load_new_data() loads the moved file, which skips the rows that were streamed and claims them.
+
+    :param logger: logging logger to log to
+    :return: boolean, False if it stopped due to an error
+    """
+    try:
+        import time
+        from summit_core import picarro_logs_sync as sync_path
+        from summit_core import picarro_dir as rundir
+        from summit_core import connect_to_db, create_tables, run_blocking, start_directory_watcher
+        from summit_picarro import Base, insert_data, parse_data_file, find_newest_data_file, live_window
+        from summit_picarro import stream_batch_seconds, stream_poll_seconds, stream_rescan_seconds
+        from summit_picarro import CalStateMachine, create_cal_event, get_postcal_window, flag_postcal_data
+        from summit_picarro import log_event_quantification, mpv_converter
+    except Exception as e:
+        logger.error('ImportError occurred in stream_new_data()')
+        send_processor_email(PROC, exception=e)
+        return False
+
+    try:
+        engine, session = connect_to_db('sqlite:///summit_picarro.sqlite', rundir)
+        create_tables(engine, Base)
+    except Exception as e:
+        logger.error(f'Exception {e.args} prevented connection to the database in stream_new_data()')
+        send_processor_email(PROC, exception=e)
+        return False
+
+    loop = asyncio.get_event_loop()
+    wake = asyncio.Event()
+    active = {'path': None, 'changed': None}
+    positions = {}  # {path: (offset, signature)} of the active file and the one before it
+
+    def file_changed(path):
+        active['changed'] = path  # the most recently written file is the one the Picarro is writing to
+        wake.set()
+
+    watcher = start_directory_watcher(sync_path, lambda path: loop.call_soon_threadsafe(file_changed, path), '.dat')
+
+    if watcher:
+        logger.info(f'Streaming Picarro data from {sync_path}, using a file watcher.')
+    else:
+        logger.info(f'Streaming Picarro data from {sync_path}, polling every {stream_poll_seconds}s.')
+
+    cal_machine = CalStateMachine()
+    flush_windows = []  # post-cal windows that are flagged on each commit until all their data has arrived
+
+    def commit(batch, segments):
+        inserted = sum(insert_data(session, data, None) for data in batch)
+
+        events = []
+        for mpv_position, columns in segments:
+            event = create_cal_event(session, mpv_position, columns)  # data is inserted first so it can be assigned
+            if event:
+                events.append(event)
+                flush_windows.append(get_postcal_window(event, mpv_converter[mpv_position]))
+
+        flag_postcal_data(session, flush_windows)
+        session.commit()
+        return inserted, events
+
+    pending = []
+    closed_cals = []
+    last_commit = time.monotonic()
+    last_scan = None
+
+    try:
+        while True:
+            try:
+                await asyncio.wait_for(wake.wait(), timeout=stream_batch_seconds if watcher else stream_poll_seconds)
+            except asyncio.TimeoutError:
+                pass
+            wake.clear()
+
+            if last_scan is None or (not watcher and time.monotonic() - last_scan >= stream_rescan_seconds):
+                newest = await run_blocking(find_newest_data_file, sync_path)
+                last_scan = time.monotonic()
+
+                if newest and newest != active['path']:
+                    active['changed'] = newest
+
+            paths = [active['path']]
+            if active['changed'] and active['changed'] != active['path']:
+                paths.append(active['changed'])  # finish reading the old file before switching to the new one
+            active['changed'] = None
+
+            for path in paths:
+                if path is None:
+                    continue
+
+                if path != active['path']:
+                    logger.info(f'Streaming data from {path.name}.')
+                    positions = {known: positions[known] for known in (active['path'], path) if known in positions}
+                    active['path'] = path
+
+                offset, signature = positions.get(path, (None, None))
+                block = await run_blocking(parse_data_file, path, offset, signature)
+
+                if block['error']:
+                    logger.warning(f'File {path.name} could not be read while streaming. The error was:\n'
+                                   + block['error'])
+                    continue
+
+                positions[path] = (block['offset'], block['signature'])
+
+                if block['data'] and len(block['data']['EPOCH_TIME']):
+                    pending.append(block['data'])
+                    live_window.extend(block['data'])
+                    closed_cals.extend(cal_machine.feed(block['data']))
+
+            if pending and time.monotonic() - last_commit >= stream_batch_seconds:
+                newest = dt.datetime.utcfromtimestamp(max(data['EPOCH_TIME'].max() for data in pending))
+
+                inserted, events = await run_blocking(commit, pending, closed_cals)
+                logger.debug(f'{inserted} streamed data points were committed.')
+
+                for event in events:
+                    if event.standard_used == 'dump':
+                        logger.info(f'CalEvent for date {event.date} was too short and was ignored.')
+                    else:
+                        logger.info(f'CalEvent for date {event.date} added while streaming.')
+                        log_event_quantification(logger, event)
+
+                flush_windows[:] = [w for w in flush_windows if w and w[1] > newest]  # all their data has arrived
+                pending = []
+                closed_cals = []
+                last_commit = time.monotonic()
+
+    except Exception as e:
+        logger.error(f'Exception {e.args} occurred in stream_new_data()')
+        send_processor_email(PROC, exception=e)
+        return False
+
+    finally:
+        if watcher:
+            watcher.stop()
+        session.close()
+
+
+@offload(timeout=60 * 60)
+async def check_rollups(logger):
+    """
+    Computes rollups for any days of ambient data that don't have them, ie all existing data the first time this runs
+    against a database migrated from before rollups were kept. Finding the missing days reads the date of every
+    ambient data point, so it's only checked once per process.
+
+    :param logger: logging logger at module level
+    :return: boolean, were any rollups written?
+    """
+    global rollups_checked
+
+    if rollups_checked:
+        return False
+
+    try:
+        from summit_core import picarro_dir as rundir
+        from summit_core import connect_to_db, create_tables
+        from summit_picarro import Base, backfill_rollups
+    except ImportError as e:
+        logger.error('ImportError occurred in check_rollups()')
+        send_processor_email(PROC, exception=e)
+        return False
+
+    try:
+        engine, session = connect_to_db('sqlite:///summit_picarro.sqlite', rundir)
+        create_tables(engine, Base)
+    except Exception as e:
+        logger.error(f'Exception {e.args} prevented connection to the database in check_rollups()')
+        send_processor_email(PROC, exception=e)
+        return False
+
+    try:
+        logger.info('Running check_rollups()')
+
+        written = backfill_rollups(session)
+        rollups_checked = True
+
+        if written:
+            logger.info(f'{written} rollups were backfilled for data that had none.')
+
+        return bool(written)
+
+    except Exception as e:
+        logger.error(f'Exception {e.args} occurred in check_rollups()')
+        send_processor_email(PROC, exception=e)
+        return False
+
+    finally:
+        session.close()
+
+
 async def main():
     try:
         from summit_core import picarro_dir as rundir
@@ -510,13 +799,22 @@ async def main():
         return
 
     try:
+        backfilled = await asyncio.create_task(check_rollups(logger))
+
         if await asyncio.create_task(check_load_new_data(logger)):
 
             if await asyncio.create_task(find_cal_events(logger)):
                 await asyncio.create_task(create_mastercals(logger))
 
+            await asyncio.create_task(apply_mastercals(logger))
+
             await asyncio.create_task(plot_new_data(logger))
 
+            await asyncio.create_task(archive_data(logger))
+
+        elif backfilled:
+            await asyncio.create_task(plot_new_data(logger))  # plots of existing data were empty until now
+
         return True
     except Exception as e:
         logger.error(f'Exception {e.args} occurred in Picarro main()')
@@ -1,11 +1,12 @@
+import os
+import hashlib
+from io import BytesIO
 from pathlib import Path
 import datetime as dt
 from datetime import datetime
-import statistics as s
 from collections import namedtuple
+import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
 
 from sqlalchemy.ext.mutable import MutableDict
 from sqlalchemy.ext.declarative import declarative_base
@@ -40,7 +41,8 @@ class DataFile(Base):
     """
     A file containing synced 5-second data from the Picarro. Used mostly for tracking where data originated from, and
     what files have already been loaded. The byte-size of a file is stored to track whether or not it has been loaded
-    in full yet.
+    in full yet, and the byte offset and signature of the last read are stored so only appended lines are read next
+    time (see summit_core.read_file_tail()).
     """
     __tablename__ = 'files'
 
@@ -49,6 +51,8 @@ class DataFile(Base):
     _path = Column(String, unique=True)
     size = Column(Integer)
     processed = Column(Boolean)
+    read_offset = Column(Integer)  # byte offset after the last complete line that was loaded
+    signature = Column(String)  # hash of the start of the file when it was last read
 
     datum = relationship('Datum')
 
@@ -84,7 +88,7 @@ class Datum(Base):
     __tablename__ = 'data'
 
     id = Column(Integer, primary_key=True)
-    date = Column(DateTime)
+    date = Column(DateTime)  # unique, per the index added in migration 3; see insert_data()
     alarm_status = Column(Integer)
     instrument_status = Column(Integer)
     cavity_pressure = Column(Float)
@@ -100,6 +104,9 @@ class Datum(Base):
     ch4_wet = Column(Float)
     ch4 = Column(Float)
     h2o = Column(Float)
+    co_corrected = Column(Float)  # calibrated values for ambient data; see apply_mastercal_corrections()
+    co2_corrected = Column(Float)
+    ch4_corrected = Column(Float)
 
     file_id = Column(Integer, ForeignKey('files.id'))
     cal = relationship('CalEvent', back_populates='data')
@@ -112,6 +119,257 @@ class Datum(Base):
         self.date = datetime.utcfromtimestamp(line_dict.get('EPOCH_TIME'))
 
 
+def epoch_to_db_dates(epoch_times):
+    """
+    Convert an array of epoch times to the strings SQLAlchemy stores DateTimes as in SQLite. Fractional seconds are
+    rounded to microseconds the same way datetime.utcfromtimestamp() does, so dates match those created by Datum().
+
+    :param epoch_times: array-like, of float seconds since the epoch
+    :return: np.ndarray, of str dates as 'YYYY-MM-DD HH:MM:SS.ffffff'
+    """
+    frac, whole = np.modf(np.asarray(epoch_times, dtype='float64'))
+    micros = whole.astype('int64') * 1_000_000 + np.round(frac * 1e6).astype('int64')
+
+    dates = np.datetime_as_string(micros.astype('datetime64[us]'), unit='us')
+    return np.char.replace(dates, 'T', ' ')
+
+
+def unprocessed_files_query(session):
+    """
+    :param session: Sqlalchemy session()
+    :return: Query, for DataFiles that haven't been processed
+    """
+    return session.query(DataFile).filter(DataFile.processed == False)
+
+
+def data_file_query(session, name):
+    """
+    :param session: Sqlalchemy session()
+    :param name: str, name of the file
+    :return: Query, for DataFiles with that name
+    """
+    return session.query(DataFile).filter(DataFile._name == name)
+
+
+def data_date_query(session, newest=True):
+    """
+    :param session: Sqlalchemy session()
+    :param newest: boolean, get the newest date if True, the oldest if False
+    :return: Query, for the date of the newest (or oldest) Datum
+    """
+    return session.query(Datum.date).order_by(Datum.date.desc() if newest else Datum.date).limit(1)
+
+
+def newest_ambient_query(session):
+    """
+    :param session: Sqlalchemy session()
+    :return: Query, for the date of the newest ambient (MPV position 1) Datum
+    """
+    return session.query(Datum.date).filter(Datum.mpv_position == 1).order_by(Datum.date.desc()).limit(1)
+
+
+def insert_data(session, data, file_id):
+    """
+    Bulk-insert Picarro data as read from a .dat file, without creating any Datum objects. Rows are inserted with
+    INSERT OR IGNORE, so any whose date is already in the database (per the unique index on data.date) are skipped by
+    SQLite. The insert is part of the session's transaction, and is committed with it.
+
+    :param session: Sqlalchemy session()
+    :param data: pd.DataFrame or dict of np.ndarrays, by original Picarro column name, with units already converted
+    :param file_id: int, id of the DataFile the data came from, or None for data streamed before its file is loaded
+    :return: int, number of rows inserted
+    """
+    length = len(data['EPOCH_TIME']) if 'EPOCH_TIME' in data else 0
+
+    if not length:
+        return 0
+
+    columns = ['date'] + column_names + ['file_id']
+
+    values = [epoch_to_db_dates(data['EPOCH_TIME']).tolist()]
+    for var in column_names:
+        name = column_to_instance_names.get(var)
+        values.append(data[name].tolist() if name in data else [None] * length)
+    values.append([file_id] * length)
+
+    sql = (f'INSERT OR IGNORE INTO {Datum.__tablename__} ({", ".join(columns)}) '
+           + f'VALUES ({", ".join("?" * len(columns))})')
+
+    cursor = session.connection().connection.cursor()  # raw DBAPI cursor in the session's transaction
+    try:
+        cursor.executemany(sql, zip(*values))
+        inserted = cursor.rowcount
+
+        if inserted < length and file_id is not None:
+            # rows that were streamed live (see stream_new_data()) were inserted without a file; attribute them
+            cursor.execute(f'UPDATE {Datum.__tablename__} SET file_id = ? '
+                           + 'WHERE date >= ? AND date <= ? AND file_id IS NULL',
+                           (file_id, min(values[0]), max(values[0])))
+
+        return inserted
+    finally:
+        cursor.close()
+
+
+parse_workers = None  # max processes used to parse data files in parallel; defaults to the number of CPUs
+parallel_parse_min_files = 3  # fewer files are parsed in-process, since starting each worker takes a second or two
+
+
+def parse_data_file(path, offset=None, signature=None):
+    """
+    Read and parse the new lines of a Picarro .dat file into a compact block of columns. Null rows are dropped, and CO
+    and CH4 are converted to ppb. This runs in worker processes, so everything returned is a basic type or array, and
+    errors are returned rather than raised.
+
+    :param path: pathlib.Path, the file to read
+    :param offset: int, byte offset the last read of this file stopped at, or None to read all of it
+    :param signature: str, signature from the last read of this file
+    :return: dict, of
+        data: dict of np.ndarrays by original column name (EPOCH_TIME and each of column_names), or None if no new lines
+        offset, signature, rewritten: as returned by summit_core.read_file_tail()
+        dropped: int, number of rows dropped for null values
+        bad_lines: boolean, True if unreadable lines were skipped
+        error: str, traceback of any exception that prevented the file from being read, otherwise None
+    """
+    import traceback
+    from summit_core import read_file_tail
+    from pandas.errors import ParserError
+
+    block = {'data': None, 'offset': offset, 'signature': signature, 'rewritten': False, 'dropped': 0,
+             'bad_lines': False, 'error': None}
+
+    try:
+        header, new_lines, block['offset'], block['signature'], block['rewritten'] = read_file_tail(path, offset,
+                                                                                                    signature)
+        if not new_lines:
+            return block
+
+        try:
+            df = pd.read_csv(BytesIO(header + new_lines), delim_whitespace=True)
+        except ParserError:
+            df = pd.read_csv(BytesIO(header + new_lines), delim_whitespace=True, error_bad_lines=False)
+            block['bad_lines'] = True
+
+        original_length = len(df)
+        df.dropna(axis=0, how='any', inplace=True)
+        block['dropped'] = original_length - len(df)
+
+        # CO2 stays in ppm
+        df['CO_sync'] *= 1000  # convert CO to ppb
+        df['CH4_sync'] *= 1000  # convert CH4 to ppb
+        df['CH4_dry_sync'] *= 1000
+
+        names = ['EPOCH_TIME'] + [column_to_instance_names.get(var) for var in column_names]
+        block['data'] = {name: df[name].to_numpy() for name in names if name in df.columns}
+    except Exception:
+        block['error'] = traceback.format_exc()
+
+    return block
+
+
+def parse_data_files(files):
+    """
+    Parse several data files, in parallel worker processes if there are enough of them to make it worthwhile. Blocks
+    are yielded in the same order as the files as soon as each is ready, so they can be written to the database by a
+    single writer while later files are still being parsed.
+
+    :param files: list, of (path, offset, signature) tuples to pass to parse_data_file()
+    :return: generator, of blocks from parse_data_file()
+    """
+    if len(files) < parallel_parse_min_files:
+        for file in files:
+            yield parse_data_file(*file)
+        return
+
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+    from summit_core import extend_sys_path, processor_dirs
+
+    workers = min(len(files), parse_workers or os.cpu_count() or 1)
+
+    # spawn rather than fork, since this is usually called from a thread, and forking a threaded process is unsafe
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                             initializer=extend_sys_path, initargs=([str(d) for d in processor_dirs],)) as executor:
+        yield from executor.map(parse_data_file, *zip(*files))
+
+
+"""
+Settings for streaming data live from the file the Picarro is writing to, in addition to loading whole files after
+they're moved (see picarro_main_loop.stream_new_data()).
+"""
+stream_batch_seconds = 10  # new lines are committed to the database at most this often
+stream_poll_seconds = 2  # how often the active file is checked for new lines if there's no file watcher
+stream_rescan_seconds = 60  # how often the sync directory is searched for a newer file if there's no file watcher
+live_window_seconds = 24 * 60 * 60  # seconds of streamed data kept in memory for live plots
+
+
+class RollingWindow:
+    """
+    The most recent streamed data, kept in memory as columns so live plots never have to query the database. Data is
+    added as it's parsed, and anything older than the window's length (relative to the newest point) is dropped.
+    """
+
+    def __init__(self, seconds):
+        """
+        :param seconds: int, length of the window, relative to the newest data
+        """
+        import threading
+
+        self.seconds = seconds
+        self._columns = {}
+        self._lock = threading.Lock()
+
+    def extend(self, data):
+        """
+        Add newly-parsed data to the window.
+
+        :param data: dict, of np.ndarrays by original Picarro column name, as in blocks from parse_data_file()
+        :return: None
+        """
+        if not len(data.get('EPOCH_TIME', [])):
+            return
+
+        new = {'date': epoch_to_db_dates(data['EPOCH_TIME']).astype('datetime64[us]')}
+        for var in column_names:
+            name = column_to_instance_names.get(var)
+            new[var] = (np.asarray(data[name], dtype='float64') if name in data
+                        else np.full(len(new['date']), np.nan))
+
+        with self._lock:
+            columns = {col: np.concatenate([self._columns[col], values]) if self._columns else values
+                       for col, values in new.items()}
+
+            # re-read lines (ie, from a rewritten file) are dropped, and data is kept sorted
+            _, keep = np.unique(columns['date'], return_index=True)
+            keep = keep[columns['date'][keep] >= columns['date'][keep[-1]] - np.timedelta64(self.seconds, 's')]
+
+            self._columns = {col: values[keep] for col, values in columns.items()}
+
+    def snapshot(self):
+        """
+        :return: dict, of copies of each column ('date' as datetime64, and each of column_names), sorted by date
+        """
+        with self._lock:
+            return {col: values.copy() for col, values in self._columns.items()}
+
+    def __len__(self):
+        return len(self._columns.get('date', []))
+
+
+live_window = RollingWindow(live_window_seconds)  # filled by stream_new_data() when streaming is enabled
+
+
+def find_newest_data_file(path):
+    """
+    :param path: Path, directory to search recursively for .dat files
+    :return: pathlib.Path, of the most recently modified .dat file, or None if there are none
+    """
+    from summit_core import get_all_data_files
+
+    files = get_all_data_files(path, '.dat')
+    return max(files, key=lambda f: f.stat().st_mtime) if files else None
+
+
 class CalEvent(Base):
     """
     A section of calibration data for a single standard or gas. These are related to their sub-data, but have result
@@ -131,11 +389,76 @@ class CalEvent(Base):
     mastercal = relationship('MasterCal', back_populates='subcals')
     mastercal_id = Column(Integer, ForeignKey('mastercals.id'))
 
+    compounds = ['co', 'co2', 'ch4']  # compounds results are calculated for
+
     def __init__(self, data, standard_used):
-        self.data = data
+        """
+        :param data: list, of Datums in the event sorted by date, or a dict of columns (see from_arrays())
+        :param standard_used: str, name of the standard
+        """
+        if isinstance(data, dict):
+            self._arrays = data  # columns are only used for results, Datums are assigned in bulk later
+        else:
+            self.data = data
+
         self.date = self.dates[-1]  # date of a CalEvent is the last timestamp in the cal period
         self.standard_used = standard_used
 
+    @classmethod
+    def from_arrays(cls, dates, co, co2, ch4, standard_used):
+        """
+        Create a CalEvent from columns of calibration data rather than Datum objects. The columns are kept on the
+        (unsaved) event for calculating results, and its Datums should then be related to it in bulk with
+        assign_cal_ids() once it has an id.
+
+        :param dates: np.ndarray, of datetime64 dates, sorted
+        :param co: np.ndarray, of CO values parallel to dates
+        :param co2: np.ndarray, of CO2 values parallel to dates
+        :param ch4: np.ndarray, of CH4 values parallel to dates
+        :param standard_used: str, name of the standard
+        :return: CalEvent
+        """
+        dates = dates.astype('datetime64[us]')
+        arrays = {'date': dates.tolist(), 'date64': dates, 'co': np.asarray(co, dtype='float64'),
+                  'co2': np.asarray(co2, dtype='float64'), 'ch4': np.asarray(ch4, dtype='float64')}
+        return cls(arrays, standard_used)
+
+    def get_results(self, back_period):
+        """
+        Calculate the mean, median and standard deviation of every compound, using only data from the last back_period
+        seconds of the event (plus the last point before that period). Nothing is saved to the event, so this can be
+        called for any number of back periods, ie to see how sensitive results are to the period used.
+
+        :param back_period: seconds to back-average from end of calibration period
+        :return: dict, of {compound: {'mean': x, 'median': x, 'stdev': x}}
+        """
+        arrays = self._load_arrays()
+        cutoff = np.datetime64(self.date - dt.timedelta(seconds=back_period), 'us')
+
+        # index of the last point at or before the cutoff, so the period is bounded by real data on both sides
+        ind = max(int(np.searchsorted(arrays['date64'], cutoff, side='right')) - 1, 0)
+        values = np.vstack([arrays[cpd][ind:] for cpd in self.compounds])  # one row per compound
+
+        means = values.mean(axis=1)
+        medians = np.median(values, axis=1)
+        stdevs = values.std(axis=1, ddof=1) if values.shape[1] > 1 else [None] * len(self.compounds)
+
+        return {cpd: {'mean': float(mean), 'median': float(median), 'stdev': None if stdev is None else float(stdev)}
+                for cpd, mean, median, stdev in zip(self.compounds, means, medians, stdevs)}
+
+    def calc_results(self, back_period):
+        """
+        Calculate and save the results for all compounds in one pass. See get_results().
+
+        :param back_period: seconds to back-average from end of calibration period
+        :return: None
+        """
+        for cpd, result in self.get_results(back_period).items():
+            setattr(self, cpd + '_result', result)
+
+        self.back_period = back_period
+        return
+
     def calc_result(self, compound, back_period):
         """
         Calculate the results for this standard for the given compound.
@@ -146,51 +469,48 @@ class CalEvent(Base):
         """
         assert compound in ['co2', 'ch4', 'co'], "Compound not valid."
 
-        dates = self.dates
-        compound_data = getattr(self, compound)
-
-        cutoff_date = self.date - dt.timedelta(seconds=back_period)
+        setattr(self, compound + '_result', self.get_results(back_period)[compound])
+        self.back_period = back_period
+        return
 
-        def find_ind(dates, cutoff):
-            """
-            :param dates: list of datetimes (assumed to be sorted, increasing)
-            :param cutoff: datetime to find values over
-            :return: index where dates are greater than cutoff
-            """
-            for ind, date in enumerate(dates):
-                if date > cutoff:
-                    return ind - 1
+    def _load_arrays(self):
+        """
+        Get this event's data as columns, building them from the related Datums the first time if the event wasn't
+        created with from_arrays(). Columns are cached on the event, so they don't reflect changes to its data made
+        after they're first built.
 
-            return None
+        :return: dict, of 'date' (list of datetimes), 'date64' (np.ndarray of datetime64), and np.ndarrays for each
+            compound
+        """
+        arrays = getattr(self, '_arrays', None)
 
-        if compound_data is not None:
-            ind = find_ind(dates, cutoff_date)
-            if ind is not None:
-                data_to_use = compound_data[ind:]
-                result = {'mean': s.mean(data_to_use), 'median': s.median(data_to_use), 'stdev': s.stdev(data_to_use)}
-            else:
-                result = {'mean': None, 'median': None, 'stdev': None}
+        if arrays is None:
+            data = self.data
+            arrays = {'date': [d.date for d in data]}
+            for cpd in self.compounds:
+                arrays[cpd] = np.array([getattr(d, cpd) for d in data], dtype='float64')
+            self._arrays = arrays
 
-            setattr(self, compound + '_result', result)
+        if 'date64' not in arrays:
+            arrays['date64'] = np.array(arrays['date'], dtype='datetime64[us]')
 
-        self.back_period = back_period
-        return
+        return arrays
 
     @property
     def dates(self):
-        return [d.date for d in self.data]
+        return self._load_arrays()['date']
 
     @property
     def co(self):
-        return [d.co for d in self.data]
+        return self._load_arrays()['co']
 
     @property
     def co2(self):
-        return [d.co2 for d in self.data]
+        return self._load_arrays()['co2']
 
     @property
     def ch4(self):
-        return [d.ch4 for d in self.data]
+        return self._load_arrays()['ch4']
 
     @property
     def duration(self):
@@ -205,11 +525,14 @@ class MasterCal(Base):
     A curve is calculated from the high/low values, then the middle's difference from it's expected value is used as a
     QC measure.
 
-    As of 3/19/2019, it's not clear how these will be applied to the final data.
+    Curves are applied to ambient data by apply_mastercal_corrections(), which interpolates the slope and intercept in
+    time between consecutive MasterCals. applied is set once the data around a MasterCal has been corrected with it.
     """
 
     __tablename__ = 'mastercals'
     id = Column(Integer, primary_key=True)
+    date = Column(DateTime)  # date of the low standard, the start of the calibration sequence
+    applied = Column(Boolean)
     subcals = relationship('CalEvent', back_populates='mastercal')
 
     co_slope = Column(Float)
@@ -224,6 +547,8 @@ class MasterCal(Base):
 
     def __init__(self, standards):
         self.subcals = standards
+        self.date = self.low_std.date if self.low_std else min(cal.date for cal in standards)
+        self.applied = False
 
     def create_curve(self):
         """
@@ -266,6 +591,34 @@ class MasterCal(Base):
         return find_cal_by_type(self.subcals, 'low_std')
 
 
+class Rollup(Base):
+    """
+    Statistics for one fixed-width bin of ambient data, ie a 5-minute median of CO. Rollups are kept at each of the
+    resolutions in rollup_resolutions for every subset of data in rollup_subsets, and are recomputed by whole days
+    whenever data in those days is loaded or flagged (see update_rollups()). Plots and analyses read these instead of
+    the 5-second data.
+    """
+
+    __tablename__ = 'rollups'
+    id = Column(Integer, primary_key=True)
+    resolution = Column(Integer)  # width of the bin in seconds
+    subset = Column(String)  # name of the subset of data, from rollup_subsets
+    date = Column(DateTime)  # start of the bin; unique per resolution and subset, per migration 5
+
+    co_median = Column(Float)
+    co_mean = Column(Float)
+    co_std = Column(Float)
+    co_count = Column(Integer)
+    co2_median = Column(Float)
+    co2_mean = Column(Float)
+    co2_std = Column(Float)
+    co2_count = Column(Integer)
+    ch4_median = Column(Float)
+    ch4_mean = Column(Float)
+    ch4_std = Column(Float)
+    ch4_count = Column(Integer)
+
+
 def find_cal_by_type(standards, std_type):
     """
 
@@ -290,6 +643,231 @@ def find_cal_indices(datetimes):
     return indices
 
 
+def uncalibrated_data_query(mpv_position):
+    """
+    :param mpv_position: int, the MPV position of the standard
+    :return: Select, of date, co, co2 and ch4 for data on that position that isn't part of a CalEvent, by date
+    """
+    from sqlalchemy import select
+
+    table = Datum.__table__
+    return (select([table.c.date, table.c.co, table.c.co2, table.c.ch4])
+            .where(table.c.mpv_position == mpv_position)
+            .where(table.c.cal_id == None)
+            .order_by(table.c.date))
+
+
+def query_cal_data(session, mpv_position):
+    """
+    Get all data for a switching valve position that isn't part of a calibration event yet, as columns.
+
+    :param session: Sqlalchemy session()
+    :param mpv_position: int, the MPV position of the standard
+    :return: dict, of np.ndarrays for 'date' (datetime64), 'co', 'co2' and 'ch4', sorted by date
+    """
+    rows = session.execute(uncalibrated_data_query(mpv_position)).fetchall()
+
+    if not rows:
+        return {'date': np.array([], dtype='datetime64[us]'), 'co': np.array([]), 'co2': np.array([]),
+                'ch4': np.array([])}
+
+    dates, co, co2, ch4 = zip(*rows)
+    return {'date': np.array(dates, dtype='datetime64[us]'), 'co': np.array(co, dtype='float64'),
+            'co2': np.array(co2, dtype='float64'), 'ch4': np.array(ch4, dtype='float64')}
+
+
+def find_cal_segments(dates, gap=60):
+    """
+    Split sorted calibration dates into events, where any data more than gap seconds after the previous point starts a
+    new event. This is the vectorized equivalent of find_cal_indices().
+
+    :param dates: np.ndarray, of datetime64 dates, sorted
+    :param gap: int, seconds between points that separates two events
+    :return: list, of (start, stop) index pairs, one per event
+    """
+    if not len(dates):
+        return []
+
+    breaks = (np.flatnonzero(np.diff(dates) > np.timedelta64(gap, 's')) + 1).tolist()
+    return list(zip([0] + breaks, breaks + [len(dates)]))
+
+
+def unmatched_cals_query(session, standard):
+    """
+    :param session: Sqlalchemy session()
+    :param standard: str, standard_used of the CalEvents, ie 'low_std'
+    :return: Query, for CalEvents of that standard that aren't part of a MasterCal yet
+    """
+    return session.query(CalEvent).filter(CalEvent.mastercal_id == None, CalEvent.standard_used == standard)
+
+
+def cal_id_update_statement():
+    """
+    :return: Update, setting cal_id=:event_id on un-assigned data with mpv_position=:mpv between :start and :end
+    """
+    from sqlalchemy import bindparam, and_
+
+    table = Datum.__table__
+    return (table.update()
+            .where(and_(table.c.mpv_position == bindparam('mpv'),
+                        table.c.date >= bindparam('start'),
+                        table.c.date <= bindparam('end'),
+                        table.c.cal_id == None))
+            .values(cal_id=bindparam('event_id')))
+
+
+def assign_cal_ids(session, events, mpv_position):
+    """
+    Relate all un-assigned data in each event's date range to that event with a single executemany UPDATE, rather than
+    through the ORM. Events must already have ids, ie by flushing the session.
+
+    :param session: Sqlalchemy session()
+    :param events: list, of CalEvents created with from_arrays()
+    :param mpv_position: int, the MPV position all events were measured on
+    :return: int, number of Datums updated
+    """
+    params = [{'mpv': mpv_position, 'start': ev.dates[0], 'end': ev.date, 'event_id': ev.id} for ev in events]
+
+    if not params:
+        return 0
+
+    return session.execute(cal_id_update_statement(), params).rowcount
+
+
+cal_positions = (2, 3, 4)  # MPV positions that standards are run on
+min_cal_seconds = 90  # events shorter than this are given standard_used 'dump' and not quantified
+cal_back_period = 21  # seconds from the end of an event that results are calculated over
+
+
+def quantify_cal_event(event):
+    """
+    Calculate results for a new CalEvent, or mark it as a dump if it's too short to use.
+
+    :param event: CalEvent
+    :return: boolean, True if the event was long enough to be quantified
+    """
+    if event.duration < dt.timedelta(seconds=min_cal_seconds):
+        event.standard_used = 'dump'  # give not-long-enough events standard type 'dump' so they're ignored
+        return False
+
+    event.calc_results(cal_back_period)  # calculate results for all compounds going back_period back
+    return True
+
+
+class CalStateMachine:
+    """
+    Finds calibration events incrementally as data is ingested, from transitions in the MPV position. An event is
+    opened when data enters one of cal_positions and closed when it leaves it, or when there's a gap of more than gap
+    seconds, so each event is available as soon as its standard stops running instead of when find_cal_events() next
+    scans the database. Data must be fed in date order.
+    """
+
+    def __init__(self, gap=60):
+        """
+        :param gap: int, seconds between points that separates two events, as in find_cal_segments()
+        """
+        self.gap = np.timedelta64(gap, 's')
+        self.position = None  # MPV position of the last point fed
+        self.last_date = None  # date of the last point fed
+        self._open = []  # chunks of columns for the event that's currently open, if any
+
+    def feed(self, data):
+        """
+        Add newly-parsed data, and return any events that were closed by it.
+
+        :param data: dict, of np.ndarrays by original Picarro column name, as in blocks from parse_data_file()
+        :return: list, of (mpv_position, columns) for each closed event, where columns is a dict of np.ndarrays for
+            'date' (datetime64) and each compound
+        """
+        if not len(data.get('EPOCH_TIME', [])):
+            return []
+
+        order = np.argsort(data['EPOCH_TIME'], kind='stable')
+        dates = epoch_to_db_dates(data['EPOCH_TIME'][order]).astype('datetime64[us]')
+        positions = np.rint(data['MPVPosition'][order]).astype(int)
+        columns = {'date': dates}
+        for cpd in CalEvent.compounds:
+            columns[cpd] = np.asarray(data[column_to_instance_names[cpd]][order], dtype='float64')
+
+        # index of the first point of each run of a single position, with no gaps
+        breaks = (np.diff(positions) != 0) | (np.diff(dates) > self.gap)
+        starts = [0] + (np.flatnonzero(breaks) + 1).tolist()
+        stops = starts[1:] + [len(dates)]
+
+        closed = []
+        for start, stop in zip(starts, stops):
+            position = int(positions[start])
+            continues = (start == 0 and self.position == position and self.last_date is not None
+                         and dates[0] - self.last_date <= self.gap)
+
+            if not continues:
+                closed.extend(self.close())
+
+            if position in cal_positions:
+                self._open.append({col: values[start:stop] for col, values in columns.items()})
+
+            self.position = position
+            self.last_date = dates[stop - 1]
+
+        return closed
+
+    def close(self):
+        """
+        Close the open event, if any, ie when data stops.
+
+        :return: list, of (mpv_position, columns) for the closed event, or an empty list
+        """
+        if not self._open:
+            return []
+
+        columns = {col: np.concatenate([chunk[col] for chunk in self._open]) for col in self._open[0]}
+        self._open = []
+        return [(self.position, columns)]
+
+
+def assigned_cal_data_query(session, mpv_position, first, last):
+    """
+    :param session: Sqlalchemy session()
+    :param mpv_position: int, the MPV position of the standard
+    :param first: datetime, start of the date range, inclusive
+    :param last: datetime, end of the date range, inclusive
+    :return: Query, for ids of data on that position in the range that's already part of a CalEvent
+    """
+    return (session.query(Datum.id)
+            .filter(Datum.mpv_position == mpv_position)
+            .filter(Datum.date >= first, Datum.date <= last)
+            .filter(Datum.cal_id != None))
+
+
+def create_cal_event(session, mpv_position, columns):
+    """
+    Create and quantify a CalEvent from a segment of calibration data, and relate its data to it. Segments whose data
+    is already part of an event (ie, from a re-read file, or a backfill by find_cal_events()) are skipped. The event is
+    flushed but not committed.
+
+    :param session: Sqlalchemy session()
+    :param mpv_position: int, the MPV position the segment was measured on
+    :param columns: dict, of np.ndarrays for 'date' (datetime64) and each compound, from CalStateMachine.feed()
+    :return: CalEvent, or None if the data already belonged to an event
+    """
+    first, last = columns['date'][0].tolist(), columns['date'][-1].tolist()
+
+    assigned = assigned_cal_data_query(session, mpv_position, first, last).first()
+
+    if assigned:
+        return None
+
+    event = CalEvent.from_arrays(columns['date'], columns['co'], columns['co2'], columns['ch4'],
+                                 mpv_converter[mpv_position])
+    quantify_cal_event(event)
+
+    session.add(event)
+    session.flush()  # give the event an id so data can be assigned to it
+    assign_cal_ids(session, [event], mpv_position)
+
+    return event
+
+
 def log_event_quantification(logger, event):
     """
     This condenses some repetitive logging behavior. Each time a CalEvent is created, this will log the results to the
@@ -402,22 +980,57 @@ def match_cals_by_min(cal, cals, minutes=4):
     :param minutes: int, minutes difference to tolerate ## MAY CHANGE TO upper/lower limits
     :return: cal from the list cals, or None
     """
-    from summit_core import find_closest_date, search_for_attr_value
+    return match_nearest_cals([cal], cals, minutes=minutes)[0]
 
-    cal_dates = [c.date for c in cals]
 
-    if not cal_dates:
-        return None
+def match_nearest_cals(cals, candidates, minutes=4):
+    """
+    Match each cal to the candidate closest to it in date, if within the tolerance, using summit_core.match_dates().
+    Each candidate is only used once; cals claim candidates in date order, and any cal whose closest candidate was
+    already claimed is left unmatched.
+
+    :param cals: list, of CalEvents to find matches for
+    :param candidates: list, of CalEvents that can be matched to
+    :param minutes: int, minutes difference to tolerate
+    :return: list, of the matching CalEvent or None, parallel to cals
+    """
+    from summit_core import match_dates
 
-    [match, diff] = find_closest_date(cal.date, cal_dates)
+    matches = [None] * len(cals)
 
-    if not match or not diff:
-        return None
+    pairs = match_dates([c.date for c in cals], [c.date for c in candidates],
+                        tolerance=dt.timedelta(minutes=minutes), exact=False)
 
-    if abs(diff) < dt.timedelta(minutes=minutes):
-        return search_for_attr_value(cals, 'date', match)  # return the matching cal if within tolerance
-    else:
-        return None
+    for cal_ind, candidate_ind in pairs:
+        matches[cal_ind] = candidates[candidate_ind]
+
+    return matches
+
+
+def match_cal_triplets(lowcals, highcals, midcals, minutes=5):
+    """
+    Find (low, high, mid) sets of CalEvents that were run in sequence, by matching each low to the closest high, then
+    that high to the closest mid, all within the tolerance.
+
+    :param lowcals: list, of low standard CalEvents
+    :param highcals: list, of high standard CalEvents
+    :param midcals: list, of mid standard CalEvents
+    :param minutes: int, minutes difference to tolerate between each step
+    :return: (triplets, leftovers)
+        triplets: list, of (low, high, mid) CalEvents, in the order of lowcals
+        leftovers: dict, of {'low_std': [], 'high_std': [], 'mid_std': []}, CalEvents that weren't in any triplet
+    """
+    highs = match_nearest_cals(lowcals, highcals, minutes=minutes)
+    pairs = [(low, high) for low, high in zip(lowcals, highs) if high is not None]
+
+    mids = match_nearest_cals([high for low, high in pairs], midcals, minutes=minutes)
+    triplets = [(low, high, mid) for (low, high), mid in zip(pairs, mids) if mid is not None]
+
+    matched = {id(cal) for triplet in triplets for cal in triplet}
+    leftovers = {std: [cal for cal in cals if id(cal) not in matched]
+                 for std, cals in zip(['low_std', 'high_std', 'mid_std'], [lowcals, highcals, midcals])}
+
+    return triplets, leftovers
 
 
 def calc_two_pt_curve(low, high):
@@ -433,28 +1046,494 @@ def calc_two_pt_curve(low, high):
     return Curve(m, intercept)
 
 
+"""
+Seconds of data after each calibration event that are flagged (instrument_status = 999) while the sampling line flushes
+the standard out, by the standard used. Standards not listed use default_postcal_flush; set a standard to 0 to disable.
+"""
+postcal_flush = {'low_std': 60, 'mid_std': 60, 'high_std': 60}
+default_postcal_flush = 60
+
+
+def get_postcal_window(cal, standard=None):
+    """
+    Get the window of data after a calibration event that should be flagged.
+
+    :param cal: CalEvent
+    :param standard: str, standard to look up the flush length for, if not the event's standard_used
+    :return: (start, end) datetimes, where data with start < date <= end is flagged, or None if nothing should be
+    """
+    seconds = postcal_flush.get(standard if standard else cal.standard_used, default_postcal_flush)
+
+    if not seconds:
+        return None
+
+    return cal.date, cal.date + dt.timedelta(seconds=seconds)
+
+
+def postcal_flag_statement():
+    """
+    :return: Update, flagging all data after :start and through :end as post-calibration
+    """
+    from sqlalchemy import bindparam, and_
+
+    table = Datum.__table__
+    return (table.update()
+            .where(and_(table.c.date > bindparam('start'), table.c.date <= bindparam('end')))
+            .values(instrument_status=999))  # set to anything but 963 and it will be filtered
+
+
+def flag_postcal_data(session, windows):
+    """
+    Flag all ambient data in any number of post-calibration windows with one executemany UPDATE, using the date index
+    for each window. The update is part of the session's transaction and is not committed here.
+
+    :param session: Sqlalchemy session()
+    :param windows: list, of (start, end) datetimes from get_postcal_window(); None windows are skipped
+    :return: int, number of Datums flagged
+    """
+    params = [{'start': start, 'end': end} for start, end in (w for w in windows if w)]
+
+    if not params:
+        return 0
+
+    return session.execute(postcal_flag_statement(), params).rowcount
+
+
 def filter_postcal_data(cal, session):
     """
     Takes a calibration event and filters the ambient data for one minute after the end of the event
-    to allow for the sampling line to flush all the standard out.
+    to allow for the sampling line to flush all the standard out. For many events, collect their windows with
+    get_postcal_window() and flag them all at once with flag_postcal_data().
     :param session: Sqlalchemy session()
     :param cal: CalEvent
     :return: None
     """
-    last_cal_date = cal.data[-1].date
-    end_flush_date = last_cal_date + dt.timedelta(minutes=1)
-    flush_data = (session.query(Datum)
-                  .filter(Datum.date > last_cal_date, Datum.date <= end_flush_date)
-                  .all())
-
-    for data in flush_data:
-        data.instrument_status = 999  # set to anything but 963 and it will be filtered
-        session.merge(data)
+    flag_postcal_data(session, [get_postcal_window(cal)])
     session.commit()
 
     return
 
 
+correction_chunk_size = 50000  # rows of data read and corrected at a time by apply_mastercal_corrections()
+
+ambient_positions = (0, 1)  # MPV positions of data that calibration curves are applied to
+
+
+def query_mastercal_curves(session):
+    """
+    Get the date, applied flag and curve of every MasterCal with a usable curve, as columns.
+
+    :param session: Sqlalchemy session()
+    :return: dict, of np.ndarrays for 'id', 'date' (datetime64), 'applied' (bool), and '<cpd>_slope' and
+        '<cpd>_intercept' for each compound, sorted by date
+    """
+    slopes = [cpd + '_slope' for cpd in CalEvent.compounds]
+    intercepts = [cpd + '_intercept' for cpd in CalEvent.compounds]
+    columns = ['id', 'date', 'applied'] + slopes + intercepts
+
+    rows = (session.query(*[getattr(MasterCal, col) for col in columns])
+            .filter(MasterCal.date != None)
+            .order_by(MasterCal.date)
+            .all())
+
+    # a slope of 0 (or a missing one) can't be inverted, so those MasterCals are left out entirely
+    rows = [row for row in rows if all(getattr(row, col) for col in slopes)
+            and all(getattr(row, col) is not None for col in intercepts)]
+
+    curves = {'id': np.array([row.id for row in rows], dtype='int64'),
+              'date': np.array([row.date for row in rows], dtype='datetime64[us]'),
+              'applied': np.array([bool(row.applied) for row in rows], dtype=bool)}
+
+    for col in slopes + intercepts:
+        curves[col] = np.array([getattr(row, col) for row in rows], dtype='float64')
+
+    return curves
+
+
+def interpolate_curves(curves, dates):
+    """
+    Get the slope and intercept for each compound at any number of dates, linearly interpolated in time between the
+    MasterCals before and after each date. Dates before the first or after the last MasterCal use its curve as-is.
+
+    :param curves: dict, of columns from query_mastercal_curves(); must have at least one MasterCal
+    :param dates: np.ndarray, of datetime64 dates
+    :return: dict, of {compound: (np.ndarray of slopes, np.ndarray of intercepts)}, parallel to dates
+    """
+    x = dates.astype('datetime64[us]').astype('int64')
+    xp = curves['date'].astype('int64')
+
+    return {cpd: (np.interp(x, xp, curves[cpd + '_slope']), np.interp(x, xp, curves[cpd + '_intercept']))
+            for cpd in CalEvent.compounds}
+
+
+def get_correction_windows(curves):
+    """
+    Find the windows of data whose corrections changed since they were last applied. Interpolated curves only depend
+    on the two MasterCals around any point, so a new MasterCal only changes data between the MasterCals on either side
+    of it. Data after the last MasterCal uses its curve, so windows at either end are open. Data that was never
+    corrected (ie, loaded since the last run) isn't in any window; it's found by its NULL corrected values instead.
+
+    :param curves: dict, of columns from query_mastercal_curves()
+    :return: list, of (start, end) datetimes, where either can be None for an open end; sorted and non-overlapping
+    """
+    dates = curves['date'].tolist()
+    windows = []
+
+    for ind in np.flatnonzero(~curves['applied']):
+        windows.append((dates[ind - 1] if ind > 0 else None, dates[ind + 1] if ind + 1 < len(dates) else None))
+
+    windows.sort(key=lambda w: (w[0] is not None, w[0]))  # open starts first
+
+    merged = []
+    for start, end in windows:
+        if merged and (merged[-1][1] is None or (start is not None and start <= merged[-1][1])):
+            last_start, last_end = merged[-1]
+            merged[-1] = (last_start, None if last_end is None or end is None else max(last_end, end))
+        else:
+            merged.append((start, end))
+
+    return merged
+
+
+def correct_values(values, slopes, intercepts):
+    """
+    Invert a calibration curve, measured = slope * certified + intercept, to get calibrated values.
+
+    :param values: np.ndarray, of measured values
+    :param slopes: np.ndarray, of curve slopes parallel to values
+    :param intercepts: np.ndarray, of curve intercepts parallel to values
+    :return: np.ndarray, of corrected values
+    """
+    return (values - intercepts) / slopes
+
+
+def correction_chunk_query(start, end, after, chunk_size, uncorrected=False):
+    """
+    :param start: datetime, earliest data to include, or None; ignored if after is given
+    :param end: datetime, latest data to include, or None
+    :param after: datetime, only include data after this date (ie, the end of the previous chunk), or None
+    :param chunk_size: int, max number of rows
+    :param uncorrected: boolean, only include data that has never been corrected, using the ix_data_uncorrected index
+    :return: Select, of the id, date and compounds of the next chunk of ambient data to correct, by date
+    """
+    from sqlalchemy import select, literal_column, and_
+
+    table = Datum.__table__
+
+    # positions are rendered as literals, not bound, so SQLite can match this to the partial index's WHERE clause
+    positions = [literal_column(str(position)) for position in ambient_positions]
+
+    query = (select([table.c.id, table.c.date] + [table.c[cpd] for cpd in CalEvent.compounds])
+             .where(table.c.mpv_position.in_(positions)))
+
+    if uncorrected:
+        query = query.where(and_(*[table.c[cpd + '_corrected'] == None for cpd in CalEvent.compounds]))
+
+    if after is not None:
+        query = query.where(table.c.date > after)  # continue after the previous chunk
+    elif start is not None:
+        query = query.where(table.c.date >= start)
+
+    if end is not None:
+        query = query.where(table.c.date <= end)
+
+    return query.order_by(table.c.date).limit(chunk_size)
+
+
+def correction_update_statement():
+    """
+    :return: Update, setting the corrected compounds (:_co, :_co2, :_ch4) of the Datum with id=:_id
+    """
+    from sqlalchemy import bindparam
+
+    table = Datum.__table__
+    return (table.update()
+            .where(table.c.id == bindparam('_id'))
+            .values({cpd + '_corrected': bindparam('_' + cpd) for cpd in CalEvent.compounds}))
+
+
+def apply_mastercal_corrections(session, curves, windows, chunk_size=None, uncorrected=False):
+    """
+    Calculate and store corrected CO, CO2 and CH4 for all ambient data in each window, a chunk of rows at a time. Rows
+    are read in date order with the date index, corrected with interpolate_curves() and written back with one
+    executemany UPDATE per chunk. Nothing is committed here.
+
+    :param session: Sqlalchemy session()
+    :param curves: dict, of columns from query_mastercal_curves()
+    :param windows: list, of (start, end) datetimes from get_correction_windows(), either can be None for open ends
+    :param chunk_size: int, rows per chunk; defaults to correction_chunk_size
+    :param uncorrected: boolean, only correct data in the windows that has never been corrected, whatever its date
+    :return: int, number of Datums corrected
+    """
+    if not len(curves['date']):
+        return 0
+
+    chunk_size = chunk_size if chunk_size else correction_chunk_size
+    update = correction_update_statement()
+
+    corrected = 0
+    for start, end in windows:
+        last = None
+        while True:
+            rows = session.execute(correction_chunk_query(start, end, last, chunk_size, uncorrected)).fetchall()
+
+            if not rows:
+                break
+
+            ids, dates, *values = zip(*rows)
+            last = dates[-1]
+
+            curve_values = interpolate_curves(curves, np.array(dates, dtype='datetime64[us]'))
+
+            columns = {}
+            for cpd, cpd_values in zip(CalEvent.compounds, values):
+                slopes, intercepts = curve_values[cpd]
+                result = correct_values(np.array(cpd_values, dtype='float64'), slopes, intercepts)
+                columns['_' + cpd] = [None if np.isnan(v) else v for v in result.tolist()]  # missing stays NULL
+
+            params = [dict(zip(columns.keys(), row_values), _id=id_)
+                      for id_, row_values in zip(ids, zip(*columns.values()))]
+            session.execute(update, params)
+            corrected += len(params)
+
+            if len(rows) < chunk_size:
+                break
+
+    (session.query(MasterCal)
+     .filter(MasterCal.applied.isnot(True))
+     .update({'applied': True}, synchronize_session=False))  # incl. any without a usable curve, so they're skipped
+
+    return corrected
+
+
+rollup_resolutions = {'1min': 60, '5min': 300, '1h': 3600, '1d': 86400}  # seconds in each bin
+
+"""
+Subsets of ambient data that rollups are kept for, as functions of a DataFrame of data that return a mask of rows to
+keep. 'qc' is the data that's plotted; 963 is the only good instrument_status, and 999 is given to post-cal data.
+"""
+rollup_subsets = {
+    'ambient': lambda df: np.ones(len(df), dtype=bool),
+    'qc': lambda df: ((df['instrument_status'] == 963) & (df['alarm_status'] == 0)).to_numpy(),
+}
+
+rollup_chunk_days = 30  # days of 5-second data read into memory at a time when updating rollups
+
+
+def calc_rollups(df, resolution):
+    """
+    Bin data by its date and calculate the median, mean, standard deviation and count of each compound in each bin.
+    Only bins that contain data are returned.
+
+    :param df: pd.DataFrame, with columns 'date' (datetime64) and each compound
+    :param resolution: int, seconds in each bin
+    :return: pd.DataFrame, with columns 'date' (start of each bin) and '<cpd>_<stat>' for each compound and statistic
+    """
+    grouped = df.groupby(df['date'].dt.floor(f'{resolution}s'))[CalEvent.compounds]
+    stats = grouped.agg(['median', 'mean', 'std', 'count'])
+    stats.columns = [f'{cpd}_{stat}' for cpd, stat in stats.columns]
+
+    return stats.reset_index()
+
+
+def rollup_data_query(columns, start, end):
+    """
+    :param columns: list, of Datum column names to select
+    :param start: datetime, earliest data to include
+    :param end: datetime, end of the range, exclusive
+    :return: Select, of the columns for ambient data in the range
+    """
+    from sqlalchemy import select
+
+    table = Datum.__table__
+    return (select([table.c[col] for col in columns])
+            .where(table.c.date >= start)
+            .where(table.c.date < end)
+            .where(table.c.mpv_position.in_(ambient_positions)))
+
+
+def rollup_delete_statement(subset, resolution, start, end):
+    """
+    :param subset: str, name of the subset of data, from rollup_subsets
+    :param resolution: int, seconds in each bin
+    :param start: datetime, earliest bin to delete
+    :param end: datetime, end of the range, exclusive
+    :return: Delete, of the rollups for the subset and resolution in the range
+    """
+    rollups = Rollup.__table__
+    return (rollups.delete()
+            .where(rollups.c.subset == subset)
+            .where(rollups.c.resolution == resolution)
+            .where(rollups.c.date >= start)
+            .where(rollups.c.date < end))
+
+
+def update_rollups(session, start, end=None):
+    """
+    Recompute all rollups for the whole days from start through end. Rows are read in chunks of rollup_chunk_days,
+    and the rollups in each chunk are replaced in one DELETE and executemany INSERT per resolution and subset. Nothing
+    is committed here.
+
+    :param session: Sqlalchemy session()
+    :param start: datetime, of the earliest data that changed; rollups are recomputed from the start of its day
+    :param end: datetime, of the latest data that changed; defaults to the newest data in the database
+    :return: int, number of rollups written
+    """
+    if end is None:
+        end = data_date_query(session).scalar()
+
+    if start is None or end is None:
+        return 0
+
+    rollups = Rollup.__table__
+    columns = ['date', 'instrument_status', 'alarm_status'] + CalEvent.compounds
+
+    day = dt.datetime(start.year, start.month, start.day)
+    last_day = dt.datetime(end.year, end.month, end.day) + dt.timedelta(days=1)
+
+    written = 0
+    while day < last_day:
+        chunk_end = min(day + dt.timedelta(days=rollup_chunk_days), last_day)
+
+        rows = session.execute(rollup_data_query(columns, day, chunk_end)).fetchall()
+
+        df = pd.DataFrame.from_records(rows, columns=columns)
+        df['date'] = pd.to_datetime(df['date'])
+        df[CalEvent.compounds] = df[CalEvent.compounds].astype('float64')
+
+        for subset, get_mask in rollup_subsets.items():
+            subset_df = df.loc[get_mask(df)] if len(df) else df
+
+            for resolution in rollup_resolutions.values():
+                session.execute(rollup_delete_statement(subset, resolution, day, chunk_end))
+
+                if not len(subset_df):
+                    continue
+
+                stats = calc_rollups(subset_df, resolution)
+                stats['date'] = stats['date'].dt.to_pydatetime()
+                stats = stats.astype(object).where(stats.notna(), None)  # NaN (ie, std of one point) to NULL
+
+                records = stats.to_dict('records')
+                for record in records:
+                    record['subset'] = subset
+                    record['resolution'] = resolution
+
+                session.execute(rollups.insert(), records)
+                written += len(records)
+
+        day = chunk_end
+
+    return written
+
+
+def ambient_days_query(session):
+    """
+    :param session: Sqlalchemy session()
+    :return: Query, for each day with ambient data, as 'YYYY-MM-DD'
+    """
+    from sqlalchemy import func
+
+    return session.query(func.date(Datum.date)).filter(Datum.mpv_position.in_(ambient_positions)).distinct()
+
+
+def rollup_days_query(session):
+    """
+    :param session: Sqlalchemy session()
+    :return: Query, for each day with a daily rollup of all ambient data, as 'YYYY-MM-DD'
+    """
+    from sqlalchemy import func
+
+    return (session.query(func.date(Rollup.date))
+            .filter(Rollup.subset == 'ambient', Rollup.resolution == rollup_resolutions['1d'])
+            .distinct())
+
+
+def find_missing_rollup_days(session):
+    """
+    Find days that have ambient data but no rollups, ie data loaded before rollups were kept, or by a run that stopped
+    before it updated them. Every day with ambient data has a daily rollup in the 'ambient' subset once it's rolled up.
+
+    :param session: Sqlalchemy session()
+    :return: list, of (first, last) datetimes of each run of consecutive missing days
+    """
+    data_days = {day for day, in ambient_days_query(session)}
+    rollup_days = {day for day, in rollup_days_query(session)}
+
+    spans = []
+    for day in sorted(datetime.strptime(day, '%Y-%m-%d') for day in data_days - rollup_days):
+        if spans and day - spans[-1][1] == dt.timedelta(days=1):
+            spans[-1][1] = day
+        else:
+            spans.append([day, day])
+
+    return [(first, last) for first, last in spans]
+
+
+def backfill_rollups(session):
+    """
+    Compute rollups for every day with ambient data that doesn't have them. Each run of missing days is committed as
+    it's written, so a backfill that's stopped partway keeps what it finished.
+
+    :param session: Sqlalchemy session()
+    :return: int, number of rollups written
+    """
+    written = 0
+    for first, last in find_missing_rollup_days(session):
+        written += update_rollups(session, first, last)
+        session.commit()
+
+    return written
+
+
+def rollups_query(session, columns, resolution, subset='qc', start=None, end=None):
+    """
+    :param session: Sqlalchemy session()
+    :param columns: list, of Rollup column names to select
+    :param resolution: int, seconds in each bin
+    :param subset: str, name of the subset of data, from rollup_subsets
+    :param start: datetime, earliest bin to include, if any
+    :param end: datetime, latest bin to include, if any
+    :return: Query, for the columns of the rollups, by date
+    """
+    query = (session.query(*[getattr(Rollup, col) for col in columns])
+             .filter(Rollup.subset == subset, Rollup.resolution == resolution))
+
+    if start is not None:
+        query = query.filter(Rollup.date >= start)
+
+    if end is not None:
+        query = query.filter(Rollup.date <= end)
+
+    return query.order_by(Rollup.date)
+
+
+def query_rollups(session, resolution, subset='qc', start=None, end=None, fill_gaps=False):
+    """
+    Get rollups at one resolution as a DataFrame.
+
+    :param session: Sqlalchemy session()
+    :param resolution: int, seconds in each bin, one of rollup_resolutions' values
+    :param subset: str, name of the subset of data, from rollup_subsets
+    :param start: datetime, earliest bin to return, if any
+    :param end: datetime, latest bin to return, if any
+    :param fill_gaps: boolean, add empty (NaN) rows for bins without data, so plotted lines break across gaps
+    :return: pd.DataFrame, with columns 'date' and '<cpd>_<stat>' for each compound and statistic, sorted by date
+    """
+    columns = ['date'] + [f'{cpd}_{stat}' for cpd in CalEvent.compounds for stat in ['median', 'mean', 'std', 'count']]
+
+    rows = rollups_query(session, columns, resolution, subset, start, end).all()
+
+    df = pd.DataFrame.from_records(rows, columns=columns)
+    df['date'] = pd.to_datetime(df['date'])
+
+    if fill_gaps and len(df):
+        bins = pd.date_range(df['date'].iloc[0], df['date'].iloc[-1], freq=f'{resolution}s', name='date')
+        df = df.set_index('date').reindex(bins).reset_index()
+
+    return df
+
+
 def mastercal_plot(cpd, low_coord, mid_coord, high_coord, curve, middle_y_offset, date):
     """
     This function creates a plot for each master calibration event that displays a line between the low and high
@@ -500,3 +1579,192 @@ def mastercal_plot(cpd, low_coord, mid_coord, high_coord, curve, middle_y_offset
         f.savefig(f'{cpd}_masterCal_{date}.png', format='png')
         f.close()
 
+
+"""
+Columns of data written to the Parquet archive, with the Arrow type of each. The archive is partitioned by year and
+month, ie archive/year=2020/month=01/data.parquet, so readers only open the files for the dates they ask for, and only
+read the columns they ask for from each. pyarrow is only needed to write or read the archive, and is imported when
+it's used.
+"""
+archive_columns = (['date']
+                   + column_names
+                   + [cpd + '_corrected' for cpd in CalEvent.compounds]
+                   + ['cal_id'])
+archive_int_columns = ['alarm_status', 'instrument_status', 'cal_id']
+
+archive_row_group_size = 50000  # rows per row group and per read from the database; date ranges skip other groups
+
+
+def get_archive_schema():
+    """
+    :return: pyarrow.Schema, for archive_columns
+    """
+    import pyarrow as pa
+
+    return pa.schema([(col, pa.timestamp('us') if col == 'date'
+                       else pa.int64() if col in archive_int_columns
+                       else pa.float64()) for col in archive_columns])
+
+
+def get_archive_path(archive_dir, month):
+    """
+    :param archive_dir: pathlib.Path, root directory of the archive
+    :param month: datetime, any date in the month
+    :return: pathlib.Path, of the file holding that month of data
+    """
+    return Path(archive_dir) / f'year={month.year}' / f'month={month.month:02d}' / 'data.parquet'
+
+
+def archive_month_query(start, end):
+    """
+    :param start: datetime, start of the month
+    :param end: datetime, start of the next month
+    :return: Select, of the row count and last date of data in the month, and the count and total of each other
+        archived column, which change whenever any of the month's data is calibrated, flagged or corrected
+    """
+    from sqlalchemy import select, func
+
+    table = Datum.__table__
+    stats = [stat for col in archive_columns[1:] for stat in (func.count(table.c[col]), func.total(table.c[col]))]
+
+    return (select([func.count(), func.max(table.c.date)] + stats)
+            .where((table.c.date >= start) & (table.c.date < end)))
+
+
+def archive_rows_query(start, end):
+    """
+    :param start: datetime, start of the month
+    :param end: datetime, start of the next month
+    :return: Select, of archive_columns for all data in the month, by date
+    """
+    from sqlalchemy import select
+
+    table = Datum.__table__
+    return (select([table.c[col] for col in archive_columns])
+            .where((table.c.date >= start) & (table.c.date < end))
+            .order_by(table.c.date))
+
+
+def export_data_archive(session, archive_dir, full=False):
+    """
+    Write Picarro data to the Parquet archive, one file per month. Each file stores a checksum of its month's row
+    count, last date and the count and total of each column, and months are only re-written when that checksum
+    differs from the database, so months whose data is later calibrated, flagged or corrected are re-written too.
+    Rows are read archive_row_group_size at a time and written as they're read. Each file is written to a temporary
+    name and then moved into place, so readers never see a partial file.
+
+    :param session: Sqlalchemy session()
+    :param archive_dir: pathlib.Path, root directory of the archive
+    :param full: boolean, re-write every month regardless
+    :return: list, of datetimes for the first day of each month that was written
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    first = data_date_query(session, newest=False).scalar()
+    last = data_date_query(session).scalar()
+
+    if first is None:
+        return []
+
+    schema = get_archive_schema()
+
+    written = []
+    month = dt.datetime(first.year, first.month, 1)
+    while month <= last:
+        next_month = dt.datetime(month.year + month.month // 12, month.month % 12 + 1, 1)
+        stats = tuple(session.execute(archive_month_query(month, next_month)).first())
+        checksum = hashlib.sha1(repr(stats).encode()).hexdigest()
+        path = get_archive_path(archive_dir, month)
+
+        if not stats[0] or (not full and archived_month_matches(path, checksum)):
+            month = next_month
+            continue
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = path.with_name(f'.{path.name}.tmp')  # hidden files are ignored by readers
+
+        # data written after the checksum was taken only makes it stale, so the month is re-written next time
+        result = session.execute(archive_rows_query(month, next_month))
+        with pq.ParquetWriter(str(temp_path), schema.with_metadata({'checksum': checksum}),
+                              compression='zstd') as writer:
+            while True:
+                rows = result.fetchmany(archive_row_group_size)
+                if not rows:
+                    break
+
+                columns = list(zip(*rows))
+                batch = pa.RecordBatch.from_arrays([pa.array(values, type=field.type)
+                                                    for values, field in zip(columns, schema)], schema=schema)
+                writer.write_table(pa.Table.from_batches([batch]), row_group_size=archive_row_group_size)
+
+        os.replace(temp_path, path)
+
+        written.append(month)
+        month = next_month
+
+    return written
+
+
+def archived_month_matches(path, checksum):
+    """
+    Check if an archived month was written from data with the same checksum as the database has now.
+
+    :param path: pathlib.Path, of the archived month
+    :param checksum: str, of the month's data in the database, as made by export_data_archive()
+    :return: boolean, True if the archive is up to date with the database
+    """
+    import pyarrow.parquet as pq
+
+    if not path.exists():
+        return False
+
+    metadata = pq.read_schema(str(path)).metadata or {}
+    return metadata.get(b'checksum') == checksum.encode()
+
+
+def read_data_archive(archive_dir, columns=None, start=None, end=None, as_arrays=False):
+    """
+    Read Picarro data from the Parquet archive. Only the files for months between start and end are opened, only the
+    row groups that overlap the range are read from them, and only the requested columns are read at all. Files are
+    memory-mapped, so multi-year reads of a few columns need little more memory than the result.
+
+    :param archive_dir: pathlib.Path, root directory of the archive
+    :param columns: list, of columns from archive_columns; defaults to all of them. 'date' is always included
+    :param start: datetime, earliest data to return, inclusive
+    :param end: datetime, latest data to return, exclusive
+    :param as_arrays: boolean, return a dict of np.ndarrays instead of a DataFrame
+    :return: pd.DataFrame with a 'date' column, or dict of np.ndarrays by column; sorted by date
+    """
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    from pyarrow.fs import LocalFileSystem
+
+    columns = ['date'] + [col for col in (columns if columns else archive_columns) if col != 'date']
+
+    partitioning = ds.partitioning(pa.schema([('year', pa.int32()), ('month', pa.int32())]), flavor='hive')
+    dataset = ds.dataset(str(archive_dir), format='parquet', partitioning=partitioning,
+                         filesystem=LocalFileSystem(use_mmap=True))
+
+    year, month, date = ds.field('year'), ds.field('month'), ds.field('date')
+
+    filters = []
+    if start is not None:
+        # partition filters skip whole files; the date filter skips row groups and rows within them
+        filters.append((year > start.year) | ((year == start.year) & (month >= start.month)))
+        filters.append(date >= pa.scalar(start, type=pa.timestamp('us')))
+
+    if end is not None:
+        filters.append((year < end.year) | ((year == end.year) & (month <= end.month)))
+        filters.append(date < pa.scalar(end, type=pa.timestamp('us')))
+
+    expression = None
+    for f in filters:
+        expression = f if expression is None else expression & f
+
+    table = dataset.to_table(columns=columns, filter=expression).sort_by('date')
+
+    if as_arrays:
+        return {col: table[col].to_numpy() for col in columns}
+
+    return table.to_pandas()
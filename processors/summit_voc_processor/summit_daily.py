@@ -1,4 +1,3 @@
-import os
 from pathlib import Path
 from datetime import datetime
 
@@ -7,6 +6,7 @@ from sqlalchemy.orm import relationship
 from sqlalchemy import Column, Integer, String, Boolean, DateTime, Float, ForeignKey
 
 from summit_errors import send_processor_email
+from summit_core import offload
 
 Base = declarative_base()
 
@@ -122,6 +122,15 @@ class Daily(Base):
         self.fid_p = fid_p
 
 
+def recent_dailies_query(session, start):
+    """
+    :param session: Sqlalchemy session()
+    :param start: datetime, only Dailies on or after this date are included
+    :return: Query, for Dailies on or after the date, by date
+    """
+    return session.query(Daily).filter(Daily.date >= start).order_by(Daily.date)
+
+
 def read_daily_line(line):
     ls = line.split('\t')
 
@@ -172,6 +181,7 @@ def read_daily_file(filepath):
     return dailies
 
 
+@offload(timeout=30 * 60)
 async def check_load_dailies(logger):
     """
     TODO:
@@ -181,7 +191,8 @@ async def check_load_dailies(logger):
     """
 
     try:
-        from summit_core import connect_to_db, get_all_data_files, core_dir, daily_logs_path, search_for_attr_value
+        from summit_core import connect_to_db, get_all_data_files, core_dir, daily_logs_path, AttrIndex
+        from summit_core import create_tables
     except ImportError as e:
         logger.error(f'ImportError occurred in check_load_dailies()')
         send_processor_email(PROC, exception=e)
@@ -189,7 +200,7 @@ async def check_load_dailies(logger):
 
     try:
         engine, session = connect_to_db('sqlite:///summit_daily.sqlite', core_dir)
-        Base.metadata.create_all(engine)
+        create_tables(engine, Base)
     except Exception as e:
         logger.error(f'Error {e.args} prevented connecting to the database in check_load_dailies()')
         send_processor_email(PROC, exception=e)
@@ -198,14 +209,14 @@ async def check_load_dailies(logger):
     try:
         logger.info('Running check_load_dailies()')
 
-        daily_files_in_db = session.query(DailyFile).all()
+        daily_files_in_db = AttrIndex(session.query(DailyFile).all(), 'path')
 
         daily_files = [DailyFile(path) for path in get_all_data_files(daily_logs_path, '.txt')]
 
         new_files = []
 
         for file in daily_files:
-            file_in_db = search_for_attr_value(daily_files_in_db, 'path', file.path)
+            file_in_db = daily_files_in_db.get(file.path)
 
             if not file_in_db:
                 new_files.append(file)
@@ -226,14 +237,12 @@ async def check_load_dailies(logger):
             session.commit()
 
         session.close()
-        engine.dispose()
         return True
 
     except Exception as e:
         logger.error(f'Exception {e.args} occurred in check_load_dailies()')
         send_processor_email(PROC, exception=e)
         session.close()
-        engine.dispose()
         return False
 
 
@@ -326,6 +335,7 @@ def summit_daily_plot(dates, compound_dict, limits=None, minor_ticks=None, major
     return plot_name
 
 
+@offload(timeout=15 * 60)
 async def plot_dailies(logger):
     """
     Loads dailies for the last 3 days and plots with ticks for every three days and minor ticks for every day.
@@ -339,13 +349,11 @@ async def plot_dailies(logger):
         from pathlib import Path
         import datetime as dt
         from summit_core import connect_to_db, core_dir, TempDir, Config, Plot, add_or_ignore_plot, create_daily_ticks
+        from summit_core import create_tables, config_query
         plotdir = core_dir / 'plots/daily'
         remotedir = r'/data/web/htdocs/instaar/groups/arl/summit/protected/plots'
 
-        try:
-            os.chdir(plotdir)
-        except FileNotFoundError:
-            os.mkdir(plotdir)
+        plotdir.mkdir(exist_ok=True)  # don't chdir here; this runs in a worker thread and plots are made in a TempDir
 
     except ImportError as e:
         logger.error(f'ImportError occurred in plot_dailies()')
@@ -354,7 +362,7 @@ async def plot_dailies(logger):
 
     try:
         engine, session = connect_to_db('sqlite:///summit_daily.sqlite', core_dir)
-        Base.metadata.create_all(engine)
+        create_tables(engine, Base)
     except Exception as e:
         logger.error(f'Error {e.args} prevented connecting to the database in plot_dailies()')
         send_processor_email(PROC, exception=e)
@@ -365,7 +373,7 @@ async def plot_dailies(logger):
         Plot.__table__.create(core_engine, checkfirst=True)
         Config.__table__.create(core_engine, checkfirst=True)
 
-        daily_config = core_session.query(Config).filter(Config.processor == PROC).one_or_none()
+        daily_config = config_query(core_session, PROC).one_or_none()
 
         if not daily_config:
             daily_config = Config(processor=PROC, days_to_plot=21)  # use all default values except processor on init
@@ -387,7 +395,7 @@ async def plot_dailies(logger):
 
         major_ticks = [t for ind, t in enumerate(major_ticks) if ind % 3 == 0]  # use every third daily tick
 
-        dailies = session.query(Daily).filter(Daily.date >= date_ago).order_by(Daily.date).all()
+        dailies = recent_dailies_query(session, date_ago).all()
 
         dailydict = {}
         for param in daily_parameters:
@@ -481,15 +489,12 @@ async def plot_dailies(logger):
 
         core_session.commit()
         core_session.close()
-        core_engine.dispose()
 
         session.close()
-        engine.dispose()
         return True
 
     except Exception as e:
         logger.error(f'Exception {e.args} occurred in plot_dailies()')
         send_processor_email(PROC, exception=e)
         session.close()
-        engine.dispose()
         return False
@@ -580,146 +580,287 @@ def read_crf_data(filename):
     return Crfs
 
 
+log_file_length = 36  # lines in every LabView log file
+
+log_file_fields = ([('sampletime', 0, 1, float), ('sampleflow1', 1, 1, float), ('sampleflow2', 22, 1, float),
+                    ('sampletype', 2, 1, int), ('backflushtime', 3, 1, float), ('desorbtemp', 4, 1, float),
+                    ('flashheattime', 5, 1, float), ('injecttime', 6, 1, float), ('bakeouttemp', 7, 1, float),
+                    ('bakeouttime', 8, 1, float), ('carrierflow', 9, 1, float), ('samplenum', 10, 1, int),
+                    ('WTinuse', 11, 1, int), ('adsTinuse', 12, 1, int), ('samplepressure1', 13, 1, float),
+                    ('samplepressure2', 21, 1, float), ('GCHeadP', 14, 1, float),
+                    ('chamber_temp_start', 16, 1, float), ('WTA_temp_start', 17, 1, float),
+                    ('WTB_temp_start', 18, 1, float), ('adsA_temp_start', 19, 1, float),
+                    ('adsB_temp_start', 20, 1, float), ('samplecode', 15, 0, int),
+                    ('chamber_temp_end', 23, 1, float), ('WTA_temp_end', 24, 1, float),
+                    ('WTB_temp_end', 25, 1, float), ('adsA_temp_end', 26, 1, float),
+                    ('adsB_temp_end', 27, 1, float), ('traptempFH', 28, 1, float), ('GCstarttemp', 29, 1, float),
+                    ('traptempinject_end', 30, 1, float), ('traptempbakeout_end', 31, 1, float),
+                    ('WTA_hottemp', 32, 1, float), ('WTB_hottemp', 33, 1, float), ('GCHeadP1', 34, 1, float),
+                    ('GCoventemp', 35, 1, float)])
+# (parameter, line, tab-separated column, type) of each parameter in a log file; the date is read from line 15
+
+log_read_workers = 8  # threads reading log files at once in read_log_files(); the reads are small and IO-bound
+
+
+def parse_log_file(filename, text):
+    """
+    Parses the contents of a Summit LabView file into a dictionary that can be unpacked into a LogFile object.
+
+    :param filename: string, name of the file, stored as LogFile.filename
+    :param text: string, the full contents of the file
+    :return: dict, or None if the file couldn't be processed
+    """
+    logger = logging.getLogger(__name__)
+
+    contents = text.split('\n')
+    if contents and not contents[-1]:
+        contents.pop()  # a trailing newline doesn't start another line
+
+    if len(contents) != log_file_length:
+        logger.warning(f'File {filename} had an improper number of lines and was ignored.')
+        return None
+
+    fields = [line.split('\t') for line in contents]
+
+    try:
+        log_dict = {'filename': filename, 'date': datetime.strptime(fields[15][0], '%Y%j%H%M%S')}
+
+        for param, line, col, kind in log_file_fields:
+            value = float(fields[line][col])
+            log_dict[param] = int(value) if kind is int else value
+
+        return log_dict
+    except Exception:
+        logger.warning(f'File {filename} failed to be processed and was ignored.')
+        return None
+
+
+def read_log_dict(path):
+    """
+    Reads one Summit LabView file from its path, without changing directories, and parses it with parse_log_file().
+
+    :param path: pathlib Path or string, path to the file
+    :return: dict, or None if the file couldn't be read or processed
+    """
+    from pathlib import Path
+
+    path = Path(path)
+
+    try:
+        with open(path) as file:
+            text = file.read()
+    except OSError:
+        logging.getLogger(__name__).warning(f'File {path.name} could not be read and was ignored.')
+        return None
+
+    return parse_log_file(path.name, text)
+
+
 def read_log_file(filename):
     """
     Processes Summit LabView files into a dictionary that's unpacked into a LogFile object
-    :param filename: string, filename to be read
+    :param filename: pathlib Path or string, path to the file to be read
     :return: LogFile, or None
     """
-    logger = logging.getLogger(__name__)
+    log_dict = read_log_dict(filename)
+    return LogFile(log_dict) if log_dict else None
 
-    with open(filename) as file:
-        contents = file.readlines()
 
-        log_dict = dict()
+def read_log_files(paths, workers=log_read_workers):
+    """
+    Reads many Summit LabView files at once in a pool of threads, and creates LogFile objects for all that could be
+    processed. Paths are read directly, so this is safe to run alongside other threads.
 
-        try:
-            if len(contents) == 36:
-                log_dict['filename'] = file.name
-                log_dict['date'] = datetime.strptime(contents[15].split('\t')[0], '%Y%j%H%M%S')
-                log_dict['sampletime'] = float(contents[0].split('\t')[1])
-                log_dict['sampleflow1'] = float(contents[1].split('\t')[1])
-                log_dict['sampleflow2'] = float(contents[22].split('\t')[1])
-                log_dict['sampletype'] = int(float(contents[2].split('\t')[1]))
-                log_dict['backflushtime'] = float(contents[3].split('\t')[1])
-                log_dict['desorbtemp'] = float(contents[4].split('\t')[1])
-                log_dict['flashheattime'] = float(contents[5].split('\t')[1])
-                log_dict['injecttime'] = float(contents[6].split('\t')[1])
-                log_dict['bakeouttemp'] = float(contents[7].split('\t')[1])
-                log_dict['bakeouttime'] = float(contents[8].split('\t')[1])
-                log_dict['carrierflow'] = float(contents[9].split('\t')[1])
-                log_dict['samplenum'] = int(float(contents[10].split('\t')[1]))
-                log_dict['WTinuse'] = int(float(contents[11].split('\t')[1]))
-                log_dict['adsTinuse'] = int(float(contents[12].split('\t')[1]))
-                log_dict['samplepressure1'] = float(contents[13].split('\t')[1])
-                log_dict['samplepressure2'] = float(contents[21].split('\t')[1])
-                log_dict['GCHeadP'] = float(contents[14].split('\t')[1])
-                log_dict['chamber_temp_start'] = float(contents[16].split('\t')[1])
-                log_dict['WTA_temp_start'] = float(contents[17].split('\t')[1])
-                log_dict['WTB_temp_start'] = float(contents[18].split('\t')[1])
-                log_dict['adsA_temp_start'] = float(contents[19].split('\t')[1])
-                log_dict['adsB_temp_start'] = float(contents[20].split('\t')[1])
-                log_dict['samplecode'] = int(float(contents[15].split('\t')[0]))
-                log_dict['chamber_temp_end'] = float(contents[23].split('\t')[1])
-                log_dict['WTA_temp_end'] = float(contents[24].split('\t')[1])
-                log_dict['WTB_temp_end'] = float(contents[25].split('\t')[1])
-                log_dict['adsA_temp_end'] = float(contents[26].split('\t')[1])
-                log_dict['adsB_temp_end'] = float(contents[27].split('\t')[1])
-                log_dict['traptempFH'] = float(contents[28].split('\t')[1])
-                log_dict['GCstarttemp'] = float(contents[29].split('\t')[1])
-                log_dict['traptempinject_end'] = float(contents[30].split('\t')[1])
-                log_dict['traptempbakeout_end'] = float(contents[31].split('\t')[1])
-                log_dict['WTA_hottemp'] = float(contents[32].split('\t')[1])
-                log_dict['WTB_hottemp'] = float(contents[33].split('\t')[1])
-                log_dict['GCHeadP1'] = float(contents[34].split('\t')[1])
-                log_dict['GCoventemp'] = float(contents[35].split('\t')[1])
-
-                return LogFile(log_dict)
+    :param paths: list, of pathlib Paths or strings to files to be read
+    :param workers: int, max number of files to read at once
+    :return: list, of LogFiles, in the order of paths
+    """
+    from concurrent.futures import ThreadPoolExecutor
 
-            else:
-                logger.warning(f'File {file.name} had an improper number of lines and was ignored.')
-                return None
-        except:
-            logger.warning(f'File {file.name} failed to be processed and was ignored.')
-            return None
+    if not paths:
+        return []
 
+    with ThreadPoolExecutor(max_workers=min(workers, len(paths)), thread_name_prefix='summit-logfiles') as pool:
+        log_dicts = list(pool.map(read_log_dict, paths))
 
-def read_pa_line(line):
+    return [LogFile(log_dict) for log_dict in log_dicts if log_dict]
+
+
+def log_filenames_query(session):
     """
-    Takes one line as a string from a PeakSimple log, and processes it in Peak objects and an NmhcLine containing those
-    peaks.
-    :param line: string, one line of data from VOC.LOG, NMHC_PA.LOG, etc.
-    :return: NmhcLine or None
+    :param session: Sqlalchemy session()
+    :return: Query, for the filename of every LogFile
     """
+    return session.query(LogFile.filename)
 
-    ls = line.split('\t')
-    line_peaks = []
 
-    line_date = datetime.strptime(ls[1] + ' ' + ls[2], '%m/%d/%Y %H:%M:%S')
+def single_lines_query(session):
+    """
+    :param session: Sqlalchemy session()
+    :return: Query, for NmhcLines that haven't been matched to a LogFile, by id
+    """
+    return session.query(NmhcLine).filter(NmhcLine.status == 'single').order_by(NmhcLine.id)
 
-    for ind, item in enumerate(ls[3:]):
 
-        ind = ind + 3  # offset ind since we're working with ls[3:]
+def single_logs_query(session):
+    """
+    :param session: Sqlalchemy session()
+    :return: Query, for LogFiles that haven't been matched to an NmhcLine, by id
+    """
+    return session.query(LogFile).filter(LogFile.status == 'single').order_by(LogFile.id)
 
-        peak_dict = dict()
 
-        if '"' in item:
+def run_dates_query(session, dates):
+    """
+    :param session: Sqlalchemy session()
+    :param dates: list, of datetimes; SQLite allows at most 999 in one query
+    :return: Query, for the dates of GcRuns with any of the dates
+    """
+    return session.query(GcRun.date).filter(GcRun.date.in_(dates))
 
-            peak_dict['name'] = item.strip('"')  # can't fail, " is definitely there
 
-            try:
-                peak_dict['rt'] = float(ls[ind + 1])
-            except:
-                peak_dict['rt'] = None
-            try:
-                peak_dict['pa'] = float(ls[ind + 2])
-            except:
-                peak_dict['pa'] = None
+def unintegrated_runs_query(session):
+    """
+    :param session: Sqlalchemy session()
+    :return: Query, for GcRuns that haven't been integrated, by id
+    """
+    return session.query(GcRun).filter(GcRun.data_con == None).order_by(GcRun.id)
 
-            if None not in peak_dict.values():
-                line_peaks.append(Peak(peak_dict['name'], peak_dict['pa'], peak_dict['rt']))
 
-    if len(line_peaks) == 0:
-        this_line = None
-    else:
-        this_line = NmhcLine(line_date, line_peaks)
+def recent_run_dates_query(session, after):
+    """
+    :param session: Sqlalchemy session()
+    :param after: datetime, only GcRuns after this date are included
+    :return: Query, for the dates of GcRuns after the date, by date
+    """
+    return session.query(GcRun.date).filter(GcRun.date > after).order_by(GcRun.date)
 
-    return this_line
+
+def pentane_data_query(session, start):
+    """
+    :param session: Sqlalchemy session()
+    :param start: datetime, only GcRuns on or after this date are included
+    :return: Query, for (date, i-pentane mr, n-pentane mr) of GcRuns, by date
+    """
+    from sqlalchemy.orm import aliased
+
+    ipentane = aliased(Peak)
+    npentane = aliased(Peak)
+
+    return (session.query(GcRun.date, ipentane.mr, npentane.mr)
+            .join(ipentane, ipentane.run_id == GcRun.id)
+            .join(npentane, npentane.run_id == GcRun.id)
+            .filter(ipentane.name == 'i-pentane')
+            .filter(npentane.name == 'n-pentane')
+            .filter(GcRun.date >= start)
+            .order_by(GcRun.date))
+
+
+def recent_logs_query(session, start):
+    """
+    :param session: Sqlalchemy session()
+    :param start: datetime, only LogFiles on or after this date are included
+    :return: Query, for LogFiles on or after the date, by date
+    """
+    return session.query(LogFile).filter(LogFile.date >= start).order_by(LogFile.date)
+
+
+def newest_log_query(session):
+    """
+    :param session: Sqlalchemy session()
+    :return: Query, for the date of the newest LogFile
+    """
+    return session.query(LogFile.date).order_by(LogFile.date.desc()).limit(1)
+
+
+def new_logs_query(session, after):
+    """
+    :param session: Sqlalchemy session()
+    :param after: datetime, only LogFiles after this date are included
+    :return: Query, for LogFiles after the date, by date
+    """
+    return session.query(LogFile).filter(LogFile.date > after).order_by(LogFile.date)
+
+
+def uncorrected_lines_query(session):
+    """
+    :param session: Sqlalchemy session()
+    :return: Query, for NmhcLines without an NmhcCorrection, by id
+    """
+    return session.query(NmhcLine).filter(NmhcLine.correction_id == None).order_by(NmhcLine.id)
+
+
+def correction_line_query(session, correction_id):
+    """
+    :param session: Sqlalchemy session()
+    :param correction_id: int, id of the NmhcCorrection
+    :return: Query, for the NmhcLine the NmhcCorrection applies to
+    """
+    return session.query(NmhcLine).filter(NmhcLine.correction_id == correction_id)
+
+
+def line_data_query(session, line_id):
+    """
+    :param session: Sqlalchemy session()
+    :param line_id: int, id of the NmhcLine
+    :return: Query, for the Datum created from the NmhcLine
+    """
+    return session.query(Datum).filter(Datum.line_id == line_id)
+
+
+def read_pa_lines(lines, session=None):
+    """
+    Takes many lines as strings from NMHC_PA.LOG, and processes them into NmhcLines containing their Peaks. Only new
+    lines are returned; see summit_core.read_peaksimple_lines().
+
+    :param lines: list, of strings of data from NMHC_PA.LOG
+    :param session: sqlalchemy session, to check for NmhcLines that are already in the database
+    :return: list, of new NmhcLines, in the order of lines
+    """
+    from summit_core import read_peaksimple_lines
+
+    return read_peaksimple_lines(lines, NmhcLine, lambda date, peaks: NmhcLine(date, [Peak(*peak) for peak in peaks]),
+                                 session=session)
+
+
+def read_pa_line(line):
+    """
+    Takes one line as a string from a PeakSimple log, and processes it in Peak objects and an NmhcLine containing those
+    peaks. Use read_pa_lines() for more than one line.
+    :param line: string, one line of data from VOC.LOG, NMHC_PA.LOG, etc.
+    :return: NmhcLine or None
+    """
+    lines = read_pa_lines([line])
+    return lines[0] if lines else None
 
 
 def match_log_to_pa(LogFiles, NmhcLines):
     """
     This takes a list of LogFile and NmhcLine objects and returns a list (empty, even)
         of resulting GcRun objects. When matching objects, it WILL modify their parameters
-        and status if warranted.
+        and status if warranted. Each NmhcLine is matched to at most one LogFile.
     :param LogFiles: list, of LogFile objects that are unmatched
     :param NmhcLines: list, of NmhcLine objects that are unmatched
     :return: list, of GcRun objects created by matched LogFile/NmhcLine pairs
     """
 
-    from summit_core import find_closest_date, search_for_attr_value
+    from summit_core import match_dates
 
-    runs = []
-    for log in LogFiles:
-        # For each log, attempt to find matching NmhcLine
-        # unpack date attr from all NmhcLines provided
-        nmhc_dates = [line.date for line in NmhcLines]
+    # Valid matches *usually* have ~35min diffs, but shorter means complications may have occurred.
+    # They should still match if shorter, though.
+    pairs = match_dates([log.date for log in LogFiles], [line.date for line in NmhcLines],
+                        tolerance=dt.timedelta(minutes=40))
 
-        [match, diff] = find_closest_date(log.date, nmhc_dates)  # get matching date and it's difference
-
-        if abs(diff) < dt.timedelta(minutes=40):
-            # Valid matches *usually* have ~35min diffs, but shorter means complications may have occurred.
-            # They should still match if shorter, though.
+    runs = []
+    for log_ind, line_ind in pairs:
+        log = LogFiles[log_ind]
+        matched_line = NmhcLines[line_ind]
 
-            matched_line = search_for_attr_value(NmhcLines, 'date', match)  # pull matching NmhcLine
-
-            runs.append(GcRun(log, matched_line))
-            log.line_con = matched_line
-            log.peaks = matched_line.peaklist
-            log.status = 'married'
-            matched_line.status = 'married'
-        else:
-            continue
+        runs.append(GcRun(log, matched_line))
+        log.line_con = matched_line
+        log.peaks = matched_line.peaklist
+        log.status = 'married'
+        matched_line.status = 'married'
 
     return runs
 
@@ -1155,12 +1296,16 @@ def correction_from_df_column(col, logfiles, nmhc_lines, gc_runs, logger, sheetn
     return NmhcCorrection(line, correction_peaklist, None, code)
 
 
-def find_approximate_rt(peaklist, rt):
+def find_approximate_rt(peaklist, rt, rt_index=None):
     """
     Find a peak with the closest retention time if it's within a tolerance.
     :param peaklist: list, of Peaks
     :param rt: float, retention time to match to
+    :param rt_index: AttrIndex, of peaklist by 'rt'; if given it's searched instead of scanning peaklist
     :return: Peak, the peak matching the retention time within the tolerance, if any
     """
+    if rt_index is not None:
+        return next((peak for peak in rt_index.between(rt - .011, rt + .011, inclusive=False) if peak.rt), None)
+
     peaklist = [peak for peak in peaklist if peak.rt]  # clean list for only those with RTs
     return next((peak for peak in peaklist if rt - .011 < peak.rt < rt + .011), None)
@@ -1,6 +1,6 @@
-import os
 import asyncio
 from summit_errors import send_processor_email
+from summit_core import offload
 
 PROC = 'VOC Processor'
 
@@ -11,6 +11,7 @@ def crf_warning_body(rf):
             + ' start and end dates removed.')
 
 
+@offload(timeout=30 * 60)
 async def check_load_logs(logger):
     """
     Check for new logfiles and convert new files to LogFile objects for persistence.
@@ -21,11 +22,10 @@ async def check_load_logs(logger):
 
     try:
         import os
-        import math
         from summit_core import voc_logs_path as logpath
         from summit_core import voc_dir as rundir
-        from summit_core import connect_to_db, TempDir, core_dir, Config
-        from summit_voc import LogFile, read_log_file, Base
+        from summit_core import connect_to_db, create_tables
+        from summit_voc import read_log_files, Base, log_filenames_query
 
     except ImportError as e:
         logger.error('Import in check_load_logs() failed.')
@@ -34,7 +34,7 @@ async def check_load_logs(logger):
 
     try:
         engine, session = connect_to_db('sqlite:///summit_voc.sqlite', rundir)
-        Base.metadata.create_all(engine)
+        create_tables(engine, Base)
     except Exception as e:
         logger.error('Connection to VOC database failed in check_load_logs()')
         send_processor_email(PROC, exception=e)
@@ -43,51 +43,28 @@ async def check_load_logs(logger):
     try:
         logger.info('Running check_load_logs()')
 
-        logfns = [file.name for file in os.scandir(logpath) if 'l.txt' in file.name]
-        if logfns:
-            # if greater than 999 files, SQL throws error, use list comprehension to query in chunks
-            if len(logfns) >= 999:
-                logger.info('Number of Logs > 999, processing in chunks')
-                # number of files to query in a given chunk
-                iterations = math.ceil(len(logfns) / 1000)
-                n = int(len(logfns) / (iterations * 2))
-
-                # list comprehension to seperate logfns into seperate chunks
-                chunked_logfiles = [logfns[i * n:(i + 1) * n] for i in range((len(logfns) + n - 1) // n)]
-
-                # query each chunk and append it to the total logs in db
-                logs_in_db = []
-                for i in range(len(chunked_logfiles)):
-                    database_logs = session.query(LogFile).filter(LogFile.filename.in_(chunked_logfiles[i])).all()
-                    logs_in_db = logs_in_db + database_logs
-
-                logs_in_db[:] = [l.filename for l in logs_in_db]
-            # else, the number of logfiles is normal and under 1000
-            else:
-                logs_in_db = session.query(LogFile).filter(LogFile.filename.in_(logfns)).all()
-                logs_in_db[:] = [l.filename for l in logs_in_db]
+        logfiles = [logpath / file.name for file in os.scandir(logpath) if 'l.txt' in file.name]
+        if logfiles:
+            # query every filename once, rather than in_() clauses that SQLite limits to 999 variables
+            logs_in_db = {filename for filename, in log_filenames_query(session)}
 
-            logs_to_load = []
-            for log in logfns:
-                if log not in logs_in_db:
-                    logs_to_load.append(log)  # add files if not in the database filenames
+            logs_to_load = [log for log in logfiles if log.name not in logs_in_db]
 
             if logs_to_load:
-                new_logs = []
-                with TempDir(logpath):
-                    for log in logs_to_load:
-                        new_logs.append(read_log_file(log))
+                new_logs = read_log_files(logs_to_load)  # reads paths in a thread pool, without changing directory
 
                 if new_logs:
+                    session.add_all(new_logs)
                     for item in new_logs:
-                        session.merge(item)
                         logger.info(f'Log File {item} added.')
-                    session.commit()
+                    session.commit()  # all new logs in one transaction
 
                     session.close()
-                    engine.dispose()
 
                     return True
+                else:
+                    logger.info('No new logs could be processed.')
+                    return False
             else:
                 logger.info('No new logs were loaded.')
                 return False
@@ -101,6 +78,7 @@ async def check_load_logs(logger):
         return False
 
 
+@offload(timeout=30 * 60)
 async def check_load_pas(logger):
     """
     Check for new lines in the PA log. Convert them to NmhcLine objects for persistence if they're new.
@@ -113,8 +91,10 @@ async def check_load_pas(logger):
         logger.info('Running check_load_pas()')
         from summit_core import voc_LOG_path as pa_path
         from summit_core import voc_dir as rundir
-        from summit_core import connect_to_db, TempDir, check_filesize, core_dir, Config
-        from summit_voc import Base, NmhcLine, read_pa_line, name_summit_peaks, CompoundWindow
+        from summit_core import connect_to_db, create_tables, core_dir, Config, read_file_tail, find_line_offset
+        from summit_core import config_query, save_peaksimple_lines
+        from summit_core import Base as CoreBase
+        from summit_voc import Base, read_pa_lines, name_summit_peaks, CompoundWindow
     except ImportError as e:
         logger.error('Imports failed in check_load_logs()')
         send_processor_email(PROC, exception=e)
@@ -122,7 +102,7 @@ async def check_load_pas(logger):
 
     try:
         engine, session = connect_to_db('sqlite:///summit_voc.sqlite', rundir)
-        Base.metadata.create_all(engine)
+        create_tables(engine, Base)
     except Exception as e:
         logger.error(f'Error {e.args} connecting to database in check_load_pas()')
         send_processor_email(PROC, exception=e)
@@ -130,9 +110,9 @@ async def check_load_pas(logger):
 
     try:
         core_engine, core_session = connect_to_db('sqlite:///summit_core.sqlite', core_dir)
-        Config.__table__.create(core_engine, checkfirst=True)
+        create_tables(core_engine, CoreBase)  # also migrates, ie to add Config.read_offset
 
-        voc_config = core_session.query(Config).filter(Config.processor == PROC).one_or_none()
+        voc_config = config_query(core_session, PROC).one_or_none()
 
         if not voc_config:
             voc_config = Config(processor=PROC)  # use all default values except processor on init
@@ -146,115 +126,73 @@ async def check_load_pas(logger):
 
     try:
         if pa_path.is_file():
-            with TempDir(rundir):
-                new_file_size = check_filesize(pa_path)
+            if voc_config.read_offset is None and voc_config.pa_startline:
+                # first run since lines were tracked by number; resume from the same place rather than the beginning
+                voc_config.read_offset = find_line_offset(pa_path, voc_config.pa_startline)
 
-            if new_file_size > voc_config.filesize:
+            _, data, offset, signature, rewritten = read_file_tail(pa_path, voc_config.read_offset,
+                                                                   voc_config.signature, header_lines=0)
 
-                with TempDir(rundir):
-                    contents = pa_path.read_text().split('\n')
+            if rewritten:
+                logger.warning('NMHC_PA.LOG was truncated or replaced, so it was read again from the start.')
 
-                new_startline = len(contents) - 4  # only read what's necessary, but w/ some padding
+            if data:
+                contents = [c for c in data.decode('utf-8', errors='replace').split('\n') if c.strip()]
 
-                contents[:] = [c for c in contents if c]  # keep only lines with information
+                new_lines = read_pa_lines(contents, session=session)  # only lines that aren't in the db yet
 
-                new_lines = []
-                for line in contents[voc_config.pa_startline:]:
-                    try:
-                        with TempDir(rundir):
-                            new_lines.append(read_pa_line(line))
-                    except:
-                        logger.warning('A line in NMHC_PA.LOG was not processed by read_pa_line() due to an exception.')
-                        logger.warning(f'That line was: {line}')
+                voc_config.read_offset = offset
+                voc_config.signature = signature
+                voc_config.filesize = offset
+                core_session.merge(voc_config)
 
                 if not new_lines:
+                    core_session.commit()
                     logger.info('No new pa lines were added.')
                     return False
 
                 else:
-                    # If list isn't empty, attempt to name all peaks
-                    run_one = 1
-                    rt_windows = None
+                    # If list isn't empty, attempt to name all peaks. There are few windows, so get them all at once
+                    # rather than querying for each line
+                    windows = session.query(CompoundWindow).all()
 
                     for ind, line in enumerate(new_lines):
-
-                        if run_one or not (rt_windows.date_start < line.date < rt_windows.date_end):
-                            # get rt_windows on first iteration OR retrieve if the current sample is outside the past
-                            # window. This should prevent constant needless queries
-                            rt_windows = (session.query(CompoundWindow)
-                                          .filter(
-                                (CompoundWindow.date_start < line.date) & (CompoundWindow.date_end > line.date))
-                                          .one_or_none())
-                            if run_one:
-                                run_one = 0
+                        rt_windows = next((w for w in windows if w.date_start < line.date < w.date_end), None)
 
                         if not rt_windows:
                             logger.warning(f'No retention time windows found for NmhcLine for {line.date}.'
                                            + 'It was not quantified.')
-                            run_one = 1  # reset so next sample will re-check for a Window
                             continue
 
                         new_lines[ind] = name_summit_peaks(line, rt_windows)
 
-                ct = 0
-                if new_lines:
-                    line_dates = [line.date for line in new_lines]
-                    lines_in_db = session.query(NmhcLine.date).filter(NmhcLine.date.in_(line_dates)).all()
-                    lines_in_db[:] = [l.date for l in lines_in_db]
+                inserted = save_peaksimple_lines(session, new_lines, 'peaklist')
 
-                    for item in new_lines:
-                        if item.date not in lines_in_db:  # prevents duplicates in db
-                            lines_in_db.append(item.date)  # prevents duplicates in one load
-                            session.merge(item)
-                            logger.info(f'PA Line {item} added.')
-                            ct += 1
-
-                if ct:
-                    voc_config.pa_startline = new_startline
-                    core_session.merge(voc_config)
-
-                    voc_config.filesize = new_file_size
-                    core_session.merge(voc_config)
-
-                    core_session.commit()
-                    session.commit()
-                else:
-                    logger.info('No new pa lines were added.')
-                    return False
-
-                session.close()
-                core_session.close()
-                engine.dispose()
-                core_engine.dispose()
+                session.commit()
+                core_session.commit()  # only after the lines are committed, so they're read again if that fails
 
+                logger.info(f'{inserted} new pa lines were added.')
                 return True
 
             else:
-                session.close()
-                core_session.close()
-                engine.dispose()
-                core_engine.dispose()
                 logger.info('PA file was not larger, so  it was not touched.')
                 return False
 
         else:
-            session.close()
-            core_session.close()
-            engine.dispose()
-            core_engine.dispose()
             logger.critical('VOC.LOG does not exist.')
             return False
 
     except Exception as e:
-        session.close()
-        core_session.close()
-        engine.dispose()
-        core_engine.dispose()
         logger.error(f'Exception {e.args} occurred in check_load_pas()')
         send_processor_email(PROC, exception=e)
         return False
 
+    finally:
+        session.close()
+        core_session.close()
+
 
+@offload(timeout=10 * 60)
 async def load_crfs(logger):
     """
     Read the CRF file and commit any new Crf objects to the database.
@@ -265,7 +203,7 @@ async def load_crfs(logger):
 
     try:
         from summit_core import voc_dir as rundir
-        from summit_core import connect_to_db, TempDir
+        from summit_core import connect_to_db, create_tables, TempDir
         from summit_voc import Base, Crf, read_crf_data
         from sqlalchemy import or_, and_
         from summit_errors import send_processor_warning
@@ -276,7 +214,7 @@ async def load_crfs(logger):
 
     try:
         engine, session = connect_to_db('sqlite:///summit_voc.sqlite', rundir)
-        Base.metadata.create_all(engine)
+        create_tables(engine, Base)
     except Exception as e:
         logger.error(f'Exception {e.args} prevented connection to the database in load_crfs()')
         send_processor_email(PROC, exception=e)
@@ -359,7 +297,6 @@ async def load_crfs(logger):
         session.commit()
 
         session.close()
-        engine.dispose()
 
         return True
 
@@ -367,17 +304,17 @@ async def load_crfs(logger):
         logger.error(f'Exception {e.args} occurred in load_crfs()')
         send_processor_email(PROC, exception=e)
         session.close()
-        engine.dispose()
         return False
 
 
+@offload(timeout=10 * 60)
 async def add_compound_windows(logger):
     try:
         logger.info('Running add_compound_windows()')
         from datetime import datetime
         from summit_core import voc_LOG_path as pa_path
         from summit_core import voc_dir as rundir
-        from summit_core import connect_to_db, TempDir, check_filesize, core_dir
+        from summit_core import connect_to_db, create_tables, TempDir, check_filesize, core_dir
         from summit_voc import Base, NmhcLine, read_pa_line, name_summit_peaks, CompoundWindow
         from summit_voc import compound_windows_1, compound_windows_2
     except ImportError as e:
@@ -387,7 +324,7 @@ async def add_compound_windows(logger):
 
     try:
         engine, session = connect_to_db('sqlite:///summit_voc.sqlite', rundir)
-        Base.metadata.create_all(engine)
+        create_tables(engine, Base)
     except Exception as e:
         logger.error(f'Error {e.args} connecting to database in add_compound_windows()')
         send_processor_email(PROC, exception=e)
@@ -410,17 +347,16 @@ async def add_compound_windows(logger):
 
         session.commit()
         session.close()
-        engine.dispose()
         return True
 
     except Exception as e:
         logger.error(f'Error {e.args} occurred in add_compound_windows()')
         session.commit()
         session.close()
-        engine.dispose()
         return False
 
 
+@offload(timeout=30 * 60)
 async def create_gc_runs(logger):
     """
     If there are unmatched NmhcLines or LogFiles, check for matches between them and create GcRun objects
@@ -432,9 +368,9 @@ async def create_gc_runs(logger):
 
     try:
         from summit_core import voc_dir as rundir
-        from summit_core import connect_to_db
-        from summit_voc import Base, LogFile, NmhcLine, GcRun
-        from summit_voc import match_log_to_pa
+        from summit_core import connect_to_db, create_tables
+        from summit_voc import Base
+        from summit_voc import match_log_to_pa, single_lines_query, single_logs_query, run_dates_query
     except ImportError as e:
         logger.error('Import error in create_gc_runs()')
         send_processor_email(PROC, exception=e)
@@ -442,7 +378,7 @@ async def create_gc_runs(logger):
 
     try:
         engine, session = connect_to_db('sqlite:///summit_voc.sqlite', rundir)
-        Base.metadata.create_all(engine)
+        create_tables(engine, Base)
     except Exception as e:
         logger.error(f'Error {e.args} prevented connecting to the database in create_gc_runs()')
         send_processor_email(PROC, exception=e)
@@ -450,18 +386,12 @@ async def create_gc_runs(logger):
 
     try:
         logger.info('Running create_gc_runs()')
-        nmhc_lines = (session.query(NmhcLine)
-                      .filter(NmhcLine.status == 'single')
-                      .order_by(NmhcLine.id).all())
-
-        log_files = (session.query(LogFile)
-                     .filter(LogFile.status == 'single')
-                     .order_by(LogFile.id).all())
+        nmhc_lines = single_lines_query(session).all()
+        log_files = single_logs_query(session).all()
 
         if not log_files or not nmhc_lines:
             logger.info('No new logs or pa lines matched.')
             session.close()
-            engine.dispose()
             return False
 
         gc_runs = match_log_to_pa(log_files, nmhc_lines)
@@ -469,11 +399,10 @@ async def create_gc_runs(logger):
         if not gc_runs:
             logger.info('No new logs or pa lines matched.')
             session.close()
-            engine.dispose()
             return False
         else:
             run_dates = [run.date for run in gc_runs]
-            run_dates_in_db = session.query(GcRun.date).filter(GcRun.date.in_(run_dates)).all()
+            run_dates_in_db = run_dates_query(session, run_dates).all()
             run_dates_in_db[:] = [run.date for run in run_dates_in_db]
 
             for run in gc_runs:
@@ -485,7 +414,6 @@ async def create_gc_runs(logger):
             session.commit()
 
         session.close()
-        engine.dispose()
         return True
     except Exception as e:
         logger.error(f'Error {e.args} occurred in create_gc_runs()')
@@ -493,6 +421,7 @@ async def create_gc_runs(logger):
         return False
 
 
+@offload(timeout=30 * 60)
 async def integrate_runs(logger):
     """
     Load any unquantified GcRuns and use Crfs to calculate mixing ratios for each identified compound in each GcRun.
@@ -504,9 +433,9 @@ async def integrate_runs(logger):
 
     try:
         from summit_core import voc_dir as rundir
-        from summit_core import connect_to_db
-        from summit_voc import find_crf
-        from summit_voc import Base, GcRun, Datum, Crf
+        from summit_core import connect_to_db, create_tables
+        from summit_voc import find_crf, unintegrated_runs_query
+        from summit_voc import Base, Datum, Crf
     except ImportError as e:
         logger.error(f'ImportError occurred in integrate_runs()')
         send_processor_email(PROC, exception=e)
@@ -514,7 +443,7 @@ async def integrate_runs(logger):
 
     try:
         engine, session = connect_to_db('sqlite:///summit_voc.sqlite', rundir)
-        Base.metadata.create_all(engine)
+        create_tables(engine, Base)
     except Exception as e:
         logger.error(f'Error {e.args} prevented connecting to the database in integrate_runs()')
         send_processor_email(PROC, exception=e)
@@ -522,9 +451,7 @@ async def integrate_runs(logger):
 
     try:
         logger.info('Running integrate_runs()')
-        gc_runs = (session.query(GcRun)
-                   .filter(GcRun.data_con == None)
-                   .order_by(GcRun.id).all())  # get all un-integrated runs
+        gc_runs = unintegrated_runs_query(session).all()  # get all un-integrated runs
 
         crfs = session.query(Crf).order_by(Crf.id).all()  # get all crfs
 
@@ -551,17 +478,16 @@ async def integrate_runs(logger):
         session.commit()
 
         session.close()
-        engine.dispose()
         return True
 
     except Exception as e:
         logger.error(f'Exception {e.args} occurred in integrate_runs()')
         send_processor_email(PROC, exception=e)
         session.close()
-        engine.dispose()
         return False
 
 
+@offload(timeout=15 * 60)
 async def plot_new_data(logger):
     """
     If newer data exists, plot it going back one week from the day of the plotting.
@@ -572,9 +498,9 @@ async def plot_new_data(logger):
 
     try:
         from summit_core import voc_dir as rundir
-        from summit_core import core_dir, Plot, Config
-        from summit_core import connect_to_db, TempDir, create_daily_ticks, add_or_ignore_plot
-        from summit_voc import Base, GcRun, summit_voc_plot, get_dates_peak_info
+        from summit_core import core_dir, Plot, Config, config_query
+        from summit_core import connect_to_db, create_tables, TempDir, create_daily_ticks, add_or_ignore_plot
+        from summit_voc import Base, summit_voc_plot, get_dates_peak_info, recent_run_dates_query
         from pathlib import Path
         from datetime import datetime
         import datetime as dt
@@ -588,7 +514,7 @@ async def plot_new_data(logger):
 
     try:
         engine, session = connect_to_db('sqlite:///summit_voc.sqlite', rundir)
-        Base.metadata.create_all(engine)
+        create_tables(engine, Base)
     except Exception as e:
         logger.error(f'Error {e.args} prevented connecting to the database in plot_new_data()')
         send_processor_email(PROC, exception=e)
@@ -599,7 +525,7 @@ async def plot_new_data(logger):
         Plot.__table__.create(core_engine, checkfirst=True)
         Config.__table__.create(core_engine, checkfirst=True)
 
-        voc_config = core_session.query(Config).filter(Config.processor == PROC).one_or_none()
+        voc_config = config_query(core_session, PROC).one_or_none()
 
         if not voc_config:
             voc_config = Config(processor=PROC)  # use all default values except processor on init
@@ -619,14 +545,13 @@ async def plot_new_data(logger):
         date_limits, major_ticks, minor_ticks = create_daily_ticks(voc_config.days_to_plot)
 
         try:
-            dates = session.query(GcRun.date).filter(GcRun.date > date_ago).order_by(GcRun.date).all()
+            dates = recent_run_dates_query(session, date_ago).all()
             dates[:] = [d.date for d in dates]
             assert dates
 
         except (ValueError, AssertionError):
             logger.error('No new data was found within time window. Plots were not created.')
             session.close()
-            engine.dispose()
             return False
 
         if dates[-1] > voc_config.last_data_date:
@@ -666,19 +591,9 @@ async def plot_new_data(logger):
                 add_or_ignore_plot(c4_plot, core_session)
 
             with TempDir(plotdir):  ## PLOT i-pentane and n-pentane, & ratio
-                from summit_voc import Peak, LogFile
-                from sqlalchemy.orm import aliased
-                ipentane = aliased(Peak)
-                npentane = aliased(Peak)
-
-                data = (session.query(GcRun.date, ipentane.mr, npentane.mr)
-                        .join(ipentane, ipentane.run_id == GcRun.id)
-                        .join(npentane, npentane.run_id == GcRun.id)
-                        .filter(ipentane.name == 'i-pentane')
-                        .filter(npentane.name == 'n-pentane')
-                        .filter(GcRun.date >= date_ago)
-                        .order_by(GcRun.date)
-                        .all())
+                from summit_voc import pentane_data_query
+
+                data = pentane_data_query(session, date_ago).all()
 
                 pentane_dates = [d.date for d in data]
                 ipent_mrs = [d[1] for d in data]
@@ -744,21 +659,17 @@ async def plot_new_data(logger):
             logger.info('New data plots created.')
 
             session.close()
-            engine.dispose()
 
             core_session.commit()
             core_session.close()
-            core_engine.dispose()
             return True
 
         else:
             logger.info('No new data, plots were not created.')
 
             session.close()
-            engine.dispose()
 
             core_session.close()
-            core_engine.dispose()
             return False
 
     except Exception as e:
@@ -766,14 +677,13 @@ async def plot_new_data(logger):
         send_processor_email(PROC, exception=e)
 
         session.close()
-        engine.dispose()
 
         core_session.close()
-        core_engine.dispose()
 
         return False
 
 
+@offload(timeout=15 * 60)
 async def plot_logdata(logger):
     """
     Loads dailies for the last 3 weeks and plots with ticks for every three days and minor ticks for every day.
@@ -788,21 +698,14 @@ async def plot_logdata(logger):
         from pathlib import Path
         from datetime import datetime
         from summit_core import connect_to_db, TempDir, Config, Plot, add_or_ignore_plot, create_daily_ticks
+        from summit_core import config_query
         from summit_core import voc_dir, core_dir
-        from summit_voc import LogFile, summit_log_plot
+        from summit_voc import summit_log_plot, recent_logs_query
         from summit_voc import log_params_list as log_parameters
         plotdir = core_dir / 'plots/log'
         remotedir = r'/data/web/htdocs/instaar/groups/arl/summit/protected/plots'
 
-        try:
-            os.chdir(plotdir)
-        except FileNotFoundError:
-            os.mkdir(plotdir)
-
-        try:
-            os.chdir(plotdir)
-        except FileNotFoundError:
-            os.mkdir(plotdir)
+        plotdir.mkdir(exist_ok=True)  # don't chdir here; this runs in a worker thread and plots are made in a TempDir
 
     except ImportError as e:
         logger.error(f'ImportError occurred in plot_logdata()')
@@ -821,7 +724,7 @@ async def plot_logdata(logger):
         Plot.__table__.create(core_engine, checkfirst=True)
         Config.__table__.create(core_engine, checkfirst=True)
 
-        log_config = core_session.query(Config).filter(Config.processor == 'Log Plotting').one_or_none()
+        log_config = config_query(core_session, 'Log Plotting').one_or_none()
 
         if not log_config:
             log_config = Config(processor='Log Plotting',
@@ -844,7 +747,7 @@ async def plot_logdata(logger):
 
         major_ticks = [t for ind, t in enumerate(major_ticks) if ind % 3 == 0]  # use every third daily tick
 
-        logs = session.query(LogFile).filter(LogFile.date >= date_ago).order_by(LogFile.date).all()
+        logs = recent_logs_query(session, date_ago).all()
 
         logdict = {}
         for param in log_parameters:
@@ -950,24 +853,21 @@ async def plot_logdata(logger):
 
         core_session.commit()
         core_session.close()
-        core_engine.dispose()
 
         session.close()
-        engine.dispose()
         return True
 
     except Exception as e:
         logger.error(f'Exception {e.args} occurred in plot_logdata()')
         send_processor_email(PROC, exception=e)
         session.close()
-        engine.dispose()
 
         core_session.close()
-        core_engine.dispose()
 
         return False
 
 
+@offload(timeout=15 * 60)
 async def check_new_logs(logger):
     """
     This function checks new log files to see if each daily parameter is within a specified range. It will loop
@@ -982,9 +882,9 @@ async def check_new_logs(logger):
         import datetime as dt
         from pathlib import Path
         from datetime import datetime
-        from summit_core import connect_to_db, TempDir, Config
+        from summit_core import connect_to_db, TempDir, Config, config_query
         from summit_core import voc_dir, core_dir
-        from summit_voc import LogFile, log_parameter_bounds
+        from summit_voc import log_parameter_bounds, newest_log_query, new_logs_query
         from summit_errors import send_logparam_email
         import pandas as pd
     except ImportError as e:
@@ -1003,7 +903,7 @@ async def check_new_logs(logger):
         core_engine, core_session = connect_to_db('sqlite:///summit_core.sqlite', core_dir)
         Config.__table__.create(core_engine, checkfirst=True)
 
-        logcheck_config = core_session.query(Config).filter(Config.processor == 'Log Checking').one_or_none()
+        logcheck_config = config_query(core_session, 'Log Checking').one_or_none()
 
         if not logcheck_config:
             logcheck_config = Config(processor='Log Checking')  # use all default values except processor on init
@@ -1019,19 +919,12 @@ async def check_new_logs(logger):
         logger.info('Running check_new_logs()')
 
         # Query the VOC Database for the most recent logfile data
-        recentDate = (session                                                   # open session
-                      .query(LogFile.date)                                      # gather date
-                      .order_by(LogFile.date.desc())                            # order by desc
-                      .first()[0])                                              # grab just the first value
+        recentDate = newest_log_query(session).first()[0]  # grab just the date of the newest log
 
         # If the most recent date is greater than the last one, we query for all logs greater than it, save the date of
         # the last one, and then apply various actions to them
         if recentDate > logcheck_config.last_data_date:
-            logfiles = (session
-                        .query(LogFile)                                         # query DB for dates
-                        .order_by(LogFile.date)                                 # order by desc
-                        .filter(LogFile.date > logcheck_config.last_data_date)  # filter only new ones
-                        .all())                                                 # get all of them
+            logfiles = new_logs_query(session, logcheck_config.last_data_date).all()  # get all the new logs
 
             lastDate = logfiles[-1].date                                        # identify last log date
 
@@ -1101,10 +994,8 @@ async def check_new_logs(logger):
 
         core_session.commit()
         core_session.close()
-        core_engine.dispose()
 
         session.close()
-        engine.dispose()
 
         return True
 
@@ -1112,14 +1003,13 @@ async def check_new_logs(logger):
         logger.error(f'Exception {e.args} occurred in check_new_logs()')
         send_processor_email('Log Checking', exception=e)
         session.close()
-        engine.dispose()
 
         core_session.close()
-        core_engine.dispose()
 
         return False
 
 
+@offload(timeout=30 * 60)
 async def load_excel_corrections(sheet_name, logger):
     """
     Load the datasheet from another drive.
@@ -1135,9 +1025,10 @@ async def load_excel_corrections(sheet_name, logger):
     try:
         import pandas as pd
         from pathlib import Path
-        from summit_voc import Peak, LogFile, NmhcLine, NmhcCorrection, GcRun, Datum, Base
+        from summit_voc import Peak, LogFile, NmhcCorrection, GcRun, Base
         from summit_voc import check_sheet_cols, correction_from_df_column, find_approximate_rt, sheet_slices
-        from summit_core import connect_to_db, search_for_attr_value, data_file_paths
+        from summit_voc import uncorrected_lines_query, correction_line_query, line_data_query
+        from summit_core import connect_to_db, create_tables, AttrIndex, data_file_paths
         from summit_core import voc_dir as rundir
     except ImportError as e:
         logger.error('ImportError occurred in load_excel_corrections()')
@@ -1145,7 +1036,7 @@ async def load_excel_corrections(sheet_name, logger):
 
     try:
         engine, session = connect_to_db('sqlite:///summit_voc.sqlite', rundir)
-        Base.metadata.create_all(engine)
+        create_tables(engine, Base)
     except Exception as e:
         logger.error(f'Error {e.args} prevented connecting to the database in load_excel_corrections()')
         send_processor_email(PROC, exception=e)
@@ -1163,7 +1054,7 @@ async def load_excel_corrections(sheet_name, logger):
         engine, session = connect_to_db('sqlite:///summit_voc.sqlite', rundir)
 
         logfiles = session.query(LogFile).order_by(LogFile.samplecode)
-        nmhc_lines = session.query(NmhcLine).filter(NmhcLine.correction_id == None).order_by(NmhcLine.id)
+        nmhc_lines = uncorrected_lines_query(session)
         gc_runs = session.query(GcRun).order_by(GcRun.id)
 
         nmhc_corrections = []
@@ -1193,7 +1084,7 @@ async def load_excel_corrections(sheet_name, logger):
 
         for correction in nmhc_corrections:
             if correction:
-                line = session.query(NmhcLine).filter(NmhcLine.correction_id == correction.id).one_or_none()
+                line = correction_line_query(session, correction.id).one_or_none()
 
                 if not line:
                     logger.info(f'A matching line for NmhcCorrection {correction} was not found.')
@@ -1201,16 +1092,19 @@ async def load_excel_corrections(sheet_name, logger):
             else:
                 continue
 
+            peaks_by_name = AttrIndex(line.peaklist, 'name')
+            peaks_by_rt = AttrIndex(line.peaklist, 'rt')  # both are updated below as peaks are renamed or moved
+
             for peak_corr in correction.peaklist:
                 if not peak_corr.rt:
                     continue
 
-                peak_by_name = search_for_attr_value(line.peaklist, 'name', peak_corr.name)
-                peak_by_rt = search_for_attr_value(line.peaklist, 'rt', peak_corr.rt)
+                peak_by_name = peaks_by_name.get(peak_corr.name)
+                peak_by_rt = peaks_by_rt.get(peak_corr.rt)
                 # try to find peak by name, then retention time exact match
 
                 if not peak_by_rt:
-                    peak_by_rt = find_approximate_rt(line.peaklist, peak_corr.rt)
+                    peak_by_rt = find_approximate_rt(line.peaklist, peak_corr.rt, rt_index=peaks_by_rt)
                 # if peak not found by rt exactly, search with a fuzzy limit
 
                 if (peak_by_name and peak_by_rt) and (peak_by_name is peak_by_rt):  # if they're not None, and identical
@@ -1220,6 +1114,8 @@ async def load_excel_corrections(sheet_name, logger):
                     if peak_by_name and peak_by_rt:  # if both exist, but not identical, prefer the RT-found one
                         peak_by_name.name = '-'
                         peak_by_rt.name = peak_corr.name
+                        peaks_by_name.update(peak_by_name)
+                        peaks_by_name.update(peak_by_rt)
                         peak = peak_by_rt
                         session.merge(peak)
                         session.merge(peak_by_name)
@@ -1231,16 +1127,20 @@ async def load_excel_corrections(sheet_name, logger):
                     elif peak_by_rt:  # if only found by rt, use the rt one
                         peak = peak_by_rt
                         peak.name = peak_corr.name
+                        peaks_by_name.update(peak)
                         session.merge(peak)
 
                     else:
                         line.peaklist.append(peak_corr)  # if not found at all, add the corrected peak as a new peak
+                        peaks_by_name.add(peak_corr)
+                        peaks_by_rt.add(peak_corr)
                         logger.warning(f'Peak with name {peak_corr} added to NmhcLine for {line.date}.')
 
                         continue
 
                 peak.pa = peak_corr.pa
                 peak.rt = peak_corr.rt
+                peaks_by_rt.update(peak)
                 peak.rev = peak.rev + 1  # Sqlite *does not* like using += notation
 
             correction.status = 'applied'
@@ -1248,7 +1148,7 @@ async def load_excel_corrections(sheet_name, logger):
             line.nmhc_corr_con = correction
             correction.correction_id = line
 
-            data = session.query(Datum).filter(Datum.line_id == line.id).one_or_none()
+            data = line_data_query(session, line.id).one_or_none()
 
             if data:
                 data.reintegrate()
@@ -1261,7 +1161,6 @@ async def load_excel_corrections(sheet_name, logger):
 
         session.commit()
         session.close()
-        engine.dispose()
 
         return True
 
@@ -1269,7 +1168,6 @@ async def load_excel_corrections(sheet_name, logger):
         logger.error(f'Exception {e.args} occurred in load_excel_corrections()')
         send_processor_email(PROC, exception=e)
         session.close()
-        engine.dispose()
         return False
 
 